@@ -10,6 +10,7 @@ https://docs.djangoproject.com/en/1.9/ref/settings/
 """
 
 import os
+import tempfile
 
 import dj_database_url
 
@@ -35,6 +36,7 @@ INSTALLED_APPS = [
 ]
 
 MIDDLEWARE_CLASSES = [
+    'usermgmt.instrumentation.SqlInstrumentationMiddleware',
     'django.middleware.security.SecurityMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
     'django.middleware.common.CommonMiddleware',
@@ -74,6 +76,86 @@ DATABASES = {
     'cbioportal': dj_database_url.parse(os.environ['DATABASE_URL_CBIOPORTAL']),
 }
 
+# Take the cBioPortal connections from a per-process pool, see
+# usermgmt/pool.py for the options
+if DATABASES['cbioportal']['ENGINE'] in ('django.db.backends.mysql',
+                                         'django.db.backends.sqlite3'):
+    DATABASES['cbioportal']['ENGINE'] = DATABASES['cbioportal'][
+        'ENGINE'].replace('django.db.backends.', 'usermgmt.backends.')
+DATABASES['cbioportal']['POOL'] = {
+    'SIZE': int(os.environ.get('CBIOPORTAL_DB_POOL_SIZE', 5)),
+    'MAX_OVERFLOW': int(os.environ.get('CBIOPORTAL_DB_POOL_MAX_OVERFLOW', 5)),
+    'TIMEOUT': int(os.environ.get('CBIOPORTAL_DB_POOL_TIMEOUT', 30)),
+    'RECYCLE': int(os.environ.get('CBIOPORTAL_DB_POOL_RECYCLE', 3600)),
+    'PRE_PING': os.environ.get('CBIOPORTAL_DB_POOL_PRE_PING', '1') == '1',
+}
+
+# cBioPortal ----------------------------------------------------------------
+
+# Number of seconds that the catalog of studies and groups is cached for
+CBIOPORTAL_CATALOG_TTL = int(os.environ.get('CBIOPORTAL_CATALOG_TTL', 300))
+
+# Number of seconds after which the effective-access index is rebuilt, to
+# pick up changes made by other processes
+CBIOPORTAL_ACCESS_INDEX_TTL = int(
+    os.environ.get('CBIOPORTAL_ACCESS_INDEX_TTL', 60))
+
+# Number of seconds that the dashboard statistics are cached for
+CBIOPORTAL_STATISTICS_TTL = int(
+    os.environ.get('CBIOPORTAL_STATISTICS_TTL', 30))
+
+# Number of rows written per multi-row INSERT when importing
+CBIOPORTAL_IMPORT_CHUNK_SIZE = int(
+    os.environ.get('CBIOPORTAL_IMPORT_CHUNK_SIZE', 1000))
+
+# Number of seconds that rendered page fragments are cached for; the cache
+# keys contain the data versions, so changes show up immediately
+CBIOPORTAL_FRAGMENT_CACHE_TTL = int(
+    os.environ.get('CBIOPORTAL_FRAGMENT_CACHE_TTL', 600))
+
+# Number of threads per process for running independent reads of a page
+# concurrently, each with its own connection; 0 runs them one after another
+CBIOPORTAL_FAN_OUT_WORKERS = int(
+    os.environ.get('CBIOPORTAL_FAN_OUT_WORKERS', 4))
+
+# Log a warning for requests that run more queries on the cbioportal
+# database than this, 0 to disable
+CBIOPORTAL_SQL_QUERY_COUNT_WARNING = int(
+    os.environ.get('CBIOPORTAL_SQL_QUERY_COUNT_WARNING', 20))
+
+# Number of slowest statements per request included in the warning
+CBIOPORTAL_SQL_SLOWEST_STATEMENTS = int(
+    os.environ.get('CBIOPORTAL_SQL_SLOWEST_STATEMENTS', 3))
+
+# Serve the metrics endpoint without login, e.g. for a Prometheus scraper
+# that can only be reached from the internal network
+CBIOPORTAL_METRICS_PUBLIC = (
+    os.environ.get('CBIOPORTAL_METRICS_PUBLIC', '0') == '1')
+
+# Comma-separated tokens that scripts send as "Authorization: Token ..."
+# to the JSON API instead of logging in, see usermgmt/api.py
+CBIOPORTAL_API_TOKENS = [
+    token.strip()
+    for token in os.environ.get('CBIOPORTAL_API_TOKENS', '').split(',')
+    if token.strip()]
+
+# Number of threads per process that run imports in the background
+CBIOPORTAL_IMPORT_WORKERS = int(
+    os.environ.get('CBIOPORTAL_IMPORT_WORKERS', 1))
+
+# Directory for uploaded import documents until their job has run
+CBIOPORTAL_IMPORT_DIR = os.environ.get(
+    'CBIOPORTAL_IMPORT_DIR',
+    os.path.join(tempfile.gettempdir(), 'cbioportal_users_imports'))
+
+# Number of seconds between progress updates of a running import
+CBIOPORTAL_IMPORT_PROGRESS_INTERVAL = float(
+    os.environ.get('CBIOPORTAL_IMPORT_PROGRESS_INTERVAL', 1))
+
+# Number of invalid records reported per import job
+CBIOPORTAL_IMPORT_MAX_ERRORS = int(
+    os.environ.get('CBIOPORTAL_IMPORT_MAX_ERRORS', 100))
+
 # Password validation -------------------------------------------------------
 
 AUTH_PASSWORD_VALIDATORS = [
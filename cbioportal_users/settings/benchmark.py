@@ -0,0 +1,26 @@
+"""Settings for running the DAO benchmarks against SQLite stand-ins
+
+The portal tables are created in ``CBIOPORTAL_BENCHMARK_DB`` (default
+``benchmark_cbioportal.sqlite3`` in the project directory), e.g.:
+
+    DJANGO_SETTINGS_MODULE=cbioportal_users.settings.benchmark \
+        python3 manage.py benchmark_dao --output results.json
+"""
+
+import os
+
+os.environ.setdefault('DATABASE_URL_CBIOPORTAL', 'sqlite:///' + os.environ.get(
+    'CBIOPORTAL_BENCHMARK_DB', os.path.join(
+        os.path.dirname(os.path.dirname(os.path.dirname(
+            os.path.abspath(__file__)))), 'benchmark_cbioportal.sqlite3')))
+
+from .base import *
+
+SECRET_KEY = 'Only used for benchmarks'
+
+DEBUG = False
+
+DATABASES['default'] = {
+    'ENGINE': 'django.db.backends.sqlite3',
+    'NAME': ':memory:',
+}
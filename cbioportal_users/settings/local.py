@@ -19,7 +19,7 @@ DATABASES = {
         'ENGINE': 'django.db.backends.sqlite3',
         'NAME': os.path.join(BASE_DIR, 'db.sqlite3'),
     },
-    'cbioportal': dj_database_url.parse(os.environ['DATABASE_URL_CBIOPORTAL']),
+    'cbioportal': DATABASES['cbioportal'],
 }
 
 # Static files (CSS, JavaScript, Images) ------------------------------------
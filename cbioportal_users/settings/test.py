@@ -0,0 +1,47 @@
+"""Settings for running the tests against SQLite stand-ins
+
+The default database is in memory, the portal database a temporary file;
+the tests create the portal tables themselves, e.g.:
+
+    DJANGO_SETTINGS_MODULE=cbioportal_users.settings.test \
+        python3 manage.py test usermgmt
+"""
+
+import os
+import tempfile
+
+os.environ.setdefault('DATABASE_URL_CBIOPORTAL', 'sqlite://:memory:')
+
+from .base import *
+
+SECRET_KEY = 'Only used for tests'
+
+DEBUG = False
+
+DATABASES['default'] = {
+    'ENGINE': 'django.db.backends.sqlite3',
+    'NAME': ':memory:',
+}
+
+# The portal test database is a file, so the fan-out worker threads see
+# the tables; the tests that run them enable the workers
+DATABASES['cbioportal']['TEST'] = {
+    'NAME': os.path.join(tempfile.gettempdir(),
+                         'cbioportal_users_test_{}.sqlite3'.format(
+                             os.getpid())),
+}
+
+# Run the fan-out reads one after another by default
+CBIOPORTAL_FAN_OUT_WORKERS = 0
+
+STATIC_URL = '/static/'
+
+# Do not keep rendered fragments between tests
+CACHES = {
+    'default': {
+        'BACKEND': 'django.core.cache.backends.dummy.DummyCache',
+    },
+}
+
+# Speed up creating users for logging in
+PASSWORD_HASHERS = ['django.contrib.auth.hashers.MD5PasswordHasher']
@@ -0,0 +1,242 @@
+"""In-memory index of the effective access of users to studies
+
+An enabled user has access to a study if the user has an authority for the
+study itself, for one of the study's groups, or for ``ALL``; disabled users
+have no access.  The index keeps the authorities per enabled user and the
+enabled users per authority, and resolves the authorities of each user to
+the set of studies against the study catalog, so access checks are set
+lookups that neither query the portal database nor scan the catalog.
+
+After each write through DaoUser or DaoAuthority, the authorities of the
+affected users are reloaded from the database, so duplicate rows and rows
+that only differ in case are accounted for.  Each time the study catalog is
+loaded, the studies of all users are resolved again.  These updates only
+reach the process that made the write: the index of other processes (e.g.
+other gunicorn workers) can be stale for up to
+``settings.CBIOPORTAL_ACCESS_INDEX_TTL`` seconds, after which it is rebuilt.
+The rebuild runs outside the lock; meanwhile, other requests are answered
+from the stale index.
+"""
+
+from django.conf import settings
+from django.dispatch import receiver
+
+from . import portal_models
+from . import signals
+
+import threading
+import time
+
+authority_key = portal_models.authority_key
+
+
+class EffectiveAccessIndex:
+    """Authorities and studies per user and users per authority, resolved
+    against the DbStudyCatalog ``catalog``"""
+
+    def __init__(self, catalog, pairs=()):
+        #: ``dict`` mapping email to ``set`` of authority keys
+        self.by_user = {}
+        #: ``dict`` mapping authority key to ``set`` of emails
+        self.by_authority = {}
+        for email, authority in pairs:
+            self._add(email, authority)
+        self.resolve(catalog)
+
+    def _add(self, email, authority):
+        key = authority_key(authority)
+        self.by_user.setdefault(email, set()).add(key)
+        self.by_authority.setdefault(key, set()).add(email)
+
+    def resolve(self, catalog):
+        """Resolve the studies of all users against the DbStudyCatalog"""
+        all_studies = frozenset(catalog.studies_by_key)
+        studies_by_user = {
+            email: self._studies(catalog, all_studies, keys)
+            for email, keys in self.by_user.items()}
+        #: The DbStudyCatalog that the studies were resolved against
+        self.catalog = catalog
+        self._all_studies = all_studies
+        #: ``dict`` mapping email to ``frozenset`` of the authority keys of
+        #: the studies the user has access to
+        self.studies_by_user = studies_by_user
+
+    @staticmethod
+    def _studies(catalog, all_studies, keys):
+        if 'ALL' in keys:
+            return all_studies
+        result = set()
+        for key in keys:
+            if key in catalog.studies_by_key:
+                result.add(key)
+            if key in catalog.groups_by_key:
+                result.update(authority_key(study.identifier)
+                              for study in catalog.groups_by_key[key].studies)
+        return frozenset(result)
+
+    def replace_users(self, emails, pairs):
+        """Replace the authorities of the users ``emails`` by the ``(email,
+        authority)`` rows ``pairs``"""
+        for email in emails:
+            for key in self.by_user.pop(email, ()):
+                users = self.by_authority[key]
+                users.discard(email)
+                if not users:
+                    del self.by_authority[key]
+        for email, authority in pairs:
+            self._add(email, authority)
+        for email in emails:
+            if email in self.by_user:
+                self.studies_by_user[email] = self._studies(
+                    self.catalog, self._all_studies, self.by_user[email])
+            else:
+                self.studies_by_user.pop(email, None)
+
+    @staticmethod
+    def study_keys(study):
+        """Return ``set`` of authority keys that give access to ``study``"""
+        return ({'ALL', authority_key(study.identifier)} |
+                {authority_key(group) for group in study.groups if group})
+
+    def can_access(self, email, identifier):
+        """Return whether the user has access to the study, ``None`` if
+        there is no such study"""
+        key = authority_key(identifier)
+        if key not in self.catalog.studies_by_key:
+            return None
+        return key in self.studies_by_user.get(email, ())
+
+    def users_for(self, study):
+        """Return ``set`` of emails of the users with access to DbStudy"""
+        result = set()
+        for key in self.study_keys(study):
+            result |= self.by_authority.get(key, set())
+        return result
+
+    def studies_for(self, email):
+        """Return ``list`` of the DbStudy objects that the user has access
+        to, sorted by identifier"""
+        return sorted((self.catalog.studies_by_key[key]
+                       for key in self.studies_by_user.get(email, ())),
+                      key=lambda study: study.identifier)
+
+
+class DaoEffectiveAccess:
+    """Process-wide EffectiveAccessIndex, built from
+    DaoAuthority.of_enabled_users() and the study catalog on first use"""
+
+    #: Guards the attributes below, only held briefly
+    _lock = threading.Lock()
+    #: Held while building the index
+    _build_lock = threading.Lock()
+    #: Held while updating the index, so updates are applied in order
+    _update_lock = threading.Lock()
+    _index = None
+    _expires = 0
+    #: Incremented by update() and invalidate(), so a rebuild that ran
+    #: concurrently is not swapped in over their changes
+    _generation = 0
+
+    @classmethod
+    def get(klass):
+        with klass._lock:
+            index = klass._index
+            if index is not None and time.monotonic() < klass._expires:
+                return index
+        # Wait for the index if there is none, otherwise go on with the
+        # stale one while another thread rebuilds it
+        if not klass._build_lock.acquire(blocking=index is None):
+            return index
+        try:
+            while True:
+                # Load the catalog first, so a later load counts as a
+                # concurrent change
+                catalog = portal_models.DaoStudyCatalog.get()
+                with klass._lock:
+                    if (klass._index is not None and
+                            time.monotonic() < klass._expires):
+                        return klass._index
+                    generation = klass._generation
+                index = EffectiveAccessIndex(
+                    catalog, portal_models.DaoAuthority.of_enabled_users())
+                with klass._lock:
+                    if klass._generation == generation:
+                        klass._index = index
+                        klass._expires = (time.monotonic() +
+                                          settings.CBIOPORTAL_ACCESS_INDEX_TTL)
+                        return index
+                    elif klass._index is not None:
+                        # Updated meanwhile, retry on the next lookup
+                        return klass._index
+        finally:
+            klass._build_lock.release()
+
+    @classmethod
+    def invalidate(klass):
+        with klass._lock:
+            klass._index = None
+            klass._generation += 1
+
+    @classmethod
+    def can_access(klass, email, identifier):
+        """Return whether the user has access to the study, ``None`` if
+        there is no such study"""
+        return klass.get().can_access(email, identifier)
+
+    @classmethod
+    def studies_for(klass, email):
+        """Return ``list`` of the DbStudy objects that the user has access
+        to"""
+        return klass.get().studies_for(email)
+
+    @classmethod
+    def update(klass, emails):
+        """Reload the authorities of the users ``emails`` into the index,
+        if it is loaded"""
+        emails = set(emails)
+        if not emails:
+            return
+        with klass._update_lock:
+            with klass._lock:
+                klass._generation += 1
+                if klass._index is None:
+                    return
+            pairs = portal_models.DaoAuthority.of_enabled_users(emails)
+            with klass._lock:
+                if klass._index is not None:
+                    klass._index.replace_users(emails, pairs)
+
+    @classmethod
+    def resolve(klass, catalog):
+        """Resolve the studies of the users in the index, if it is loaded,
+        against the DbStudyCatalog"""
+        with klass._update_lock:
+            with klass._lock:
+                klass._generation += 1
+                index = klass._index
+            if index is not None:
+                index.resolve(catalog)
+
+
+@receiver(signals.users_changed)
+def update_effective_access_of_users(sender, created, updated, deleted,
+                                     reset, **kwargs):
+    if reset:
+        DaoEffectiveAccess.invalidate()
+    else:
+        DaoEffectiveAccess.update(
+            [user.email for user in created + updated] + deleted)
+
+
+@receiver(signals.authorities_changed)
+def update_effective_access(sender, granted, revoked, reset, **kwargs):
+    if reset:
+        DaoEffectiveAccess.invalidate()
+    else:
+        DaoEffectiveAccess.update(
+            [email for email, _ in granted + revoked])
+
+
+@receiver(signals.catalog_loaded)
+def resolve_effective_access(sender, catalog, **kwargs):
+    DaoEffectiveAccess.resolve(catalog)
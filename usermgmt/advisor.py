@@ -0,0 +1,201 @@
+"""Index advisor for the portal tables used by the DAOs
+
+capture_dao_queries() runs the DAO methods against the ``cbioportal``
+database inside a transaction that is rolled back, recording their
+statements with a QueryLog.  explain() runs EXPLAIN on a statement and
+reports full table scans.  missing_indexes() compares the indexes of the
+portal tables with RECOMMENDED_INDEXES, create_index() creates one of them.
+Use the ``advise_indexes`` management command to run them.
+"""
+
+from django.db import DatabaseError, connections, transaction
+
+from . import instrumentation
+from . import portal_models
+
+#: ``(table, columns)`` of the indexes that the DAO lookups rely on
+RECOMMENDED_INDEXES = (
+    ('authorities', ('email',)),
+    ('authorities', ('authority',)),
+    ('users', ('name',)),
+)
+
+#: Statements that EXPLAIN is run for
+EXPLAINABLE = ('SELECT', 'UPDATE', 'DELETE')
+
+
+class ExplainRow:
+    """Access to one table in the plan of a statement"""
+
+    __slots__ = ('table', 'access', 'full_scan')
+
+    def __init__(self, table, access, full_scan):
+        #: Name of the table
+        self.table = table
+        #: Access type (MySQL) or plan detail (SQLite)
+        self.access = access
+        #: Whether all rows of the table are read
+        self.full_scan = full_scan
+
+
+def dao_calls():
+    """Return ``list`` of ``(name, callable)`` covering the DAO queries,
+    using sample rows from the database where possible"""
+    DaoUser = portal_models.DaoUser
+    DaoAuthority = portal_models.DaoAuthority
+    catalog = portal_models.DaoStudyCatalog.get()
+    users = DaoUser.page_users(1).users
+    email = users[0].email if users else 'nobody@example.com'
+    study = (catalog.studies[0].identifier if catalog.studies else
+             'STUDY')
+    group = min(catalog.groups) if catalog.groups else 'GROUP'
+    pair = (email, portal_models.authority_value(study))
+    missing = 'no.such.user@example.invalid'
+    new_user = portal_models.DbUser(missing, 'Nobody', False)
+    return [
+        ('DaoStudyCatalog.refresh', portal_models.DaoStudyCatalog.refresh),
+        ('DaoStatistics.get', lambda: (
+            portal_models.DaoStatistics.invalidate(),
+            portal_models.DaoStatistics.get())),
+        ('DaoUser.all_users', DaoUser.all_users),
+        ('DaoUser.page_users', lambda: DaoUser.page_users(50)),
+        ('DaoUser.page_users[after]',
+         lambda: DaoUser.page_users(50, after=email)),
+        ('DaoUser.page_users[query]',
+         lambda: DaoUser.page_users(50, query=email[:3])),
+        ('DaoUser.with_direct_access_to_many',
+         lambda: DaoUser.with_direct_access_to_many([study, 'ALL', group])),
+        ('DaoUser.user_exists', lambda: DaoUser.user_exists(email)),
+        ('DaoUser.get_users', lambda: DaoUser.get_users([email])),
+        ('DaoUser.existing_emails', lambda: DaoUser.existing_emails([email])),
+        ('DaoUser.num_users', DaoUser.num_users),
+        ('DaoUser.get_user', lambda: DaoUser.get_user(email)),
+        ('DaoUser.create_user',
+         lambda: DaoUser.create_user(missing, 'Nobody', False)),
+        ('DaoUser.create_users', lambda: DaoUser.create_users([new_user])),
+        ('DaoUser.update_user',
+         lambda: DaoUser.update_user(email, 'Nobody', False)),
+        ('DaoUser.update_users',
+         lambda: DaoUser.update_users(DaoUser.get_users([email]))),
+        ('DaoUser.upsert_users',
+         lambda: DaoUser.upsert_users([new_user],
+                                      DaoUser.get_users([email]))),
+        ('DaoUser.delete_user', lambda: DaoUser.delete_user(missing)),
+        ('DaoAuthority.all_authorities', DaoAuthority.all_authorities),
+        ('DaoAuthority.of_enabled_users', DaoAuthority.of_enabled_users),
+        ('DaoAuthority.of_enabled_users[emails]',
+         lambda: DaoAuthority.of_enabled_users([email])),
+        ('DaoAuthority.for_user', lambda: DaoAuthority.for_user(email)),
+        ('DaoAuthority.existing', lambda: DaoAuthority.existing([pair])),
+        ('DaoAuthority.grant',
+         lambda: DaoAuthority.grant([(missing, pair[1])])),
+        ('DaoAuthority.revoke',
+         lambda: DaoAuthority.revoke([(missing, pair[1])])),
+        ('DaoAuthority.preview_bulk',
+         lambda: DaoAuthority.preview_bulk([email], [study, group])),
+        ('DaoAuthority.grant_bulk',
+         lambda: DaoAuthority.grant_bulk([email], [study, group])),
+        ('DaoAuthority.revoke_bulk',
+         lambda: DaoAuthority.revoke_bulk([email], [study, group])),
+        ('DaoAuthority.update_authorities_for_user',
+         lambda: DaoAuthority.update_authorities_for_user(
+             email, [a.authority for a in DaoAuthority.for_user(email)])),
+        ('DaoAuthority.update_authorities_for_study',
+         lambda: DaoAuthority.update_authorities_for_study(
+             study, [u.email for u in DaoUser.with_direct_access_to(study)])),
+    ]
+
+
+def capture_dao_queries():
+    """Run dao_calls() in a rolled back transaction, return ``list`` of
+    ``(name, [(sql, params), ...])`` with the explainable statements
+
+    Each call runs in a savepoint that is rolled back, so it sees the data
+    unchanged by the calls before it.
+    """
+    result = []
+    with transaction.atomic(using='cbioportal'):
+        for name, func in dao_calls():
+            log = instrumentation.QueryLog()
+            instrumentation.start_recording(log)
+            try:
+                with transaction.atomic(using='cbioportal'):
+                    func()
+                    transaction.set_rollback(True, using='cbioportal')
+            except portal_models.NotFound:
+                pass
+            finally:
+                instrumentation.stop_recording()
+            result.append((name, [
+                (sql, params) for sql, params in log.statements
+                if sql.lstrip().upper().startswith(EXPLAINABLE)]))
+        transaction.set_rollback(True, using='cbioportal')
+    return result
+
+
+def explain(sql, params):
+    """Return ``list`` of ExplainRow for the statement
+
+    Raises DatabaseError if the database cannot explain it.
+    """
+    connection = connections['cbioportal']
+    cursor = connection.cursor()
+    result = []
+    if connection.vendor == 'mysql':
+        cursor.execute('EXPLAIN ' + sql, params)
+        names = [column[0].lower() for column in cursor.description]
+        for row in cursor.fetchall():
+            row = dict(zip(names, row))
+            result.append(ExplainRow(
+                row['table'], '{} (key: {})'.format(row['type'], row['key']),
+                row['type'] == 'ALL'))
+    elif connection.vendor == 'sqlite':
+        cursor.execute('EXPLAIN QUERY PLAN ' + sql, params)
+        for row in cursor.fetchall():
+            detail = row[-1]
+            words = detail.split()
+            if (words[0] not in ('SCAN', 'SEARCH') or
+                    words[1] in ('CONSTANT', 'SUBQUERY')):
+                continue
+            table = words[2] if words[1] == 'TABLE' else words[1]
+            result.append(ExplainRow(
+                table, detail, words[0] == 'SCAN' and ' USING ' not in detail))
+    else:
+        raise DatabaseError('Cannot explain on {}'.format(connection.vendor))
+    return result
+
+
+def existing_indexes(table):
+    """Return ``dict`` mapping index name to ``list`` of lower-case column
+    names for ``table``"""
+    connection = connections['cbioportal']
+    cursor = connection.cursor()
+    constraints = connection.introspection.get_constraints(cursor, table)
+    return {name: [column.lower() for column in constraint['columns']]
+            for name, constraint in constraints.items()
+            if constraint['index'] or constraint['primary_key'] or
+            constraint['unique']}
+
+
+def missing_indexes():
+    """Return those of RECOMMENDED_INDEXES that no existing index starts
+    with"""
+    result = []
+    for table, columns in RECOMMENDED_INDEXES:
+        indexes = existing_indexes(table).values()
+        if not any(index[:len(columns)] == list(columns)
+                   for index in indexes):
+            result.append((table, columns))
+    return result
+
+
+def create_index_sql(table, columns):
+    quote = connections['cbioportal'].ops.quote_name
+    return 'CREATE INDEX {} ON {} ({})'.format(
+        quote('{}_{}_idx'.format(table, '_'.join(columns))), quote(table),
+        ', '.join(quote(column) for column in columns))
+
+
+def create_index(table, columns):
+    connections['cbioportal'].cursor().execute(
+        create_index_sql(table, columns))
@@ -0,0 +1,341 @@
+"""JSON API for batch changes to users and authorities
+
+Each endpoint accepts a JSON list of items, each with an ``action``.  All
+items of a batch are validated first, with one query per kind of lookup.  If
+any item is invalid, nothing is written; otherwise, the whole batch is
+written in one transaction with bulk statements.  The response reports the
+result for each item, in the order of the request.
+
+Scripts authenticate with one of ``settings.CBIOPORTAL_API_TOKENS`` in the
+``Authorization`` header, e.g.::
+
+    curl -H 'Authorization: Token SECRET' \
+        -d '[{"action": "grant", "email": "a@x.org", "authority": "ALL"}]' \
+        https://.../api/authorities
+
+Requests without the header need a session login and, for ``POST``, the
+CSRF token, like the forms of the web interface.
+"""
+
+from django.conf import settings
+from django.contrib.auth.mixins import LoginRequiredMixin
+from django.core.exceptions import ValidationError
+from django.core.validators import validate_email
+from django.db import transaction
+from django.http import HttpResponse, JsonResponse
+from django.middleware.csrf import CsrfViewMiddleware
+from django.shortcuts import get_object_or_404
+from django.utils.decorators import method_decorator
+from django.views.decorators.csrf import csrf_exempt
+from django.views.generic import View
+
+from . import access
+from . import forms
+from . import instrumentation
+from . import models
+from . import pool
+from . import portal_models
+
+import hmac
+import json
+
+
+def is_valid_token(token):
+    """Return whether ``token`` is one of the API tokens"""
+    return any(hmac.compare_digest(token.encode('utf-8'),
+                                   valid.encode('utf-8'))
+               for valid in settings.CBIOPORTAL_API_TOKENS)
+
+
+class ApiAuthMixin(LoginRequiredMixin):
+    """Accept an API token in the ``Authorization`` header instead of a
+    session login
+
+    Token requests are exempt from CSRF checks, as browsers do not send the
+    header by themselves; session requests are checked as usual.
+    """
+
+    raise_exception = True
+
+    @method_decorator(csrf_exempt)
+    def dispatch(self, request, *args, **kwargs):
+        scheme, _, token = request.META.get(
+            'HTTP_AUTHORIZATION', '').partition(' ')
+        if scheme == 'Token':
+            if not is_valid_token(token.strip()):
+                return JsonResponse({'error': 'Invalid token'}, status=401)
+            return View.dispatch(self, request, *args, **kwargs)
+        if not request.user.is_authenticated():
+            return self.handle_no_permission()
+        response = CsrfViewMiddleware().process_view(request, None, (), {})
+        if response is not None:
+            return response
+        return super().dispatch(request, *args, **kwargs)
+
+
+class BatchView(ApiAuthMixin, View):
+    """Base class for the batch endpoints
+
+    Sub classes define ``actions`` and implement two methods:
+
+    ``check_items(items, results)``
+        Validate the items whose result has no ``error`` yet, with as few
+        queries as possible, and set ``error`` or ``status`` on their
+        results.  Runs outside of a transaction and must not write.
+
+    ``apply_items(items, results)``
+        Write all items, which are valid, with bulk statements.  Runs in a
+        transaction on the ``cbioportal`` database and may set ``status``.
+    """
+
+    #: Allowed values of the items' ``action``
+    actions = ()
+
+    def post(self, request, *args, **kwargs):
+        try:
+            items = json.loads(request.body.decode('utf-8'))
+        except ValueError as e:
+            return JsonResponse({'error': 'Invalid JSON: {}'.format(e)},
+                                status=400)
+        if not isinstance(items, list) or not all(
+                isinstance(item, dict) for item in items):
+            return JsonResponse({'error': 'Expected a list of objects'},
+                                status=400)
+        results = [{'action': item.get('action')} for item in items]
+        for item, result in zip(items, results):
+            if item.get('action') not in self.actions:
+                result['error'] = 'action must be one of {}'.format(
+                    ', '.join(self.actions))
+            elif not isinstance(item.get('email'), str) or not item['email']:
+                result['error'] = 'email is required'
+            else:
+                result['email'] = item['email']
+        self.check_items(items, results)
+        if any('error' in result for result in results):
+            for result in results:
+                if 'error' in result:
+                    result['status'] = 'error'
+                else:
+                    result['status'] = 'not applied'
+            return JsonResponse({'ok': False, 'results': results}, status=400)
+        with transaction.atomic(using='cbioportal'):
+            self.apply_items(items, results)
+        return JsonResponse({'ok': True, 'results': results})
+
+class UserBatch(BatchView):
+    """Create, update and delete users
+
+    Items look like ``{"action": "create", "email": ..., "name": ...,
+    "enabled": true}``; ``name`` and ``enabled`` are ignored for
+    ``delete``.
+    """
+
+    actions = ('create', 'update', 'delete')
+
+    def check_items(self, items, results):
+        valid = [(item, result) for item, result in zip(items, results)
+                 if 'error' not in result]
+        existing = portal_models.DaoUser.existing_emails(
+            [item['email'] for item, _ in valid])
+        seen = set()
+        for item, result in valid:
+            if item['email'] in seen:
+                result['error'] = 'email occurs more than once in batch'
+            elif item['action'] == 'create' and item['email'] in existing:
+                result['error'] = 'user already exists'
+            elif item['action'] != 'create' and item['email'] not in existing:
+                result['error'] = 'no such user'
+            elif item['action'] != 'delete' and not isinstance(
+                    item.get('name'), str):
+                result['error'] = 'name is required'
+            elif item['action'] != 'delete' and not isinstance(
+                    item.get('enabled'), bool):
+                result['error'] = 'enabled must be true or false'
+            elif item['action'] == 'create':
+                try:
+                    validate_email(item['email'])
+                except ValidationError:
+                    result['error'] = 'invalid email address'
+            seen.add(item['email'])
+
+    def apply_items(self, items, results):
+        by_action = {action: [] for action in self.actions}
+        for item in items:
+            by_action[item['action']].append(item)
+        portal_models.DaoUser.create_users([
+            portal_models.DbUser(item['email'], item['name'], item['enabled'])
+            for item in by_action['create']])
+        portal_models.DaoUser.update_users([
+            portal_models.DbUser(item['email'], item['name'], item['enabled'])
+            for item in by_action['update']])
+        portal_models.DaoUser.delete_users(
+            [item['email'] for item in by_action['delete']])
+        for result in results:
+            result['status'] = result['action'] + 'd'
+
+
+class AuthorityBatch(BatchView):
+    """Grant and revoke authorities
+
+    Items look like ``{"action": "grant", "email": ..., "authority":
+    "STUDY_ID"}``, where the authority is a study identifier, a group name
+    or ``ALL``, without the ``cbioportal:`` prefix.
+    """
+
+    actions = ('grant', 'revoke')
+
+    def check_items(self, items, results):
+        valid = []
+        for item, result in zip(items, results):
+            if 'error' in result:
+                continue
+            elif (not isinstance(item.get('authority'), str) or
+                    not item['authority']):
+                result['error'] = 'authority is required'
+            else:
+                result['authority'] = item['authority']
+                valid.append((item, result))
+        pairs = [self._pair(item) for item, _ in valid]
+        existing = portal_models.DaoAuthority.existing(pairs)
+        users = portal_models.DaoUser.existing_emails(
+            {item['email'] for item, _ in valid if item['action'] == 'grant'})
+        seen = set()
+        for (item, result), key in zip(
+                valid, map(portal_models.pair_key, pairs)):
+            if key in seen:
+                result['error'] = 'authority occurs more than once in batch'
+            elif item['action'] == 'revoke':
+                result['status'] = (
+                    'revoked' if key in existing else 'unchanged')
+            elif item['email'] not in users:
+                result['error'] = 'no such user'
+            elif not (portal_models.authority_key(item['authority']) == 'ALL' or
+                      portal_models.DaoStudy.exists(item['authority']) or
+                      portal_models.DaoStudyGroup.exists(item['authority'])):
+                result['error'] = 'no such study or group'
+            else:
+                result['status'] = (
+                    'unchanged' if key in existing else 'granted')
+            seen.add(key)
+
+    def apply_items(self, items, results):
+        pairs = {'granted': [], 'revoked': []}
+        for item, result in zip(items, results):
+            if result['status'] in pairs:
+                pairs[result['status']].append(self._pair(item))
+        existing = portal_models.DaoAuthority.existing(pairs['revoked'])
+        portal_models.DaoAuthority.grant(pairs['granted'])
+        portal_models.DaoAuthority.revoke(sorted(
+            row for rows in existing.values() for row in rows))
+
+    @staticmethod
+    def _pair(item):
+        return (item['email'],
+                portal_models.authority_value(item['authority']))
+
+
+class AccessCheck(ApiAuthMixin, View):
+    """Answer whether a user can see a study, from the in-memory
+    effective-access index
+
+    Expects the ``email`` and ``study`` query parameters.
+    """
+
+    def get(self, request, *args, **kwargs):
+        email = request.GET.get('email')
+        identifier = request.GET.get('study')
+        if not email or not identifier:
+            return JsonResponse(
+                {'error': 'email and study are required'}, status=400)
+        result = access.DaoEffectiveAccess.can_access(email, identifier)
+        if result is None:
+            return JsonResponse({'error': 'no such study'}, status=404)
+        return JsonResponse(
+            {'email': email, 'study': identifier, 'access': result})
+
+
+class UserSearch(LoginRequiredMixin, View):
+    """Search users by prefix of email or name, for autocompletion
+
+    Expects the ``q`` and, for further pages, the ``after`` query
+    parameters.
+    """
+
+    raise_exception = True
+    paginate_by = 20
+
+    def get(self, request, *args, **kwargs):
+        page = portal_models.DaoUser.page_users(
+            self.paginate_by, after=request.GET.get('after'),
+            query=request.GET.get('q', '').strip())
+        return JsonResponse({
+            'results': [
+                {'id': user.email,
+                 'text': '{} - {}'.format(user.email, user.name)}
+                for user in page],
+            'next': {'after': page.last_email} if page.has_next else None,
+        })
+
+
+class AuthoritySearch(LoginRequiredMixin, View):
+    """Search ALL, studies and groups by prefix, for autocompletion
+
+    Expects the ``q`` and, for further pages, the ``page`` query
+    parameters.  The search runs on the sorted keys of the cached study
+    catalog.
+    """
+
+    raise_exception = True
+    paginate_by = 20
+
+    def get(self, request, *args, **kwargs):
+        query = request.GET.get('q', '').strip()
+        try:
+            page = max(int(request.GET.get('page', 0)), 0)
+        except ValueError:
+            page = 0
+        keys, more = portal_models.DaoStudyCatalog.get().search_authority_keys(
+            query, page * self.paginate_by, self.paginate_by)
+        choices = forms.AuthoritiesChoiceField.get_choices(keys)
+        return JsonResponse({
+            'results': [{'id': key, 'text': text} for key, text in choices],
+            'next': {'page': page + 1} if more else None,
+        })
+
+
+class ImportJobStatus(LoginRequiredMixin, View):
+    """Report the status, progress and errors of an import job"""
+
+    raise_exception = True
+
+    def get(self, request, *args, **kwargs):
+        job = get_object_or_404(models.ImportJob, pk=kwargs['pk'])
+        return JsonResponse(job.to_dict())
+
+
+class PoolStats(LoginRequiredMixin, View):
+    """Report the connection pool counters of this process"""
+
+    raise_exception = True
+
+    def get(self, request, *args, **kwargs):
+        return JsonResponse(pool.all_stats())
+
+
+class Metrics(LoginRequiredMixin, View):
+    """Query, connection pool and study catalog metrics of this process in
+    the Prometheus text format
+
+    Login is not required if ``settings.CBIOPORTAL_METRICS_PUBLIC`` is set.
+    """
+
+    raise_exception = True
+
+    def dispatch(self, request, *args, **kwargs):
+        if settings.CBIOPORTAL_METRICS_PUBLIC:
+            return View.dispatch(self, request, *args, **kwargs)
+        return super().dispatch(request, *args, **kwargs)
+
+    def get(self, request, *args, **kwargs):
+        return HttpResponse(instrumentation.metrics_text(),
+                            content_type='text/plain; version=0.0.4')
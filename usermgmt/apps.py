@@ -3,3 +3,9 @@ from django.apps import AppConfig
 
 class UsermgmtConfig(AppConfig):
     name = 'usermgmt'
+
+    def ready(self):
+        # Connect the signal receivers
+        from . import access  # noqa
+        from . import journal  # noqa
+        from . import versioning  # noqa
@@ -0,0 +1,11 @@
+"""MySQL backend that takes its connections from a ConnectionPool"""
+
+from django.db.backends.mysql import base
+
+from ...pool import PooledDatabaseWrapperMixin
+
+
+class DatabaseWrapper(PooledDatabaseWrapperMixin, base.DatabaseWrapper):
+
+    def ping_connection(self, conn):
+        conn.ping()
@@ -0,0 +1,12 @@
+"""SQLite backend that takes its connections from a ConnectionPool
+
+Meant as a local stand-in for the portal's MySQL database.
+"""
+
+from django.db.backends.sqlite3 import base
+
+from ...pool import PooledDatabaseWrapperMixin
+
+
+class DatabaseWrapper(PooledDatabaseWrapperMixin, base.DatabaseWrapper):
+    pass
@@ -0,0 +1,292 @@
+"""Benchmarks for the DAO layer against a synthetic cBioPortal schema
+
+create_schema() creates the ``users``, ``authorities`` and ``cancer_study``
+tables on the ``cbioportal`` connection, populate() fills them with
+synthetic data and run_benchmarks() times the DAO methods, the YAML import
+and the export.  Use the ``benchmark_dao`` management command to run them.
+"""
+
+from django.db import connections
+
+from . import portal_models
+
+import io
+import random
+import statistics
+import time
+
+#: Tables of the portal schema used by this app, in creation order
+SCHEMA = (
+    ('users', r"""
+        CREATE TABLE users (
+            email VARCHAR(128) NOT NULL PRIMARY KEY,
+            name VARCHAR(255) NOT NULL,
+            enabled SMALLINT NOT NULL
+        )"""),
+    ('authorities', r"""
+        CREATE TABLE authorities (
+            email VARCHAR(128) NOT NULL,
+            authority VARCHAR(50) NOT NULL
+        )"""),
+    ('cancer_study', r"""
+        CREATE TABLE cancer_study (
+            cancer_study_id INTEGER NOT NULL PRIMARY KEY,
+            cancer_study_identifier VARCHAR(255) NOT NULL UNIQUE,
+            name VARCHAR(255) NOT NULL,
+            groups VARCHAR(200) NOT NULL
+        )"""),
+)
+
+
+class Volumes:
+    """Number of rows to generate"""
+
+    def __init__(self, users=50000, studies=2000, groups=200,
+                 authorities=500000, seed=42):
+        self.users = users
+        self.studies = studies
+        self.groups = groups
+        self.authorities = authorities
+        self.seed = seed
+
+    @property
+    def max_authorities(self):
+        """Number of distinct ``(email, authority)`` pairs populate() can
+        generate: each user with each study, each group and ``ALL``"""
+        return self.users * (self.studies + self.groups + 1)
+
+    def to_dict(self):
+        return {
+            'users': self.users,
+            'studies': self.studies,
+            'groups': self.groups,
+            'authorities': self.authorities,
+            'seed': self.seed,
+        }
+
+
+def create_schema():
+    """(Re-)create the portal tables, dropping existing ones"""
+    cursor = connections['cbioportal'].cursor()
+    for table, sql in reversed(SCHEMA):
+        cursor.execute('DROP TABLE IF EXISTS {}'.format(table))
+    for table, sql in SCHEMA:
+        cursor.execute(sql)
+
+
+def populate(volumes):
+    """Fill the portal tables with synthetic data"""
+    rng = random.Random(volumes.seed)
+    groups = ['GROUP_{:04d}'.format(i) for i in range(volumes.groups)]
+    studies = ['study_{:05d}'.format(i) for i in range(volumes.studies)]
+    emails = ['user{:06d}@example.com'.format(i)
+              for i in range(volumes.users)]
+    cursor = connections['cbioportal'].cursor()
+    for chunk in portal_models.chunked(enumerate(studies)):
+        cursor.executemany(r"""
+            INSERT INTO cancer_study
+                (cancer_study_id, cancer_study_identifier, name, groups)
+            VALUES (%s, %s, %s, %s)""",
+            [[i + 1, study, 'Study {}'.format(i),
+              ';'.join(rng.sample(groups, min(len(groups),
+                                              rng.randint(0, 3))))]
+             for i, study in chunk])
+    portal_models.DaoUser.create_users(
+        portal_models.DbUser(email, 'User {}'.format(i), rng.random() > 0.05)
+        for i, email in enumerate(emails))
+    targets = ([s.upper() for s in studies] + groups)
+    pairs = set()
+    num_authorities = min(volumes.authorities, volumes.max_authorities)
+    while len(pairs) < num_authorities:
+        target = 'ALL' if rng.random() < 0.001 else rng.choice(targets)
+        pairs.add((rng.choice(emails), 'cbioportal:' + target))
+    portal_models.DaoAuthority.grant(sorted(pairs))
+    portal_models.DaoStudyCatalog.invalidate()
+    portal_models.DaoStatistics.invalidate()
+
+
+class Case:
+    """A timed benchmark case
+
+    ``run`` is timed; ``setup`` and ``teardown`` run before and after each
+    repetition, outside the measurement.
+    """
+
+    def __init__(self, name, run, setup=None, teardown=None):
+        self.name = name
+        self.run = run
+        self.setup = setup or (lambda: None)
+        self.teardown = teardown or (lambda: None)
+
+    def measure(self, repeat):
+        timings = []
+        for _ in range(repeat):
+            self.setup()
+            start = time.perf_counter()
+            self.run()
+            timings.append(time.perf_counter() - start)
+            self.teardown()
+        return {
+            'name': self.name,
+            'repeat': repeat,
+            'min': min(timings),
+            'median': statistics.median(timings),
+            'mean': statistics.mean(timings),
+            'max': max(timings),
+        }
+
+
+def build_cases():
+    """Return list of Case objects for the current database contents"""
+    DaoUser = portal_models.DaoUser
+    DaoStudy = portal_models.DaoStudy
+    DaoStudyGroup = portal_models.DaoStudyGroup
+    DaoStudyCatalog = portal_models.DaoStudyCatalog
+    DaoAuthority = portal_models.DaoAuthority
+    DaoStatistics = portal_models.DaoStatistics
+
+    users = DaoUser.page_users(100).users
+    user = users[len(users) // 2]
+    study = DaoStudy.all_studies()[0]
+    # The group cases are skipped if no study has a group
+    group = min((g for g in DaoStudyGroup.all_groups() if g.name),
+                default=None)
+    authorities = [a.authority for a in DaoAuthority.for_user(user.email)]
+    study_users = [u.email for u in DaoUser.with_direct_access_to(
+        study.identifier)]
+    group_users = [u.email for u in DaoUser.with_direct_access_to(
+        group.name)] if group else []
+    new_email = 'benchmark.user@example.com'
+    new_users = [portal_models.DbUser('benchmark{}@example.com'.format(i),
+                                      'Benchmark', True) for i in range(1000)]
+    new_pairs = [(u.email, 'cbioportal:' + study.identifier.upper())
+                 for u in new_users]
+    bulk_studies = ['bulk_{}'.format(i) for i in range(10)]
+    yaml_text = ''.join(portal_models.export_to_yaml())
+
+    def cold(func):
+        def run():
+            DaoStudyCatalog.invalidate()
+            return func()
+        return run
+
+    def consume(iterable):
+        for _ in iterable:
+            pass
+
+    cases = [
+        # DaoStudyCatalog
+        Case('DaoStudyCatalog.refresh', DaoStudyCatalog.refresh),
+        # DaoStudy, cold (catalog reloaded) and warm
+        Case('DaoStudy.all_studies[cold]', cold(DaoStudy.all_studies)),
+        Case('DaoStudy.all_studies', DaoStudy.all_studies),
+        Case('DaoStudy.get', lambda: DaoStudy.get(study.identifier)),
+        Case('DaoStudy.exists', lambda: DaoStudy.exists(study.identifier)),
+        Case('DaoStudy.num_studies', DaoStudy.num_studies),
+        # DaoStudyGroup
+        Case('DaoStudyGroup.all_groups[cold]', cold(DaoStudyGroup.all_groups)),
+        Case('DaoStudyGroup.all_groups', DaoStudyGroup.all_groups),
+        Case('DaoStudyGroup.num_groups', DaoStudyGroup.num_groups),
+        # DaoUser, reading
+        Case('DaoUser.all_users', DaoUser.all_users),
+        Case('DaoUser.page_users', lambda: DaoUser.page_users(50)),
+        Case('DaoUser.page_users[after]',
+             lambda: DaoUser.page_users(50, after=user.email)),
+        Case('DaoUser.page_users[query]',
+             lambda: DaoUser.page_users(50, query='user00')),
+        Case('DaoUser.with_direct_access_to',
+             lambda: DaoUser.with_direct_access_to(study.identifier)),
+        Case('DaoUser.with_direct_access_to_many',
+             lambda: DaoUser.with_direct_access_to_many(
+                 [study.identifier, 'ALL'] + study.groups)),
+        Case('DaoUser.user_exists', lambda: DaoUser.user_exists(user.email)),
+        Case('DaoUser.existing_emails',
+             lambda: DaoUser.existing_emails([u.email for u in users])),
+        Case('DaoUser.get_users',
+             lambda: DaoUser.get_users([u.email for u in users])),
+        Case('DaoUser.num_users', DaoUser.num_users),
+        Case('DaoUser.get_user', lambda: DaoUser.get_user(user.email)),
+        # DaoUser, writing
+        Case('DaoUser.create_user',
+             lambda: DaoUser.create_user(new_email, 'Benchmark', True),
+             teardown=lambda: DaoUser.delete_user(new_email)),
+        Case('DaoUser.update_user',
+             lambda: DaoUser.update_user(user.email, user.name, user.enabled)),
+        Case('DaoUser.delete_user',
+             lambda: DaoUser.delete_user(new_email),
+             setup=lambda: DaoUser.create_user(new_email, 'Benchmark', True)),
+        Case('DaoUser.create_users[1000]',
+             lambda: DaoUser.create_users(new_users),
+             teardown=lambda: DaoUser.delete_users(
+                 [u.email for u in new_users])),
+        Case('DaoUser.upsert_users[1000+100]',
+             lambda: DaoUser.upsert_users(new_users, users),
+             teardown=lambda: DaoUser.delete_users(
+                 [u.email for u in new_users])),
+        Case('DaoUser.update_users[100]',
+             lambda: DaoUser.update_users(users)),
+        Case('DaoUser.delete_users[1000]',
+             lambda: DaoUser.delete_users([u.email for u in new_users]),
+             setup=lambda: DaoUser.create_users(new_users)),
+        # DaoAuthority
+        Case('DaoAuthority.all_authorities', DaoAuthority.all_authorities),
+        Case('DaoAuthority.for_user',
+             lambda: DaoAuthority.for_user(user.email)),
+        Case('DaoAuthority.existing[1000]',
+             lambda: DaoAuthority.existing(new_pairs)),
+        Case('DaoAuthority.grant[1000]',
+             lambda: DaoAuthority.grant(new_pairs),
+             teardown=lambda: DaoAuthority.revoke(new_pairs)),
+        Case('DaoAuthority.revoke[1000]',
+             lambda: DaoAuthority.revoke(new_pairs),
+             setup=lambda: DaoAuthority.grant(new_pairs)),
+        Case('DaoAuthority.grant_bulk[1000]',
+             lambda: DaoAuthority.grant_bulk(
+                 [u.email for u in users], bulk_studies),
+             teardown=lambda: DaoAuthority.revoke_bulk(
+                 [u.email for u in users], bulk_studies)),
+        Case('DaoAuthority.revoke_bulk[1000]',
+             lambda: DaoAuthority.revoke_bulk(
+                 [u.email for u in users], bulk_studies),
+             setup=lambda: DaoAuthority.grant_bulk(
+                 [u.email for u in users], bulk_studies)),
+        Case('DaoAuthority.update_authorities_for_user',
+             lambda: DaoAuthority.update_authorities_for_user(
+                 user.email, authorities)),
+        Case('DaoAuthority.update_authorities_for_study',
+             lambda: DaoAuthority.update_authorities_for_study(
+                 study.identifier, study_users)),
+        # Dashboard
+        Case('DaoStatistics.get', DaoStatistics.get,
+             setup=DaoStatistics.invalidate),
+        # Import and export
+        Case('export_to_yaml', lambda: consume(portal_models.export_to_yaml())),
+        Case('import_from_yaml',
+             lambda: portal_models.import_from_yaml(io.StringIO(yaml_text))),
+        Case('sync_from_yaml[dry_run]',
+             lambda: portal_models.sync_from_yaml(
+                 io.StringIO(yaml_text), dry_run=True)),
+    ]
+    if group is not None:
+        cases += [
+            Case('DaoStudyGroup.exists',
+                 lambda: DaoStudyGroup.exists(group.name)),
+            Case('DaoStudyGroup.get', lambda: DaoStudyGroup.get(group.name)),
+            Case('DaoAuthority.update_authorities_for_group',
+                 lambda: DaoAuthority.update_authorities_for_group(
+                     group.name, group_users)),
+        ]
+    return cases
+
+
+def run_benchmarks(repeat=5, only=None):
+    """Run the benchmark cases, return ``list`` of result ``dict``s
+
+    ``only`` is an optional collection of case name prefixes.
+    """
+    results = []
+    for case in build_cases():
+        if only and not any(case.name.startswith(o) for o in only):
+            continue
+        results.append(case.measure(repeat))
+    return results
@@ -0,0 +1,73 @@
+"""Run independent reads on the portal database concurrently
+
+fan_out() runs the first callable in the current thread and the others on a
+process-wide thread pool of ``settings.CBIOPORTAL_FAN_OUT_WORKERS`` threads.
+Each worker thread uses its own database connection, which is closed (that
+is, returned to the connection pool) after each task, so the page latency
+approaches that of the slowest query instead of the sum of all of them.
+
+The queries of the workers are reported to the QueryRecorder of the calling
+thread.  Inside a transaction on the ``cbioportal`` connection, the
+callables run one after another in the current thread, as the other
+connections would not see its uncommitted changes.
+"""
+
+from django.conf import settings
+from django.db import connections
+
+from . import instrumentation
+
+import concurrent.futures
+import os
+import threading
+
+#: Process-wide executor and the ID of the process that created it
+_executor = None
+_executor_pid = None
+_executor_lock = threading.Lock()
+
+
+def get_executor():
+    """Return the process-wide ThreadPoolExecutor, creating it if necessary
+    (again after fork())"""
+    global _executor, _executor_pid
+    with _executor_lock:
+        if _executor is None or _executor_pid != os.getpid():
+            _executor = concurrent.futures.ThreadPoolExecutor(
+                max_workers=settings.CBIOPORTAL_FAN_OUT_WORKERS)
+            _executor_pid = os.getpid()
+        return _executor
+
+
+def _run_task(func, recorder):
+    """Run ``func`` in a worker thread, then close the thread's
+    connections"""
+    if recorder is not None:
+        instrumentation.start_recording(recorder)
+    try:
+        return func()
+    finally:
+        if recorder is not None:
+            instrumentation.stop_recording()
+        for connection in connections.all():
+            connection.close()
+
+
+def fan_out(*funcs):
+    """Call the callables concurrently, return ``list`` of their results
+
+    If a callable raises, the exception of the first one in argument order
+    is re-raised after all have finished.
+    """
+    if (len(funcs) < 2 or settings.CBIOPORTAL_FAN_OUT_WORKERS < 1 or
+            connections['cbioportal'].in_atomic_block):
+        return [func() for func in funcs]
+    recorder = instrumentation.current_recorder()
+    executor = get_executor()
+    futures = [executor.submit(_run_task, func, recorder)
+               for func in funcs[1:]]
+    try:
+        first = funcs[0]()
+    finally:
+        concurrent.futures.wait(futures)
+    return [first] + [future.result() for future in futures]
@@ -1,51 +1,103 @@
 from django import forms
-from django.utils.functional import lazy
+from django.core.urlresolvers import reverse
 
 from . import portal_models
 
 
-class AuthoritiesChoiceField(forms.MultipleChoiceField):
+class AutocompleteSelectMultiple(forms.SelectMultiple):
+    """Multiple select that only renders the selected options
+
+    Further options are searched for with the JSON endpoint ``url_name``
+    by ``autocomplete.js``.  ``get_choices`` is called with the selected
+    values and returns their ``(value, label)`` choices.
+    """
+
+    class Media:
+        js = ('usermgmt/js/autocomplete.js',)
+
+    def __init__(self, url_name, get_choices, attrs=None):
+        super().__init__(attrs)
+        self.url_name = url_name
+        self.get_choices = get_choices
+
+    def render(self, name, value, *args, **kwargs):
+        self.choices = self.get_choices(value or [])
+        self.attrs['data-autocomplete-url'] = reverse(self.url_name)
+        return super().render(name, value, *args, **kwargs)
+
+
+class AutocompleteChoiceField(forms.MultipleChoiceField):
+    """Multiple choice field whose choices are searched for on demand
+
+    Sub classes set the class attribute ``url_name`` and implement the
+    class method ``get_choices(values)``, which returns the ``(value,
+    label)`` choices of those of ``values`` that exist, in their order,
+    with at most one query.  Only the submitted values are validated, with
+    one call of ``get_choices()``.
+    """
+
+    #: Name of the URL pattern of the search endpoint
+    url_name = None
 
     def __init__(self, *args, **kwargs):
-        kwargs['choices'] = lazy(AuthoritiesChoiceField.get_choices, list)
+        kwargs['widget'] = AutocompleteSelectMultiple(
+            self.url_name, self.get_choices)
         super().__init__(*args, **kwargs)
 
+    def validate(self, value):
+        if self.required and not value:
+            raise forms.ValidationError(
+                self.error_messages['required'], code='required')
+        known = {choice for choice, _ in self.get_choices(value)}
+        for val in value:
+            if val not in known:
+                raise forms.ValidationError(
+                    self.error_messages['invalid_choice'],
+                    code='invalid_choice', params={'value': val})
+
+
+class AuthoritiesChoiceField(AutocompleteChoiceField):
+
+    url_name = 'api_search_authorities'
+
     @classmethod
-    def get_choices(klass):
-        result = [('ALL', 'ALL [special] -- Access to all studies!')]
-        for study in portal_models.DaoStudy.all_studies():
-            result.append((study.identifier.upper(),
-                           '{} [study] ({})'.format(study.identifier, study.name)))
-        for group in portal_models.DaoStudyGroup.all_groups():
-            result.append((group.name.upper(), '{} [group]'.format(group.name)))
+    def get_choices(klass, values):
+        catalog = portal_models.DaoStudyCatalog.get()
+        result = []
+        for value in values:
+            key = portal_models.authority_key(value)
+            if key == 'ALL':
+                result.append((key, 'ALL [special] -- Access to all studies!'))
+            elif key in catalog.studies_by_key:
+                study = catalog.studies_by_key[key]
+                result.append((key, '{} [study] ({})'.format(
+                    study.identifier, study.name)))
+            elif key in catalog.groups_by_key:
+                group = catalog.groups_by_key[key]
+                result.append((key, '{} [group] ({} studies)'.format(
+                    group.name, len(group.studies))))
         return result
 
 
 class UserAccessForm(forms.Form):
     authorities = AuthoritiesChoiceField(
         required=False,
-        widget=forms.CheckboxSelectMultiple,
         label='Authorities')
 
 
-class UsersChoiceField(forms.MultipleChoiceField):
+class UsersChoiceField(AutocompleteChoiceField):
 
-    def __init__(self, *args, **kwargs):
-        kwargs['choices'] = lazy(UsersChoiceField.get_choices, list)
-        super().__init__(*args, **kwargs)
+    url_name = 'api_search_users'
 
     @classmethod
-    def get_choices(klass):
-        result = []
-        for user in portal_models.DaoUser.all_users():
-            result.append((user.email, '{} - {}'.format(user.email, user.name)))
-        return result
+    def get_choices(klass, values):
+        return [(user.email, '{} - {}'.format(user.email, user.name))
+                for user in portal_models.DaoUser.get_users(values)]
 
 
 class StudyUsersForm(forms.Form):
     users = UsersChoiceField(
         required=False,
-        widget=forms.CheckboxSelectMultiple,
         label='Users')
 
 
@@ -53,6 +105,21 @@ class GroupUsersForm(StudyUsersForm):
     pass
 
 
+class BulkAccessForm(forms.Form):
+    users = UsersChoiceField(
+        label='Users')
+    authorities = AuthoritiesChoiceField(
+        label='Studies and groups')
+    action = forms.ChoiceField(
+        choices=[
+            ('grant', 'Grant access'),
+            ('revoke', 'Revoke access'),
+        ],
+        initial='grant',
+        label='Action',
+        help_text='Applied to each combination of user and study or group')
+
+
 class UpdateUserForm(forms.Form):
     name = forms.CharField(
         label='User name', max_length=100,
@@ -76,3 +143,16 @@ class CreateUserForm(forms.Form):
 
 class ImportForm(forms.Form):
     file = forms.FileField()
+    mode = forms.ChoiceField(
+        choices=[
+            ('replace', 'Replace all users and authorities'),
+            ('sync', 'Apply changes only'),
+        ],
+        initial='replace',
+        label='Import mode',
+        help_text=('"Apply changes only" leaves unchanged rows alone and '
+                   'keeps the portal usable during the import'))
+    dry_run = forms.BooleanField(
+        required=False,
+        label='Dry run', help_text=('Only show the changes, requires '
+                                    '"Apply changes only"'))
@@ -0,0 +1,250 @@
+"""Per-request instrumentation of the queries on the cbioportal connection
+
+SqlInstrumentationMiddleware wraps the cursors of the ``cbioportal``
+connection while a request is handled and records the number of queries,
+their total time and the slowest statements.  The result is sent as
+``Server-Timing`` header and aggregated per view for metrics_text().  If a
+request runs more than ``settings.CBIOPORTAL_SQL_QUERY_COUNT_WARNING``
+queries, a warning is logged.
+
+For streaming responses, the queries run while the content is consumed are
+recorded as well; they are included in the aggregates and the warning, but
+not in the ``Server-Timing`` header, which is sent before the content.
+
+The aggregates are kept per process.
+"""
+
+from django.conf import settings
+from django.db import connections
+
+from . import pool
+from . import portal_models
+
+import collections
+import heapq
+import logging
+import threading
+import time
+
+logger = logging.getLogger(__name__)
+
+#: Recorder of the current thread, see current_recorder()
+_local = threading.local()
+
+#: Aggregated counters by view name, see metrics_text()
+_metrics = collections.defaultdict(collections.Counter)
+_metrics_lock = threading.Lock()
+
+
+class QueryRecorder:
+    """Statistics of the queries run during one request"""
+
+    def __init__(self, keep_slowest=3):
+        self.keep_slowest = keep_slowest
+        #: Number of queries
+        self.count = 0
+        #: Total time of the queries in seconds
+        self.seconds = 0.0
+        #: Min-heap of the ``(seconds, sql)`` of the slowest queries
+        self._slowest = []
+        self._lock = threading.Lock()
+
+    def record(self, sql, seconds, params=None, many=False):
+        with self._lock:
+            self.count += 1
+            self.seconds += seconds
+            item = (seconds, ' '.join(sql.split()))
+            if len(self._slowest) < self.keep_slowest:
+                heapq.heappush(self._slowest, item)
+            elif self._slowest and item > self._slowest[0]:
+                heapq.heapreplace(self._slowest, item)
+
+    @property
+    def slowest(self):
+        """``list`` of ``(seconds, sql)`` of the slowest queries, slowest
+        first"""
+        with self._lock:
+            return sorted(self._slowest, reverse=True)
+
+
+class QueryLog(QueryRecorder):
+    """QueryRecorder that also keeps the statements run with execute(),
+    with their parameters"""
+
+    def __init__(self, keep_slowest=3):
+        super().__init__(keep_slowest)
+        #: ``list`` of ``(sql, params)``
+        self.statements = []
+
+    def record(self, sql, seconds, params=None, many=False):
+        super().record(sql, seconds, params, many)
+        if not many:
+            with self._lock:
+                self.statements.append((sql, params))
+
+
+class RecordingCursorWrapper:
+    """Cursor wrapper that reports its queries to a QueryRecorder"""
+
+    def __init__(self, cursor, recorder):
+        self.cursor = cursor
+        self.recorder = recorder
+
+    def __getattr__(self, attr):
+        return getattr(self.cursor, attr)
+
+    def __iter__(self):
+        return iter(self.cursor)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, type, value, traceback):
+        self.close()
+
+    def execute(self, sql, params=None):
+        start = time.perf_counter()
+        try:
+            return self.cursor.execute(sql, params)
+        finally:
+            self.recorder.record(sql, time.perf_counter() - start, params)
+
+    def executemany(self, sql, param_list):
+        start = time.perf_counter()
+        try:
+            return self.cursor.executemany(sql, param_list)
+        finally:
+            self.recorder.record(sql, time.perf_counter() - start, many=True)
+
+
+def start_recording(recorder, using='cbioportal'):
+    """Report the queries of this thread's connection ``using`` to
+    ``recorder`` until stop_recording()"""
+    connection = connections[using]
+    make_cursor = connection.make_cursor
+    make_debug_cursor = connection.make_debug_cursor
+    connection.make_cursor = lambda cursor: RecordingCursorWrapper(
+        make_cursor(cursor), recorder)
+    connection.make_debug_cursor = lambda cursor: RecordingCursorWrapper(
+        make_debug_cursor(cursor), recorder)
+    _local.recorder = recorder
+
+
+def stop_recording(using='cbioportal'):
+    connection = connections[using]
+    connection.__dict__.pop('make_cursor', None)
+    connection.__dict__.pop('make_debug_cursor', None)
+    _local.recorder = None
+
+
+def current_recorder():
+    """Return the QueryRecorder of the current thread or ``None``"""
+    return getattr(_local, 'recorder', None)
+
+
+class SqlInstrumentationMiddleware:
+    """Record the cbioportal queries of each request"""
+
+    def process_request(self, request):
+        request.sql_recorder = QueryRecorder(
+            settings.CBIOPORTAL_SQL_SLOWEST_STATEMENTS)
+        request.sql_view_name = None
+        start_recording(request.sql_recorder)
+
+    def process_view(self, request, view_func, view_args, view_kwargs):
+        match = request.resolver_match
+        request.sql_view_name = (
+            match.url_name if match and match.url_name else
+            '{}.{}'.format(view_func.__module__, view_func.__name__))
+
+    def process_response(self, request, response):
+        recorder = getattr(request, 'sql_recorder', None)
+        if recorder is None:
+            return response
+        stop_recording()
+        response['Server-Timing'] = (
+            'cbioportal;dur={:.3f};desc="{} queries"'.format(
+                recorder.seconds * 1000, recorder.count))
+        if response.streaming:
+            response.streaming_content = self._record_streaming(
+                request, recorder, response.streaming_content)
+        else:
+            self._finish(request, recorder)
+        return response
+
+    def _record_streaming(self, request, recorder, content):
+        """Yield from ``content`` while recording, finish the request's
+        record once it is consumed or closed"""
+        start_recording(recorder)
+        try:
+            yield from content
+        finally:
+            stop_recording()
+            self._finish(request, recorder)
+
+    def _finish(self, request, recorder):
+        """Aggregate the queries of the request, warn if there are too
+        many"""
+        view_name = request.sql_view_name or 'unknown'
+        with _metrics_lock:
+            _metrics[view_name].update({
+                'requests': 1,
+                'queries': recorder.count,
+                'seconds': recorder.seconds,
+            })
+        threshold = settings.CBIOPORTAL_SQL_QUERY_COUNT_WARNING
+        if threshold and recorder.count > threshold:
+            logger.warning(
+                '%s %s (%s) ran %d cbioportal queries in %.1f ms; '
+                'slowest: %s', request.method, request.path, view_name,
+                recorder.count, recorder.seconds * 1000,
+                '; '.join('{:.1f} ms {}'.format(seconds * 1000, sql[:200])
+                          for seconds, sql in recorder.slowest))
+
+
+def metrics_text():
+    """Return the aggregated metrics in the Prometheus text format"""
+    lines = []
+
+    def family(name, kind, help, samples):
+        lines.append('# HELP {} {}'.format(name, help))
+        lines.append('# TYPE {} {}'.format(name, kind))
+        for labels, value in samples:
+            label_text = ','.join(
+                '{}="{}"'.format(k, str(v).replace('\\', '\\\\').replace(
+                    '"', '\\"')) for k, v in sorted(labels.items()))
+            lines.append('{}{} {}'.format(
+                name, '{' + label_text + '}' if label_text else '', value))
+
+    with _metrics_lock:
+        metrics = {view: dict(counter) for view, counter in _metrics.items()}
+    for key, name, help in (
+            ('requests', 'usermgmt_requests_total',
+             'Requests handled, by view'),
+            ('queries', 'usermgmt_cbioportal_queries_total',
+             'Queries on the cbioportal database, by view'),
+            ('seconds', 'usermgmt_cbioportal_query_seconds_total',
+             'Time spent in queries on the cbioportal database, by view')):
+        family(name, 'counter', help, [
+            ({'view': view}, counter.get(key, 0))
+            for view, counter in sorted(metrics.items())])
+    pool_stats = pool.all_stats()
+    for key in ('checkouts', 'waits', 'timeouts', 'connects', 'recycled',
+                'ping_failures'):
+        family('usermgmt_pool_{}_total'.format(key), 'counter',
+               'Connection pool {}'.format(key.replace('_', ' ')),
+               [({'alias': alias}, stats.get(key, 0))
+                for alias, stats in sorted(pool_stats.items())])
+    for key in ('size', 'open', 'idle', 'in_use'):
+        family('usermgmt_pool_{}'.format(key), 'gauge',
+               'Connection pool {}'.format(key.replace('_', ' ')),
+               [({'alias': alias}, stats.get(key, 0))
+                for alias, stats in sorted(pool_stats.items())])
+    catalog = portal_models.DaoStudyCatalog.stats()
+    family('usermgmt_study_catalog_hits_total', 'counter',
+           'Study catalog lookups served from memory',
+           [({}, catalog['hits'])])
+    family('usermgmt_study_catalog_misses_total', 'counter',
+           'Study catalog lookups that loaded from the database',
+           [({}, catalog['misses'])])
+    return '\n'.join(lines) + '\n'
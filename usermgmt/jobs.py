@@ -0,0 +1,171 @@
+"""Run imports in the background
+
+submit_import() copies the uploaded document to
+``settings.CBIOPORTAL_IMPORT_DIR``, records an ImportJob in the ``default``
+database and runs it on a process-wide pool of
+``settings.CBIOPORTAL_IMPORT_WORKERS`` threads, so the request returns
+immediately.  While the job runs, its section, number of records read and
+run time are written to the ImportJob about every
+``settings.CBIOPORTAL_IMPORT_PROGRESS_INTERVAL`` seconds, outside of the
+import transaction, for the status page to poll.
+
+The jobs run in the web server process that accepted the upload.  A job
+that is pending or running when that process exits is not resumed; it stays
+in its state and has to be submitted again.
+"""
+
+from django.conf import settings
+from django.db import connections
+from django.utils import timezone
+
+from . import models
+from . import portal_models
+
+import concurrent.futures
+import json
+import logging
+import os
+import tempfile
+import threading
+import time
+
+import yaml
+
+logger = logging.getLogger(__name__)
+
+#: Process-wide executor and the ID of the process that created it
+_executor = None
+_executor_pid = None
+_executor_lock = threading.Lock()
+
+
+def get_executor():
+    """Return the process-wide ThreadPoolExecutor for the jobs, creating it
+    if necessary (again after fork())"""
+    global _executor, _executor_pid
+    with _executor_lock:
+        if _executor is None or _executor_pid != os.getpid():
+            _executor = concurrent.futures.ThreadPoolExecutor(
+                max_workers=max(settings.CBIOPORTAL_IMPORT_WORKERS, 1))
+            _executor_pid = os.getpid()
+        return _executor
+
+
+def submit_import(upload, mode, dry_run=False, user=None):
+    """Save the uploaded file, start importing it, return the ImportJob"""
+    os.makedirs(settings.CBIOPORTAL_IMPORT_DIR, exist_ok=True)
+    fd, path = tempfile.mkstemp(suffix='.yaml',
+                                dir=settings.CBIOPORTAL_IMPORT_DIR)
+    with os.fdopen(fd, 'wb') as f:
+        for chunk in upload.chunks():
+            f.write(chunk)
+    job = models.ImportJob.objects.create(
+        file_name=upload.name[:255], path=path, mode=mode,
+        dry_run=dry_run and mode == 'sync',
+        user=user if user is not None and user.is_authenticated() else None)
+    get_executor().submit(run_import_job, job.pk)
+    return job
+
+
+class _Progress:
+    """Progress callback for the imports, see _checked_records(); saves the
+    counters of the job at most every ``interval`` seconds"""
+
+    def __init__(self, job, interval):
+        self.job = job
+        self.interval = interval
+        #: Records of the sections that were read completely
+        self.done = 0
+        self.section = None
+        self.count = 0
+        self.last_save = time.monotonic()
+
+    def __call__(self, section, count):
+        if section != self.section:
+            self.done += self.count
+            self.section = section
+        self.count = count
+        now = time.monotonic()
+        if now - self.last_save >= self.interval:
+            self.last_save = now
+            self.save()
+
+    @property
+    def rows_processed(self):
+        return self.done + self.count
+
+    def save(self):
+        models.ImportJob.objects.filter(pk=self.job.pk).update(
+            section=self.section or '', rows_processed=self.rows_processed,
+            updated=timezone.now())
+
+
+def _document_error_message(e, file_name):
+    """Return the message of the YAMLError or ValueError ``e`` raised for
+    an invalid document, naming the uploaded file instead of its copy"""
+    if isinstance(e, yaml.MarkedYAMLError):
+        message = ', '.join(text for text in (e.context, e.problem) if text)
+        mark = e.problem_mark or e.context_mark
+        if mark is not None:
+            message += ' in "{}", line {}, column {}'.format(
+                file_name, mark.line + 1, mark.column + 1)
+    elif isinstance(e, yaml.reader.ReaderError):
+        message = '{} in "{}", position {}'.format(
+            e.reason, file_name, e.position)
+    else:
+        message = str(e)
+    return 'Invalid document: {}'.format(message)
+
+
+def run_import_job(pk):
+    """Run the ImportJob ``pk``, then delete its file and close the
+    connections of the thread"""
+    path = None
+    try:
+        job = models.ImportJob.objects.get(pk=pk)
+        path = job.path
+        job.status = models.ImportJob.STATUS_RUNNING
+        job.started = timezone.now()
+        job.save()
+        progress = _Progress(job, settings.CBIOPORTAL_IMPORT_PROGRESS_INTERVAL)
+        try:
+            with open(job.path, 'rb') as f:
+                if job.mode == 'sync':
+                    result = portal_models.sync_from_yaml(
+                        f, dry_run=job.dry_run, progress=progress)
+                else:
+                    result = portal_models.import_from_yaml(
+                        f, progress=progress)
+        except portal_models.InvalidRecords as e:
+            job.status = models.ImportJob.STATUS_FAILED
+            job.num_errors = len(e.errors)
+            job.errors = json.dumps([
+                {'section': section, 'number': number, 'message': message}
+                for section, number, message in
+                e.errors[:settings.CBIOPORTAL_IMPORT_MAX_ERRORS]])
+            job.message = ('{} invalid record(s), nothing has been '
+                           'written').format(len(e.errors))
+        except (yaml.YAMLError, ValueError) as e:
+            job.status = models.ImportJob.STATUS_FAILED
+            job.message = _document_error_message(e, job.file_name)
+        except Exception:
+            # Database errors and the like may contain details of the
+            # server, they are only logged
+            logger.exception('Import job %s failed', pk)
+            job.status = models.ImportJob.STATUS_FAILED
+            job.message = 'Import failed, see the server log for details'
+        else:
+            job.status = models.ImportJob.STATUS_SUCCEEDED
+            job.message = str(result)
+            job.result = json.dumps(result.to_dict())
+        job.section = progress.section or ''
+        job.rows_processed = progress.rows_processed
+        job.finished = timezone.now()
+        job.save()
+    except Exception:
+        logger.exception('Cannot update import job %s', pk)
+    finally:
+        if path is not None and os.path.exists(path):
+            os.remove(path)
+        for connection in connections.all():
+            connection.close()
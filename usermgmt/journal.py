@@ -0,0 +1,139 @@
+"""Journal of the changes to users and authorities, for delta exports
+
+The receivers below write one ChangeJournalEntry (in the ``default``
+database) per user created, updated or deleted and per authority granted or
+revoked through DaoUser and DaoAuthority.  The entries get consecutive
+versions from the ``journal`` DataVersion counter, which is locked until
+the entries are committed, so versions become visible in order and a
+client that saw version N has seen all entries up to N.  The counter is the
+current data version; a full export is tagged with it and
+export_changes_to_yaml() returns the changes after a given version.
+
+A full import replaces all rows and is journaled as a single reset entry;
+changes from before a reset cannot be exported as delta any more.  The
+entries are written after the transaction on the ``cbioportal`` connection
+has been committed, so replaying a delta on top of a full export taken
+concurrently may repeat changes that are already contained in it.  If the
+entries cannot be written, the error is logged and a reset entry is
+written instead, so delta exports ask for a full export rather than
+skipping the changes.
+"""
+
+from django.db import DatabaseError, transaction
+from django.db.models import Max
+from django.dispatch import receiver
+
+from . import models
+from . import portal_models
+from . import signals
+
+import logging
+
+logger = logging.getLogger(__name__)
+
+
+class ChangesUnavailable(Exception):
+    """Raised if the changes since a version cannot be exported"""
+
+
+def current_version():
+    """Return the version of the latest journal entry, 0 if none"""
+    return models.DataVersion.objects.filter(name='journal').values_list(
+        'version', flat=True).first() or 0
+
+
+def _write(entries):
+    """Write the entries with the versions after the current one"""
+    with transaction.atomic():
+        counter, _ = (models.DataVersion.objects.select_for_update()
+                      .get_or_create(name='journal'))
+        for version, entry in enumerate(entries, counter.version + 1):
+            entry.version = version
+        models.ChangeJournalEntry.objects.bulk_create(entries)
+        counter.version += len(entries)
+        counter.save(update_fields=['version', 'modified'])
+
+
+def _record(entries, kind):
+    """Write the entries, or a reset of ``kind`` if that fails"""
+    if not entries:
+        return
+    try:
+        _write(entries)
+    except DatabaseError:
+        logger.exception('Cannot journal %d change(s) of %s', len(entries),
+                         kind)
+        try:
+            _write([models.ChangeJournalEntry(action='reset_' + kind)])
+        except DatabaseError:
+            logger.exception('Cannot journal the reset of %s', kind)
+
+
+@receiver(signals.users_changed)
+def journal_users(sender, created, updated, deleted, reset, **kwargs):
+    entries = []
+    if reset:
+        entries.append(models.ChangeJournalEntry(action='reset_users'))
+    for action, users in (('create', created), ('update', updated)):
+        entries += [
+            models.ChangeJournalEntry(action=action, email=user.email,
+                                      name=user.name,
+                                      enabled=bool(user.enabled))
+            for user in users]
+    entries += [models.ChangeJournalEntry(action='delete', email=email)
+                for email in deleted]
+    _record(entries, 'users')
+
+
+@receiver(signals.authorities_changed)
+def journal_authorities(sender, granted, revoked, reset, **kwargs):
+    entries = []
+    if reset:
+        entries.append(models.ChangeJournalEntry(action='reset_authorities'))
+    for action, pairs in (('revoke', revoked), ('grant', granted)):
+        entries += [
+            models.ChangeJournalEntry(action=action, email=email,
+                                      authority=authority)
+            for email, authority in pairs]
+    _record(entries, 'authorities')
+
+
+def export_changes_to_yaml(since, chunk_size=None):
+    """Return iterator of YAML text with the changes after version
+    ``since``
+
+    Raises ChangesUnavailable if ``since`` is unknown or before the last
+    reset; a full export is needed then.
+    """
+    version = current_version()
+    if since < 0 or since > version:
+        raise ChangesUnavailable('Unknown version {}'.format(since))
+    last_reset = models.ChangeJournalEntry.objects.filter(
+        action__startswith='reset_').aggregate(
+            version=Max('version'))['version']
+    if last_reset is not None and last_reset > since:
+        raise ChangesUnavailable(
+            'All users or authorities were replaced in version {}'.format(
+                last_reset))
+    return _iter_changes_yaml(since, version, chunk_size)
+
+
+def _iter_changes_yaml(since, version, chunk_size):
+    yield 'version: {}\nsince: {}\n\nchanges:\n'.format(version, since)
+    entries = models.ChangeJournalEntry.objects.filter(
+        version__gt=since, version__lte=version).order_by(
+            'version').values_list(
+                'version', 'action', 'email', 'name', 'enabled',
+                'authority').iterator()
+    for chunk in portal_models.chunked(entries, chunk_size):
+        yield ''.join(_format_change(*entry) for entry in chunk)
+
+
+def _format_change(version, action, email, name, enabled, authority):
+    result = '- version: {}\n  action: {}\n  email: {}\n'.format(
+        version, action, repr(email))
+    if action in ('create', 'update'):
+        result += '  name: {}\n  enabled: {}\n'.format(repr(name), int(enabled))
+    elif action in ('grant', 'revoke'):
+        result += '  authority: {}\n'.format(repr(authority))
+    return result
@@ -0,0 +1,63 @@
+"""Report full scans of the DAO queries and missing portal indexes"""
+
+from django.core.management.base import BaseCommand
+from django.db import DatabaseError
+
+from ... import advisor
+
+
+class Command(BaseCommand):
+    help = ('Run EXPLAIN on the statements of the DAO methods against the '
+            'cbioportal database, report full table scans and the missing '
+            'recommended indexes.  Write statements run in a transaction '
+            'that is rolled back.')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--create', action='store_true',
+                            help='Create the missing indexes')
+
+    def handle(self, *args, **options):
+        self.stdout.write('Indexes')
+        self.stdout.write('=======')
+        for table in sorted({table for table, _ in advisor.RECOMMENDED_INDEXES}):
+            for name, columns in sorted(advisor.existing_indexes(table).items()):
+                self.stdout.write('{:12} {:30} ({})'.format(
+                    table, name, ', '.join(columns)))
+
+        self.stdout.write('\nQuery plans')
+        self.stdout.write('===========')
+        num_full_scans = 0
+        for name, statements in advisor.capture_dao_queries():
+            if not statements:
+                self.stdout.write('{:45} no statements to explain'.format(
+                    name))
+            for sql, params in statements:
+                try:
+                    rows = advisor.explain(sql, params)
+                except DatabaseError as e:
+                    self.stdout.write('{:45} cannot explain: {}'.format(
+                        name, e))
+                    continue
+                for row in rows:
+                    num_full_scans += row.full_scan
+                    self.stdout.write('{:45} {:12} {}{}'.format(
+                        name, row.table or '-', row.access,
+                        '  FULL SCAN' if row.full_scan else ''))
+        self.stdout.write('\n{} full table scans; scans of statements '
+                          'without a WHERE clause are expected.'.format(
+                              num_full_scans))
+
+        self.stdout.write('\nMissing indexes')
+        self.stdout.write('===============')
+        missing = advisor.missing_indexes()
+        for table, columns in missing:
+            sql = advisor.create_index_sql(table, columns)
+            if options['create']:
+                advisor.create_index(table, columns)
+                self.stdout.write('created: {}'.format(sql))
+            else:
+                self.stdout.write(sql)
+        if not missing:
+            self.stdout.write('none')
+        elif not options['create']:
+            self.stdout.write('\nRun with --create to create them.')
@@ -0,0 +1,89 @@
+"""Benchmark the DAO layer against a synthetic cBioPortal schema"""
+
+from django.core.management import call_command
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connections
+
+from ... import benchmark
+
+import datetime
+import json
+import platform
+import sys
+
+
+class Command(BaseCommand):
+    help = ('Create the portal tables on the cbioportal database, fill them '
+            'with synthetic data and time the DAO methods.  DROPS THE '
+            'EXISTING TABLES, use with the settings in '
+            'cbioportal_users.settings.benchmark.')
+
+    def add_arguments(self, parser):
+        defaults = benchmark.Volumes()
+        parser.add_argument('--users', type=int, default=defaults.users)
+        parser.add_argument('--studies', type=int, default=defaults.studies)
+        parser.add_argument('--groups', type=int, default=defaults.groups)
+        parser.add_argument('--authorities', type=int,
+                            default=defaults.authorities)
+        parser.add_argument('--seed', type=int, default=defaults.seed)
+        parser.add_argument('--repeat', type=int, default=5,
+                            help='Repetitions per benchmark case')
+        parser.add_argument('--only', action='append',
+                            help='Only run cases with this name prefix')
+        parser.add_argument('--no-populate', action='store_true',
+                            help='Reuse the existing synthetic tables')
+        parser.add_argument('--output', default='-',
+                            help='Path of the JSON results, "-" for stdout')
+        parser.add_argument('--allow-mysql', action='store_true',
+                            help='Allow running against a MySQL database')
+
+    def handle(self, *args, **options):
+        connection = connections['cbioportal']
+        if connection.vendor != 'sqlite' and not options['allow_mysql']:
+            raise CommandError(
+                'The cbioportal database is {}, not a SQLite stand-in; pass '
+                '--allow-mysql if it is a scratch database'.format(
+                    connection.vendor))
+        volumes = benchmark.Volumes(
+            users=options['users'], studies=options['studies'],
+            groups=options['groups'], authorities=options['authorities'],
+            seed=options['seed'])
+        if not options['no_populate']:
+            if volumes.users < 1 or volumes.studies < 1:
+                raise CommandError('At least one user and one study are '
+                                   'needed')
+            if volumes.authorities > volumes.max_authorities:
+                raise CommandError(
+                    'At most {} authorities can be generated for {} users, '
+                    '{} studies and {} groups'.format(
+                        volumes.max_authorities, volumes.users,
+                        volumes.studies, volumes.groups))
+        # The receivers of the DAO signals write to the default database,
+        # which is in memory with the benchmark settings
+        call_command('migrate', database='default', interactive=False,
+                     verbosity=0)
+        if not options['no_populate']:
+            self.stderr.write('Populating with {}'.format(volumes.to_dict()))
+            benchmark.create_schema()
+            benchmark.populate(volumes)
+        results = []
+        for result in benchmark.run_benchmarks(
+                options['repeat'], options['only']):
+            self.stderr.write('{name:50} {median:10.6f} s'.format(**result))
+            results.append(result)
+        report = {
+            'meta': {
+                'timestamp': datetime.datetime.now().isoformat(),
+                'vendor': connection.vendor,
+                'python': platform.python_version(),
+                'volumes': volumes.to_dict(),
+                'populated': not options['no_populate'],
+            },
+            'results': results,
+        }
+        if options['output'] == '-':
+            json.dump(report, sys.stdout, indent=2)
+            sys.stdout.write('\n')
+        else:
+            with open(options['output'], 'w') as f:
+                json.dump(report, f, indent=2)
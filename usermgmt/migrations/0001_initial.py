@@ -0,0 +1,31 @@
+# -*- coding: utf-8 -*-
+from __future__ import unicode_literals
+
+from django.db import migrations, models
+
+
+def create_data_versions(apps, schema_editor):
+    DataVersion = apps.get_model('usermgmt', 'DataVersion')
+    for name in ('users', 'authorities', 'studies'):
+        DataVersion.objects.get_or_create(name=name)
+
+
+class Migration(migrations.Migration):
+
+    initial = True
+
+    dependencies = [
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='DataVersion',
+            fields=[
+                ('name', models.CharField(max_length=32, primary_key=True, serialize=False)),
+                ('version', models.PositiveIntegerField(default=0)),
+                ('fingerprint', models.CharField(blank=True, default='', max_length=40)),
+                ('modified', models.DateTimeField(auto_now=True)),
+            ],
+        ),
+        migrations.RunPython(create_data_versions, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,26 @@
+# -*- coding: utf-8 -*-
+from __future__ import unicode_literals
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('usermgmt', '0001_initial'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ChangeJournalEntry',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('created', models.DateTimeField(auto_now_add=True)),
+                ('action', models.CharField(choices=[('create', 'create user'), ('update', 'update user'), ('delete', 'delete user'), ('grant', 'grant authority'), ('revoke', 'revoke authority'), ('reset_users', 'replace all users'), ('reset_authorities', 'replace all authorities')], max_length=32)),
+                ('email', models.CharField(blank=True, default='', max_length=128)),
+                ('name', models.CharField(blank=True, default='', max_length=255)),
+                ('enabled', models.NullBooleanField()),
+                ('authority', models.CharField(blank=True, default='', max_length=50)),
+            ],
+        ),
+    ]
@@ -0,0 +1,38 @@
+# -*- coding: utf-8 -*-
+from __future__ import unicode_literals
+
+from django.db import migrations, models
+from django.db.models import Max
+
+
+def copy_versions(apps, schema_editor):
+    ChangeJournalEntry = apps.get_model('usermgmt', 'ChangeJournalEntry')
+    DataVersion = apps.get_model('usermgmt', 'DataVersion')
+    for entry in ChangeJournalEntry.objects.all():
+        entry.version = entry.id
+        entry.save(update_fields=['version'])
+    version = ChangeJournalEntry.objects.aggregate(
+        version=Max('id'))['version'] or 0
+    DataVersion.objects.update_or_create(
+        name='journal', defaults={'version': version})
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('usermgmt', '0003_importjob'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='changejournalentry',
+            name='version',
+            field=models.PositiveIntegerField(null=True),
+        ),
+        migrations.RunPython(copy_versions, migrations.RunPython.noop),
+        migrations.AlterField(
+            model_name='changejournalentry',
+            name='version',
+            field=models.PositiveIntegerField(unique=True),
+        ),
+    ]
@@ -1,3 +1,164 @@
+from django.conf import settings
 from django.db import models
+from django.utils import timezone
 
-# Create your models here.
+import json
+
+
+class DataVersion(models.Model):
+    """Version counter of a kind of portal data
+
+    The counters live in the ``default`` database, so they are shared by all
+    processes.  They are incremented by the receivers in
+    ``usermgmt.versioning`` on each change.  The ``journal`` counter holds
+    the version of the latest ChangeJournalEntry, see ``usermgmt.journal``.
+    """
+
+    #: Kind of data, one of ``usermgmt.versioning.DATA_KINDS`` or
+    #: ``journal``
+    name = models.CharField(max_length=32, primary_key=True)
+    #: Incremented on each change
+    version = models.PositiveIntegerField(default=0)
+    #: Hash of the data, for data that is not changed through the DAOs
+    fingerprint = models.CharField(max_length=40, blank=True, default='')
+    #: Time of the last change
+    modified = models.DateTimeField(auto_now=True)
+
+    def __str__(self):
+        return 'DataVersion({}, {})'.format(self.name, self.version)
+
+
+class ChangeJournalEntry(models.Model):
+    """One change to the portal users or authorities made through the DAOs
+
+    The ``version`` is the version of the data after the change; see
+    ``usermgmt.journal``.
+    """
+
+    ACTION_CHOICES = (
+        ('create', 'create user'),
+        ('update', 'update user'),
+        ('delete', 'delete user'),
+        ('grant', 'grant authority'),
+        ('revoke', 'revoke authority'),
+        ('reset_users', 'replace all users'),
+        ('reset_authorities', 'replace all authorities'),
+    )
+
+    #: Version of the data after the change, allocated in commit order
+    version = models.PositiveIntegerField(unique=True)
+    #: Time of the change
+    created = models.DateTimeField(auto_now_add=True)
+    #: Kind of change
+    action = models.CharField(max_length=32, choices=ACTION_CHOICES)
+    #: Email of the user, empty for resets
+    email = models.CharField(max_length=128, blank=True, default='')
+    #: Name of the user, for ``create`` and ``update``
+    name = models.CharField(max_length=255, blank=True, default='')
+    #: Whether the user is enabled, for ``create`` and ``update``
+    enabled = models.NullBooleanField()
+    #: Authority, for ``grant`` and ``revoke``
+    authority = models.CharField(max_length=50, blank=True, default='')
+
+    def __str__(self):
+        return 'ChangeJournalEntry({}, {}, {})'.format(
+            self.version, self.action, self.email)
+
+
+class ImportJob(models.Model):
+    """Import of a YAML document run in the background
+
+    Created and run by ``usermgmt.jobs``; the counters are updated while the
+    job runs, so the status can be polled.
+    """
+
+    STATUS_PENDING = 'pending'
+    STATUS_RUNNING = 'running'
+    STATUS_SUCCEEDED = 'succeeded'
+    STATUS_FAILED = 'failed'
+
+    STATUS_CHOICES = (
+        (STATUS_PENDING, 'pending'),
+        (STATUS_RUNNING, 'running'),
+        (STATUS_SUCCEEDED, 'succeeded'),
+        (STATUS_FAILED, 'failed'),
+    )
+
+    #: Time of submission
+    created = models.DateTimeField(auto_now_add=True)
+    #: Time of the last status update
+    updated = models.DateTimeField(auto_now=True)
+    #: Time the job was started and finished
+    started = models.DateTimeField(null=True, blank=True)
+    finished = models.DateTimeField(null=True, blank=True)
+    #: User that submitted the job
+    user = models.ForeignKey(settings.AUTH_USER_MODEL, null=True, blank=True,
+                             on_delete=models.SET_NULL)
+    #: Name of the uploaded file and path of the copy that is imported
+    file_name = models.CharField(max_length=255)
+    path = models.CharField(max_length=512)
+    #: Import mode, see ``usermgmt.forms.ImportForm``
+    mode = models.CharField(max_length=16)
+    #: Whether only the planned changes are computed
+    dry_run = models.BooleanField(default=False)
+    #: Status of the job
+    status = models.CharField(max_length=16, choices=STATUS_CHOICES,
+                              default=STATUS_PENDING)
+    #: Section of the document being read
+    section = models.CharField(max_length=32, blank=True, default='')
+    #: Records read so far, in all sections
+    rows_processed = models.PositiveIntegerField(default=0)
+    #: Number of invalid records
+    num_errors = models.PositiveIntegerField(default=0)
+    #: JSON list of ``{"section", "number", "message"}``, capped at
+    #: ``settings.CBIOPORTAL_IMPORT_MAX_ERRORS``
+    errors = models.TextField(blank=True, default='[]')
+    #: Summary or error message
+    message = models.TextField(blank=True, default='')
+    #: JSON result of ``ImportStats.to_dict()`` or ``ImportPlan.to_dict()``
+    result = models.TextField(blank=True, default='')
+
+    @property
+    def is_finished(self):
+        return self.status in (self.STATUS_SUCCEEDED, self.STATUS_FAILED)
+
+    @property
+    def seconds(self):
+        """Run time so far or in total, ``None`` if not started"""
+        if self.started is None:
+            return None
+        return ((self.finished or timezone.now()) -
+                self.started).total_seconds()
+
+    @property
+    def rows_per_second(self):
+        seconds = self.seconds
+        return self.rows_processed / seconds if seconds else 0.0
+
+    def get_errors(self):
+        return json.loads(self.errors or '[]')
+
+    def get_result(self):
+        return json.loads(self.result) if self.result else None
+
+    def to_dict(self):
+        return {
+            'id': self.pk,
+            'file_name': self.file_name,
+            'mode': self.mode,
+            'dry_run': self.dry_run,
+            'status': self.status,
+            'finished': self.is_finished,
+            'section': self.section,
+            'rows_processed': self.rows_processed,
+            'seconds': self.seconds,
+            'rows_per_second': self.rows_per_second,
+            'num_errors': self.num_errors,
+            'errors': self.get_errors(),
+            'message': self.message,
+            'result': self.get_result(),
+        }
+
+    def __str__(self):
+        return 'ImportJob({}, {}, {})'.format(
+            self.pk, self.file_name, self.status)
@@ -0,0 +1,213 @@
+"""Connection pool for the database backends in ``usermgmt.backends``
+
+Each process keeps one ConnectionPool per database alias, so the limits
+apply per (gunicorn) worker.  The pool is configured with the ``POOL`` entry
+of the alias' ``DATABASES`` settings:
+
+``SIZE``
+    number of idle connections kept open (default 5)
+``MAX_OVERFLOW``
+    number of connections that may be opened beyond ``SIZE`` under load;
+    they are closed when returned (default 5)
+``TIMEOUT``
+    seconds to wait for a free connection before giving up (default 30)
+``RECYCLE``
+    seconds after which a connection is closed and replaced (default 3600)
+``PRE_PING``
+    check connections before handing them out (default ``True``)
+"""
+
+import collections
+import os
+import threading
+import time
+
+
+class PoolTimeout(Exception):
+    """Raised when no connection became free within the timeout"""
+
+
+class ConnectionPool:
+    """Thread-safe pool of raw DB-API connections
+
+    ``connect`` opens a new connection, ``ping`` raises if a connection is
+    not usable any more.
+    """
+
+    def __init__(self, connect, ping, size=5, max_overflow=5, timeout=30,
+                 recycle=3600, pre_ping=True):
+        self.connect = connect
+        self.ping = ping
+        self.size = size
+        self.max_overflow = max_overflow
+        self.timeout = timeout
+        self.recycle = recycle
+        self.pre_ping = pre_ping
+        #: ID of the process that owns the connections
+        self.pid = os.getpid()
+        self._cond = threading.Condition()
+        #: Idle connections with their creation time, most recent last
+        self._idle = collections.deque()
+        #: Creation time of all open connections, by ``id()``
+        self._created = {}
+        #: Number of connections being opened outside the lock
+        self._connecting = 0
+        #: Counters, see stats()
+        self.counters = collections.Counter()
+
+    def checkout(self):
+        """Return an open connection, waiting for one if necessary"""
+        deadline = time.monotonic() + self.timeout
+        with self._cond:
+            self._check_pid()
+            self.counters['checkouts'] += 1
+            if not self._idle and self._num_open() >= (
+                    self.size + self.max_overflow):
+                self.counters['waits'] += 1
+            while not self._idle and self._num_open() >= (
+                    self.size + self.max_overflow):
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    self.counters['timeouts'] += 1
+                    raise PoolTimeout(
+                        'No free connection within {} s'.format(self.timeout))
+                self._cond.wait(remaining)
+            if self._idle:
+                conn = self._idle.pop()
+                created = self._created[id(conn)]
+            else:
+                conn = None
+                self._connecting += 1
+        if conn is None:
+            return self._connect()
+        if self.recycle and time.monotonic() - created > self.recycle:
+            self.counters['recycled'] += 1
+            return self._replace(conn)
+        if self.pre_ping:
+            try:
+                self.ping(conn)
+            except Exception:
+                self.counters['ping_failures'] += 1
+                return self._replace(conn)
+        return conn
+
+    def checkin(self, conn):
+        """Return a connection to the pool"""
+        try:
+            conn.rollback()
+        except Exception:
+            usable = False
+        else:
+            usable = True
+        with self._cond:
+            if (usable and os.getpid() == self.pid and
+                    id(conn) in self._created and
+                    len(self._idle) < self.size):
+                self._idle.append(conn)
+            else:
+                self._discard(conn)
+            self._cond.notify()
+
+    def stats(self):
+        """Return ``dict`` with the pool size and counters"""
+        with self._cond:
+            result = dict(self.counters)
+            result.update({
+                'size': self.size,
+                'max_overflow': self.max_overflow,
+                'open': self._num_open(),
+                'idle': len(self._idle),
+                'in_use': self._num_open() - len(self._idle),
+            })
+            return result
+
+    def _num_open(self):
+        return len(self._created) + self._connecting
+
+    def _replace(self, conn):
+        """Close ``conn`` and open a new connection in its place"""
+        with self._cond:
+            self._discard(conn)
+            self._connecting += 1
+        return self._connect()
+
+    def _connect(self):
+        """Open a new connection in the slot reserved in ``_connecting``"""
+        try:
+            conn = self.connect()
+        except Exception:
+            with self._cond:
+                self._connecting -= 1
+                self._cond.notify()
+            raise
+        with self._cond:
+            self._connecting -= 1
+            self._created[id(conn)] = time.monotonic()
+            self.counters['connects'] += 1
+        return conn
+
+    def _discard(self, conn):
+        """Close connection and forget it, lock must be held"""
+        self._created.pop(id(conn), None)
+        try:
+            conn.close()
+        except Exception:
+            pass
+
+    def _check_pid(self):
+        """Forget connections inherited through fork(), lock must be held"""
+        if os.getpid() != self.pid:
+            self.pid = os.getpid()
+            self._idle.clear()
+            self._created.clear()
+            self._connecting = 0
+
+
+#: ConnectionPool objects by database alias
+_pools = {}
+_pools_lock = threading.Lock()
+
+
+def get_pool(alias, settings_dict, connect, ping):
+    """Return the pool for database ``alias``, creating it if necessary"""
+    with _pools_lock:
+        if alias not in _pools:
+            options = settings_dict.get('POOL', {})
+            _pools[alias] = ConnectionPool(
+                connect, ping,
+                size=options.get('SIZE', 5),
+                max_overflow=options.get('MAX_OVERFLOW', 5),
+                timeout=options.get('TIMEOUT', 30),
+                recycle=options.get('RECYCLE', 3600),
+                pre_ping=options.get('PRE_PING', True))
+        return _pools[alias]
+
+
+def all_stats():
+    """Return ``dict`` with the stats() of all pools by alias"""
+    with _pools_lock:
+        pools = dict(_pools)
+    return {alias: pool.stats() for alias, pool in pools.items()}
+
+
+class PooledDatabaseWrapperMixin:
+    """Mixin for Django's DatabaseWrapper classes that takes connections
+    from the ConnectionPool and returns them on close()"""
+
+    def ping_connection(self, conn):
+        conn.cursor().execute('SELECT 1')
+
+    def get_pool(self, conn_params):
+        return get_pool(
+            self.alias, self.settings_dict,
+            lambda: super(PooledDatabaseWrapperMixin, self).get_new_connection(
+                conn_params),
+            self.ping_connection)
+
+    def get_new_connection(self, conn_params):
+        return self.get_pool(conn_params).checkout()
+
+    def _close(self):
+        if self.connection is not None:
+            with self.wrap_database_errors:
+                _pools[self.alias].checkin(self.connection)
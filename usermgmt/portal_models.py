@@ -1,21 +1,146 @@
-from django.db import connections
+from django.conf import settings
+from django.db import IntegrityError, connections, transaction
+from django.dispatch import receiver
 
-import functools
+import bisect
+import hashlib
+import itertools
+import threading
+import time
 
 import yaml
 
+from . import signals
 
-def dictfetchall(cursor):
-    "Return all rows from a cursor as a dict"
-    columns = [col[0] for col in cursor.description]
-    return [dict(zip(columns, row)) for row in cursor.fetchall()]
+
+def fetchall_as(cursor, klass):
+    """Return all rows from a cursor as ``klass`` objects, constructed
+    directly from the row tuples"""
+    return list(itertools.starmap(klass, cursor.fetchall()))
+
+
+def iter_rows(sql, params=None, chunk_size=None):
+    """Yield the result rows of ``sql`` on the cbioportal connection as
+    tuples without buffering the whole result set
+
+    On MySQL, an unbuffered server-side cursor is used, so only
+    ``chunk_size`` rows are held in memory at any time.  No other query may
+    be run on the connection until the generator is exhausted or closed.
+    """
+    connection = connections['cbioportal']
+    if connection.vendor == 'mysql':
+        import MySQLdb.cursors
+        connection.ensure_connection()
+        cursor = connection.make_cursor(
+            connection.connection.cursor(MySQLdb.cursors.SSCursor))
+    else:
+        cursor = connection.cursor()
+    chunk_size = chunk_size or settings.CBIOPORTAL_IMPORT_CHUNK_SIZE
+    try:
+        cursor.execute(sql, params)
+        while True:
+            rows = cursor.fetchmany(chunk_size)
+            if not rows:
+                return
+            yield from rows
+    finally:
+        cursor.close()
+
+
+def authority_key(authority):
+    """Return upper-case key of authority column value or identifier"""
+    if authority.lower().startswith('cbioportal:'):
+        authority = authority[len('cbioportal:'):]
+    return authority.strip().upper()
+
+
+def authority_value(identifier):
+    """Return the normalized ``authorities.authority`` value for a study
+    identifier, group name or ``ALL``
+
+    All writes store this form, so lookups compare column values with
+    plain equality and can use an index on the column.
+    """
+    return 'cbioportal:' + authority_key(identifier)
+
+
+def pair_key(pair):
+    """Return ``(email, authority_key(authority))`` of an ``(email,
+    authority)`` row, for comparing rows like the portal's collation"""
+    email, authority = pair
+    return email, authority_key(authority)
+
+
+class NotFound(Exception):
+    """Raised if the user, study or group to write does not exist"""
+
+
+class AlreadyExists(Exception):
+    """Raised if the user to create exists already"""
+
+
+def _for_update(sql):
+    """Append ``FOR UPDATE`` to ``sql`` if the cbioportal database supports
+    it (SQLite does not, but serializes writers anyway)"""
+    if connections['cbioportal'].features.has_select_for_update:
+        return sql + ' FOR UPDATE'
+    return sql
+
+
+def _send_on_commit(signal, sender, **kwargs):
+    """Send ``signal`` once the current cbioportal transaction commits"""
+    transaction.on_commit(
+        lambda: signal.send(sender=sender, **kwargs), using='cbioportal')
+
+
+def _users_changed(sender, created=(), updated=(), deleted=(), reset=False):
+    _send_on_commit(signals.users_changed, sender, created=list(created),
+                    updated=list(updated), deleted=list(deleted), reset=reset)
+
+
+def _authorities_changed(sender, granted=(), revoked=(), reset=False):
+    _send_on_commit(signals.authorities_changed, sender,
+                    granted=list(granted), revoked=list(revoked), reset=reset)
+
+
+def chunked(iterable, chunk_size=None):
+    """Yield lists of at most ``chunk_size`` items from ``iterable``
+
+    ``chunk_size`` defaults to ``settings.CBIOPORTAL_IMPORT_CHUNK_SIZE``.
+    """
+    chunk_size = chunk_size or settings.CBIOPORTAL_IMPORT_CHUNK_SIZE
+    iterator = iter(iterable)
+    while True:
+        chunk = list(itertools.islice(iterator, chunk_size))
+        if not chunk:
+            return
+        yield chunk
+
+
+def parse_groups(value):
+    """Return sorted ``list`` of the group names in a ``;``-separated
+    ``cancer_study.groups`` value
+
+    Names are stripped, empty names are dropped and of names that only
+    differ in case, the first one is kept.
+    """
+    names = {}
+    for name in (value or '').split(';'):
+        name = name.strip()
+        if name:
+            names.setdefault(authority_key(name), name)
+    return sorted(names.values())
 
 
 class DbStudyGroup:
     """Representation of a group in the portal database"""
 
-    def __init__(self, name):
+    __slots__ = ('name', 'studies')
+
+    def __init__(self, name, studies=None):
         self.name = name
+        #: ``list`` of the DbStudy objects in the group, sorted by identifier
+        self.studies = [] if studies is None else studies
 
     def __eq__(self, other):
         return self.name == other.name
@@ -39,31 +164,31 @@ class DaoStudyGroup:
 
     @classmethod
     def all_groups(klass):
-        result = []
-        cursor = connections['cbioportal'].cursor()
-        cursor.execute('SELECT groups FROM cancer_study')
-        for res in dictfetchall(cursor):
-            for group in res['groups'].split(';'):
-                result.append(DbStudyGroup(group.strip()))
-        return set(result)
+        return set(DaoStudyCatalog.get().groups.values())
 
     @classmethod
     def num_groups(klass):
-        return len(klass.all_groups())
+        return len(DaoStudyCatalog.get().groups)
 
     @classmethod
     def exists(klass, name):
-        return DbStudyGroup(name) in klass.all_groups()
+        return authority_key(name) in DaoStudyCatalog.get().groups_by_key
 
     @classmethod
     def get(klass, name):
-        assert klass.exists(name)
-        return DbStudyGroup(name)
+        """Return the DbStudyGroup with its studies, the name is compared
+        case-insensitively; raise NotFound if there is no such group"""
+        group = DaoStudyCatalog.get().groups_by_key.get(authority_key(name))
+        if group is None:
+            raise NotFound('No such group found!')
+        return group
 
 
 class DbUser:
     """Represents a user in the database"""
 
+    __slots__ = ('email', 'name', 'enabled')
+
     def __init__(self, email, name, enabled):
         #: Email of user, identifier
         self.email = email
@@ -93,44 +218,132 @@ class DbUser:
             repr, [self.name, self.email, self.enabled])))
 
 
+class DbUserPage:
+    """One page of DbUser objects from keyset pagination"""
+
+    def __init__(self, users, has_previous, has_next):
+        #: ``list`` of DbUser objects, ordered by email
+        self.users = users
+        #: Whether there are users before the first one
+        self.has_previous = has_previous
+        #: Whether there are users after the last one
+        self.has_next = has_next
+
+    @property
+    def first_email(self):
+        return self.users[0].email if self.users else None
+
+    @property
+    def last_email(self):
+        return self.users[-1].email if self.users else None
+
+    def __iter__(self):
+        return iter(self.users)
+
+    def __len__(self):
+        return len(self.users)
+
+
 class DaoUser:
     """Helper for getting user-related information from the portal
     """
 
     @classmethod
-    def import_users(klass, users):
+    def import_users(klass, users, chunk_size=None):
+        """Replace all users by the given ones, return number of rows"""
         cursor = connections['cbioportal'].cursor()
         cursor.execute('DELETE FROM users')
-        for user in users:
-            cursor.execute(r"""
+        count = 0
+        for chunk in chunked(users, chunk_size):
+            cursor.executemany(r"""
                 INSERT INTO users (email, name, enabled)
                 VALUES (%s, %s, %s)""",
-                [user['email'], user['name'], int(user['enabled'])])
+                [[user['email'], user['name'], int(user['enabled'])]
+                 for user in chunk])
+            count += len(chunk)
+        _users_changed(klass, reset=True)
+        return count
 
     @classmethod
     def all_users(klass):
-        result = []
         cursor = connections['cbioportal'].cursor()
         cursor.execute('SELECT email, name, enabled FROM users ORDER BY email')
-        for res in dictfetchall(cursor):
-            result.append(DbUser(res['email'], res['name'], res['enabled']))
-        return result
+        return fetchall_as(cursor, DbUser)
+
+    @classmethod
+    def page_users(klass, limit, after=None, before=None, query=None):
+        """Return DbUserPage with up to ``limit`` users ordered by email
+
+        Paging uses the email as keyset cursor: the page starts after the
+        email ``after`` or ends before the email ``before``.  ``query``
+        restricts the users to those whose email or name starts with it.
+        """
+        connection = connections['cbioportal']
+        conditions, params = [], []
+        if after is not None:
+            conditions.append('email > %s')
+            params.append(after)
+        elif before is not None:
+            conditions.append('email < %s')
+            params.append(before)
+        if query:
+            like = connection.operators['istartswith']
+            conditions.append('(email {} OR name {})'.format(like, like))
+            params += [connection.ops.prep_for_like_query(query) + '%'] * 2
+        cursor = connection.cursor()
+        cursor.execute(r"""
+            SELECT email, name, enabled
+            FROM users
+            {}
+            ORDER BY email {}
+            LIMIT %s""".format(
+                'WHERE ' + ' AND '.join(conditions) if conditions else '',
+                'DESC' if after is None and before is not None else 'ASC'),
+            params + [limit + 1])
+        users = fetchall_as(cursor, DbUser)
+        has_more = len(users) > limit
+        users = users[:limit]
+        if after is None and before is not None:
+            return DbUserPage(list(reversed(users)), has_more, True)
+        else:
+            return DbUserPage(users, after is not None, has_more)
 
     @classmethod
     def with_direct_access_to(klass, identifier):
         """Return DbUser objects with direct access to authority"""
-        result = []
-        val = 'cbioportal:' + identifier.upper()
+        return klass.with_direct_access_to_many([identifier])[identifier]
+
+    @classmethod
+    def with_direct_access_to_many(klass, identifiers):
+        """Return ``dict`` mapping each of the given authority identifiers
+        to the list of DbUser objects with direct access to it
+
+        All identifiers are resolved with one query, regardless of their
+        number.
+        """
+        result = {identifier: [] for identifier in identifiers}
+        if not result:
+            return result
+        # Rows written by other tools may not be normalized; the portal's
+        # collation compares case-insensitively, so match the returned rows
+        # up by their key.
+        by_key = {}
+        for identifier in result:
+            by_key.setdefault(authority_key(identifier), []).append(identifier)
+        values = [authority_value(key) for key in by_key]
         cursor = connections['cbioportal'].cursor()
         cursor.execute("""
-            SELECT DISTINCT users.email, name, enabled
+            SELECT DISTINCT authorities.authority, users.email, name, enabled
             FROM users
             INNER JOIN authorities
             ON authorities.email = users.email
-            WHERE authorities.authority = %s
-            ORDER BY email""", [val])
-        for res in dictfetchall(cursor):
-            result.append(DbUser(res['email'], res['name'], res['enabled']))
+            WHERE authorities.authority IN ({})
+            ORDER BY users.email""".format(', '.join(['%s'] * len(values))),
+            values)
+        for authority, email, name, enabled in cursor.fetchall():
+            user = DbUser(email, name, enabled)
+            for identifier in by_key.get(authority_key(authority), []):
+                result[identifier].append(user)
         return result
 
     @classmethod
@@ -139,6 +352,31 @@ class DaoUser:
         cursor.execute('SELECT COUNT(*) FROM users WHERE email = %s', [email])
         return cursor.fetchone()[0]
 
+    @classmethod
+    def get_users(klass, emails, chunk_size=None):
+        """Return DbUser objects for those of the given emails that have a
+        user, ordered by email"""
+        result = []
+        cursor = connections['cbioportal'].cursor()
+        for chunk in chunked(emails, chunk_size):
+            cursor.execute(
+                'SELECT email, name, enabled FROM users WHERE email IN ({})'
+                .format(', '.join(['%s'] * len(chunk))), chunk)
+            result += fetchall_as(cursor, DbUser)
+        return sorted(result)
+
+    @classmethod
+    def existing_emails(klass, emails, chunk_size=None):
+        """Return ``set`` of those of the given emails that have a user"""
+        result = set()
+        cursor = connections['cbioportal'].cursor()
+        for chunk in chunked(emails, chunk_size):
+            cursor.execute(
+                'SELECT email FROM users WHERE email IN ({})'.format(
+                    ', '.join(['%s'] * len(chunk))), chunk)
+            result |= {row[0] for row in cursor.fetchall()}
+        return result
+
     @classmethod
     def num_users(klass):
         cursor = connections['cbioportal'].cursor()
@@ -147,41 +385,132 @@ class DaoUser:
 
     @classmethod
     def create_user(klass, email, name, enabled):
-        cursor = connections['cbioportal'].cursor()
-        cursor.execute('INSERT INTO users (email, name, enabled) VALUES (%s, %s, %s)',
-                       [email, name, int(enabled)])
+        """Insert the user, raise AlreadyExists if the email is taken"""
+        try:
+            with transaction.atomic(using='cbioportal'):
+                cursor = connections['cbioportal'].cursor()
+                cursor.execute('INSERT INTO users (email, name, enabled) VALUES (%s, %s, %s)',
+                               [email, name, int(enabled)])
+        except IntegrityError:
+            raise AlreadyExists('User already exists!')
+        _users_changed(klass, created=[DbUser(email, name, enabled)])
 
     @classmethod
     def update_user(klass, email, name, enabled):
+        """Update the user, raise NotFound if there is no such user"""
         cursor = connections['cbioportal'].cursor()
         cursor.execute('UPDATE users SET name = %s, enabled = %s WHERE email = %s',
                        [name, int(enabled), email])
+        # Django's MySQL backend counts matched (not changed) rows
+        if not cursor.rowcount:
+            raise NotFound('No such user found!')
+        _users_changed(klass, updated=[DbUser(email, name, enabled)])
 
     @classmethod
     def delete_user(klass, email):
+        """Delete the user, raise NotFound if there is no such user"""
         cursor = connections['cbioportal'].cursor()
         cursor.execute('DELETE FROM users WHERE email = %s', [email])
+        if not cursor.rowcount:
+            raise NotFound('No such user found!')
+        _users_changed(klass, deleted=[email])
+
+    @classmethod
+    def create_users(klass, users, chunk_size=None):
+        """Insert the given DbUser objects with multi-row inserts"""
+        users = list(users)
+        cursor = connections['cbioportal'].cursor()
+        for chunk in chunked(users, chunk_size):
+            cursor.executemany(r"""
+                INSERT INTO users (email, name, enabled)
+                VALUES (%s, %s, %s)""",
+                [[user.email, user.name, int(user.enabled)] for user in chunk])
+        if users:
+            _users_changed(klass, created=users)
+
+    @classmethod
+    def update_users(klass, users, chunk_size=None):
+        """Write name and enabled flag of the given DbUser objects with one
+        ``UPDATE ... CASE`` statement per chunk"""
+        users = list(users)
+        if not users:
+            return
+        cursor = connections['cbioportal'].cursor()
+        for chunk in chunked(users, chunk_size):
+            cases = ' '.join(['WHEN %s THEN %s'] * len(chunk))
+            cursor.execute(r"""
+                UPDATE users
+                SET name = CASE email {} END,
+                    enabled = CASE email {} END
+                WHERE email IN ({})""".format(
+                    cases, cases, ', '.join(['%s'] * len(chunk))),
+                [value for user in chunk
+                 for value in (user.email, user.name)] +
+                [value for user in chunk
+                 for value in (user.email, int(user.enabled))] +
+                [user.email for user in chunk])
+        _users_changed(klass, updated=users)
+
+    @classmethod
+    def upsert_users(klass, created, updated, chunk_size=None):
+        """Insert the ``created`` and update the ``updated`` DbUser objects
+        with one multi-row ``INSERT ... ON DUPLICATE KEY UPDATE`` (``ON
+        CONFLICT`` on SQLite) per chunk
+
+        Users created or deleted concurrently by others are updated or
+        created instead of failing.
+        """
+        created, updated = list(created), list(updated)
+        if connections['cbioportal'].vendor == 'mysql':
+            upsert = r"""
+                ON DUPLICATE KEY UPDATE
+                    name = VALUES(name), enabled = VALUES(enabled)"""
+        else:
+            upsert = r"""
+                ON CONFLICT (email) DO UPDATE
+                SET name = excluded.name, enabled = excluded.enabled"""
+        cursor = connections['cbioportal'].cursor()
+        for chunk in chunked(created + updated, chunk_size):
+            cursor.executemany(r"""
+                INSERT INTO users (email, name, enabled)
+                VALUES (%s, %s, %s)""" + upsert,
+                [[user.email, user.name, int(user.enabled)] for user in chunk])
+        if created or updated:
+            _users_changed(klass, created=created, updated=updated)
+
+    @classmethod
+    def delete_users(klass, emails, chunk_size=None):
+        """Delete the users with the given emails"""
+        emails = list(emails)
+        cursor = connections['cbioportal'].cursor()
+        for chunk in chunked(emails, chunk_size):
+            cursor.execute(
+                'DELETE FROM users WHERE email IN ({})'.format(
+                    ', '.join(['%s'] * len(chunk))), chunk)
+        if emails:
+            _users_changed(klass, deleted=emails)
 
     @classmethod
     def get_user(klass, email):
         cursor = connections['cbioportal'].cursor()
         cursor.execute('SELECT email, name, enabled FROM users WHERE email = %s', [email]);
-        res = dictfetchall(cursor)
+        res = fetchall_as(cursor, DbUser)
         if len(res) != 1:
-            raise Exception('No such user found!')
-        res = res[0]
-        return DbUser(res['email'], res['name'], res['enabled'])
+            raise NotFound('No such user found!')
+        return res[0]
 
 
 class DbStudy:
     """Representation of a study in the portal (read-only)"""
-    
+
+    __slots__ = ('identifier', 'name', 'groups')
+
     def __init__(self, identifier, name, groups):
         #: Unique identifier, upper case is used in authorities table
         self.identifier = identifier
         #: Title of the study, for clearer identification only
         self.name = name
-        #: ``set`` of the groups that the study is in
+        #: Sorted ``list`` of the names of the groups that the study is in
         self.groups = list(sorted(groups))
 
     def __eq__(self, other):
@@ -204,65 +533,264 @@ class DaoStudy:
 
     @classmethod
     def all_studies(self):
-        result = []
-        cursor = connections['cbioportal'].cursor()
-        cursor.execute(r"""
-            SELECT cancer_study_identifier, name, groups
-            FROM cancer_study
-            ORDER BY cancer_study_identifier""")
-        for res in dictfetchall(cursor):
-            result.append(DbStudy(res['cancer_study_identifier'],
-                                  res['name'],
-                                  res['groups'].split(';')))
-        return result
+        return list(DaoStudyCatalog.get().studies)
 
     @classmethod
     def get(self, identifier):
-        result = []
+        """Return the DbStudy, raise NotFound if there is no such study"""
+        study = DaoStudyCatalog.get().studies_by_key.get(
+            authority_key(identifier))
+        if study is None:
+            raise NotFound('No such study found!')
+        return study
+
+    @classmethod
+    def num_studies(self):
+        return len(DaoStudyCatalog.get().studies)
+
+    @classmethod
+    def exists(self, identifier):
+        return authority_key(identifier) in DaoStudyCatalog.get().studies_by_key
+
+
+class DbStudyCatalog:
+    """Snapshot of the studies and groups in the portal (read-only)"""
+
+    def __init__(self, version, studies, fingerprint=''):
+        #: Number of the load that produced this snapshot
+        self.version = version
+        #: SHA1 hex digest of the ``cancer_study`` rows, changes when the
+        #: studies are changed in the portal
+        self.fingerprint = fingerprint
+        #: ``list`` of all DbStudy objects, sorted by identifier
+        self.studies = studies
+        #: ``dict`` mapping authority_key() of study identifier to DbStudy
+        self.studies_by_key = {
+            authority_key(study.identifier): study for study in studies}
+        #: ``dict`` mapping authority_key() of group name to DbStudyGroup;
+        #: this is the index from groups to their studies
+        self.groups_by_key = {}
+        for study in studies:
+            for name in study.groups:
+                key = authority_key(name)
+                if key not in self.groups_by_key:
+                    self.groups_by_key[key] = DbStudyGroup(name)
+                self.groups_by_key[key].studies.append(study)
+        #: ``dict`` mapping group name to DbStudyGroup
+        self.groups = {
+            group.name: group for group in self.groups_by_key.values()}
+        #: Sorted ``list`` of all authority keys, for prefix search
+        self.authority_keys = sorted(
+            {'ALL'} | set(self.studies_by_key) | set(self.groups_by_key))
+
+    def search_authority_keys(self, prefix, offset, limit):
+        """Return up to ``limit`` authority keys starting with ``prefix``
+        after skipping ``offset`` matches, and whether there are more"""
+        prefix = prefix.upper()
+        start = bisect.bisect_left(self.authority_keys, prefix) + offset
+        keys = [key for key in self.authority_keys[start:start + limit + 1]
+                if key.startswith(prefix)]
+        return keys[:limit], len(keys) > limit
+
+    def __str__(self):
+        return 'DbStudyCatalog({}, {} studies, {} groups)'.format(
+            self.version, len(self.studies), len(self.groups))
+
+
+class DaoStudyCatalog:
+    """In-process cache of the studies and groups in the portal
+
+    The whole catalog is loaded with one query and kept for
+    ``settings.CBIOPORTAL_CATALOG_TTL`` seconds, or until ``refresh()`` or
+    ``invalidate()`` is called.  ``hits`` and ``misses`` count the lookups
+    served from memory and from the portal database, respectively.
+    """
+
+    _lock = threading.Lock()
+    _catalog = None
+    _expires = 0
+    #: Number of loads from the database so far
+    version = 0
+    #: Number of lookups served from the cached catalog
+    hits = 0
+    #: Number of lookups that had to load the catalog from the database
+    misses = 0
+
+    @classmethod
+    def get(klass):
+        """Return the current DbStudyCatalog, loading it if stale"""
+        with klass._lock:
+            if klass._catalog is None or time.monotonic() >= klass._expires:
+                klass.misses += 1
+                klass._load()
+            else:
+                klass.hits += 1
+            return klass._catalog
+
+    @classmethod
+    def refresh(klass):
+        """Reload the catalog from the database and return it"""
+        with klass._lock:
+            klass.misses += 1
+            klass._load()
+            return klass._catalog
+
+    @classmethod
+    def invalidate(klass):
+        """Drop the cached catalog, the next lookup will reload it"""
+        with klass._lock:
+            klass._catalog = None
+
+    @classmethod
+    def stats(klass):
+        """Return ``dict`` with the cache counters"""
+        with klass._lock:
+            return {
+                'version': klass.version,
+                'hits': klass.hits,
+                'misses': klass.misses,
+                'loaded': klass._catalog is not None,
+            }
+
+    @classmethod
+    def _load(klass):
+        studies = []
         cursor = connections['cbioportal'].cursor()
         cursor.execute(r"""
             SELECT cancer_study_identifier, name, groups
             FROM cancer_study
-            WHERE cancer_study_identifier = %s
-            ORDER BY cancer_study_identifier""", [identifier])
-        for res in dictfetchall(cursor):
-            return DbStudy(res['cancer_study_identifier'],
-                           res['name'],
-                           res['groups'].split(';'))
-        return result
+            ORDER BY cancer_study_identifier""")
+        digest = hashlib.sha1()
+        for identifier, name, groups in cursor.fetchall():
+            digest.update(repr((identifier, name, groups)).encode('utf-8'))
+            studies.append(DbStudy(identifier, name, parse_groups(groups)))
+        klass.version += 1
+        klass._catalog = DbStudyCatalog(
+            klass.version, studies, digest.hexdigest())
+        klass._expires = time.monotonic() + settings.CBIOPORTAL_CATALOG_TTL
+        signals.catalog_loaded.send(sender=klass, catalog=klass._catalog)
+
+
+class DbStatistics:
+    """Snapshot of the counters shown on the dashboard"""
+
+    def __init__(self, totals, authority_counts, catalog):
+        #: Number of users
+        self.num_users = totals.get('users', 0)
+        #: Number of disabled users
+        self.num_disabled_users = totals.get('disabled_users', 0)
+        #: Number of studies
+        self.num_studies = totals.get('studies', 0)
+        #: Number of study groups
+        self.num_study_groups = len(catalog.groups)
+        #: Number of authority rows
+        self.num_authorities = totals.get('authorities', 0)
+        counts = {}
+        for authority, count in authority_counts.items():
+            key = authority_key(authority)
+            counts[key] = counts.get(key, 0) + count
+        #: Number of users with access to ALL studies
+        self.num_all_access = counts.get('ALL', 0)
+        #: ``list`` of ``(DbStudy, count)`` with the number of direct
+        #: authorities per study, most authorities first
+        self.authorities_per_study = sorted(
+            ((study, counts.get(key, 0))
+             for key, study in catalog.studies_by_key.items()),
+            key=lambda x: (-x[1], x[0].identifier))
+        #: Number of authorities that neither refer to a study, a group, nor
+        #: to ALL
+        self.num_orphaned_authorities = sum(
+            count for key, count in counts.items()
+            if key != 'ALL' and key not in catalog.studies_by_key and
+            key not in catalog.groups_by_key)
+
+    @property
+    def mean_authorities_per_study(self):
+        if not self.authorities_per_study:
+            return 0.0
+        return (sum(count for _, count in self.authorities_per_study) /
+                len(self.authorities_per_study))
+
+
+class DaoStatistics:
+    """Cache for DbStatistics
+
+    All counters are computed with one query and kept for
+    ``settings.CBIOPORTAL_STATISTICS_TTL`` seconds, or until the users or
+    authorities are written through this app.
+    """
+
+    _lock = threading.Lock()
+    _statistics = None
+    _expires = 0
 
     @classmethod
-    def num_studies(self):
-        cursor = connections['cbioportal'].cursor()
-        cursor.execute('SELECT COUNT(*) FROM cancer_study');
-        return cursor.fetchone()[0]
+    def get(klass):
+        with klass._lock:
+            if (klass._statistics is None or
+                    time.monotonic() >= klass._expires):
+                klass._statistics = klass._load()
+                klass._expires = (time.monotonic() +
+                                  settings.CBIOPORTAL_STATISTICS_TTL)
+            return klass._statistics
 
     @classmethod
-    def exists(self, identifier):
+    def invalidate(klass):
+        with klass._lock:
+            klass._statistics = None
+
+    @classmethod
+    def _load(klass):
+        totals, authority_counts = {}, {}
         cursor = connections['cbioportal'].cursor()
         cursor.execute(r"""
-            SELECT COUNT(*)
-            FROM cancer_study
-            WHERE UPPER(cancer_study_identifier) = UPPER(%s)
-            """, [identifier]);
-        return cursor.fetchone()[0] > 0
+            SELECT 'total', 'users', COUNT(*) FROM users
+            UNION ALL
+            SELECT 'total', 'disabled_users', COUNT(*) FROM users
+            WHERE enabled = 0
+            UNION ALL
+            SELECT 'total', 'studies', COUNT(*) FROM cancer_study
+            UNION ALL
+            SELECT 'total', 'authorities', COUNT(*) FROM authorities
+            UNION ALL
+            SELECT 'authority', authority, COUNT(*) FROM authorities
+            GROUP BY authority""")
+        for kind, key, count in cursor.fetchall():
+            if kind == 'total':
+                totals[key] = count
+            else:
+                authority_counts[key] = count
+        return DbStatistics(totals, authority_counts, DaoStudyCatalog.get())
+
+
+@receiver(signals.users_changed)
+@receiver(signals.authorities_changed)
+def invalidate_statistics(sender, **kwargs):
+    DaoStatistics.invalidate()
 
 
 class DbAuthority:
     """Represents the access to a study or a group"""
-    
-    def __init__(self, authority, email):
+
+    __slots__ = ('authority', 'email', 'kind')
+
+    #: Values of ``kind``
+    STUDY, GROUP, ALL, ORPHANED = 'study', 'group', 'all', 'orphaned'
+
+    def __init__(self, authority, email, kind=None):
         self.authority = authority
         if self.authority.startswith('cbioportal:'):
             self.authority = self.authority[len('cbioportal:'):]
         self.email = email
+        #: What the authority refers to, set by DaoAuthority.classify()
+        self.kind = kind
 
     @property
-    @functools.lru_cache()
     def is_for_study(self):
         """Return True if authority is for a study"""
-        return DaoStudy.exists(self.authority)
-
+        if self.kind is None:
+            DaoAuthority.classify([self])
+        return self.kind == DbAuthority.STUDY
 
     def __eq__(self, other):
         return (self.authority == other.authority and
@@ -281,6 +809,41 @@ class DbAuthority:
             repr, [self.authority, self.email])))
 
 
+class BulkPreview:
+    """Row counts of granting or revoking a cross product of users and
+    authorities, see DaoAuthority.preview_bulk()"""
+
+    def __init__(self, num_users, num_authorities, num_existing,
+                 num_existing_rows):
+        #: Number of distinct users
+        self.num_users = num_users
+        #: Number of distinct authorities
+        self.num_authorities = num_authorities
+        #: Number of distinct ``(email, authority)`` pairs that exist
+        self.num_existing = num_existing
+        #: Number of rows of these pairs, may be larger for duplicate rows
+        self.num_existing_rows = num_existing_rows
+
+    @property
+    def num_pairs(self):
+        return self.num_users * self.num_authorities
+
+    @property
+    def num_to_grant(self):
+        """Number of rows inserted by a grant, if all users exist"""
+        return self.num_pairs - self.num_existing
+
+    @property
+    def num_to_revoke(self):
+        """Number of rows deleted by a revoke"""
+        return self.num_existing_rows
+
+    def __str__(self):
+        return ('{} users x {} authorities: {} to grant, {} to '
+                'revoke').format(self.num_users, self.num_authorities,
+                                 self.num_to_grant, self.num_to_revoke)
+
+
 class DaoAuthority:
     """Helper for accessing DbAuthority objects"""
 
@@ -288,75 +851,651 @@ class DaoAuthority:
     def all_authorities(klass):
         cursor = connections['cbioportal'].cursor()
         cursor.execute(r"""
-            SELECT email, authority
+            SELECT authority, email
             FROM authorities
             ORDER BY email""")
-        # Add new authorities
-        result = []
-        for res in dictfetchall(cursor):
-            result.append(DbAuthority(res['email'], res['authority']))
-        return result
+        return klass.classify(fetchall_as(cursor, DbAuthority))
 
     @classmethod
-    def update_authorities_for_user(klass, email, authorities):
-        # Remove old authorities
-        cursor = connections['cbioportal'].cursor()
-        cursor.execute(r"""
-            DELETE FROM authorities
-            WHERE email = %s""", [email])
-        # Add new authorities
+    def classify(klass, authorities):
+        """Set ``kind`` of the given DbAuthority objects from the study
+        catalog, without further queries, and return them"""
+        catalog = DaoStudyCatalog.get()
         for authority in authorities:
-            cursor.execute(r"""
-                INSERT INTO authorities (email, authority)
-                VALUE (%s, %s)""",
-                [email, 'cbioportal:' + authority.upper()])
+            key = authority_key(authority.authority)
+            if key == 'ALL':
+                authority.kind = DbAuthority.ALL
+            elif key in catalog.studies_by_key:
+                authority.kind = DbAuthority.STUDY
+            elif key in catalog.groups_by_key:
+                authority.kind = DbAuthority.GROUP
+            else:
+                authority.kind = DbAuthority.ORPHANED
+        return authorities
+
+    @classmethod
+    def update_authorities_for_user(klass, email, authorities):
+        """Set the authorities of the user, raise NotFound if there is no
+        such user
+
+        The user row is locked and the current authorities are loaded with
+        the same statement.
+        """
+        with transaction.atomic(using='cbioportal'):
+            cursor = connections['cbioportal'].cursor()
+            cursor.execute(_for_update(r"""
+                SELECT authorities.email, authorities.authority
+                FROM users
+                LEFT OUTER JOIN authorities
+                ON authorities.email = users.email
+                WHERE users.email = %s"""), [email])
+            rows = cursor.fetchall()
+            if not rows:
+                raise NotFound('No such user found!')
+            klass._apply_delta(
+                [row for row in rows if row[0] is not None],
+                [(email, authority_value(authority))
+                 for authority in authorities])
 
     @classmethod
     def update_authorities_for_study(klass, identifier, emails):
-        # Remove old authorities
-        cursor = connections['cbioportal'].cursor()
-        cursor.execute(r"""
-            DELETE FROM authorities
-            WHERE authority = %s
-            """, ['cbioportal:' + identifier.upper()])
-        # Add new authorities
-        for email in emails:
+        """Set the users with direct access to the study, raise NotFound
+        if there is no such study"""
+        if not DaoStudy.exists(identifier):
+            raise NotFound('No such study found!')
+        klass._update_authorities_for(identifier, emails)
+
+    @classmethod
+    def _update_authorities_for(klass, identifier, emails):
+        """Set the users with the authority for ``identifier``
+
+        The rows of the users are locked, users that do not exist (any
+        more) are skipped.
+        """
+        authority = authority_value(identifier)
+        emails = sorted(set(emails))
+        with transaction.atomic(using='cbioportal'):
+            emails = klass._lock_users(emails)
+            cursor = connections['cbioportal'].cursor()
             cursor.execute(r"""
-                INSERT INTO authorities (email, authority)
-                VALUE (%s, %s)""",
-                [email, 'cbioportal:' + identifier.upper()])
+                SELECT email, authority
+                FROM authorities
+                WHERE authority = %s""", [authority])
+            klass._apply_delta(
+                cursor.fetchall(), [(email, authority) for email in emails])
+
+    @classmethod
+    def _apply_delta(klass, current, wanted):
+        """Revoke and grant ``(email, authority)`` rows so that ``current``
+        becomes ``wanted``, with one bulk statement each
+
+        Authorities are compared by authority_key(), as the portal's
+        collation compares them case-insensitively: a current row that only
+        differs in case from a wanted one is kept, as revoking it would
+        also delete the wanted row.
+        """
+        current, wanted = set(map(tuple, current)), set(wanted)
+        current_keys = set(map(pair_key, current))
+        wanted_keys = set(map(pair_key, wanted))
+        klass.revoke(sorted(pair for pair in current
+                            if pair_key(pair) not in wanted_keys))
+        klass.grant(sorted(pair for pair in wanted
+                           if pair_key(pair) not in current_keys))
 
     @classmethod
     def update_authorities_for_group(klass, name, emails):
-        klass.update_authorities_for_study(name, emails)
+        """Set the users with access to the group, raise NotFound if there
+        is no such group"""
+        if not DaoStudyGroup.exists(name):
+            raise NotFound('No such group found!')
+        klass._update_authorities_for(name, emails)
 
     @classmethod
     def for_user(klass, email):
         """Return DbAuthority objects for a given user"""
-        result = []
         cursor = connections['cbioportal'].cursor()
         cursor.execute(r"""
             SELECT authority, email
             FROM authorities
             WHERE email = %s
             ORDER BY authority""", [email])
-        for res in dictfetchall(cursor):
-            result.append(DbAuthority(res['authority'], res['email']))
+        return klass.classify(fetchall_as(cursor, DbAuthority))
+
+    @classmethod
+    def of_enabled_users(klass, emails=None, chunk_size=None):
+        """Return ``list`` of the ``(email, authority)`` rows of the enabled
+        users, of all of them or of those with the given emails"""
+        sql = r"""
+            SELECT authorities.email, authorities.authority
+            FROM authorities
+            INNER JOIN users
+            ON users.email = authorities.email
+            WHERE users.enabled <> 0"""
+        cursor = connections['cbioportal'].cursor()
+        if emails is None:
+            cursor.execute(sql)
+            return list(map(tuple, cursor.fetchall()))
+        result = []
+        for chunk in chunked(emails, chunk_size):
+            cursor.execute(
+                sql + ' AND users.email IN ({})'.format(
+                    ', '.join(['%s'] * len(chunk))), chunk)
+            result += map(tuple, cursor.fetchall())
         return result
 
     @classmethod
-    def import_authorities(klass, authorities):
+    def grant(klass, pairs, chunk_size=None):
+        """Insert the given ``(email, authority)`` rows
+
+        ``authority`` is the raw column value, including the
+        ``cbioportal:`` prefix.
+        """
+        pairs = list(pairs)
         cursor = connections['cbioportal'].cursor()
-        cursor.execute('DELETE FROM authorities')
-        for authority in authorities:
+        for chunk in chunked(pairs, chunk_size):
+            cursor.executemany(r"""
+                INSERT INTO authorities (email, authority)
+                VALUES (%s, %s)""", [list(pair) for pair in chunk])
+        if pairs:
+            _authorities_changed(klass, granted=pairs)
+
+    @classmethod
+    def existing(klass, pairs, chunk_size=None):
+        """Return ``dict`` from the pair_key() of those of the given
+        ``(email, authority)`` rows that exist to ``list`` of the stored
+        rows
+
+        Authorities are compared by authority_key(), as in _apply_delta(),
+        so rows written before values were normalized are found as well; the
+        rows of the users are selected by email and compared in Python.
+        """
+        keys = set(map(pair_key, pairs))
+        result = {}
+        cursor = connections['cbioportal'].cursor()
+        for chunk in chunked(sorted({email for email, _ in keys}),
+                             chunk_size):
+            cursor.execute(r"""
+                SELECT email, authority
+                FROM authorities
+                WHERE email IN ({})""".format(
+                    ', '.join(['%s'] * len(chunk))), chunk)
+            for row in map(tuple, cursor.fetchall()):
+                if pair_key(row) in keys:
+                    result.setdefault(pair_key(row), []).append(row)
+        return result
+
+    @classmethod
+    def revoke(klass, pairs, chunk_size=None):
+        """Delete the given ``(email, authority)`` rows, see grant()"""
+        pairs = list(pairs)
+        cursor = connections['cbioportal'].cursor()
+        for chunk in chunked(pairs, chunk_size):
             cursor.execute(r"""
+                DELETE FROM authorities
+                WHERE (email, authority) IN ({})""".format(
+                    ', '.join(['(%s, %s)'] * len(chunk))),
+                [value for pair in chunk for value in pair])
+        if pairs:
+            _authorities_changed(klass, revoked=pairs)
+
+    @classmethod
+    def preview_bulk(klass, emails, identifiers):
+        """Return BulkPreview for grant_bulk() or revoke_bulk() with the
+        same arguments"""
+        emails, values = sorted(set(emails)), klass._bulk_values(identifiers)
+        rows = klass._bulk_existing(emails, values)
+        return BulkPreview(len(emails), len(values), len(set(rows)),
+                           len(rows))
+
+    @classmethod
+    def grant_bulk(klass, emails, identifiers):
+        """Grant each of the studies, groups or ``ALL`` in ``identifiers``
+        to each of the users in ``emails`` that does not have it yet
+
+        The rows of the users are locked, as in _update_authorities_for(),
+        and the existing rows of the cross product are selected with one
+        statement; exactly the missing rows are inserted and returned as
+        ``list`` of ``(email, authority)``.  Emails without a user are
+        skipped.
+        """
+        emails, values = sorted(set(emails)), klass._bulk_values(identifiers)
+        if not emails or not values:
+            return []
+        with transaction.atomic(using='cbioportal'):
+            emails = klass._lock_users(emails)
+            existing = {
+                (email, authority_value(authority))
+                for email, authority in klass._bulk_existing(emails, values)}
+            pairs = [(email, value) for email in emails for value in values
+                     if (email, value) not in existing]
+            klass.grant(pairs)
+        return pairs
+
+    @classmethod
+    def revoke_bulk(klass, emails, identifiers):
+        """Revoke each of the studies, groups or ``ALL`` in ``identifiers``
+        from each of the users in ``emails``
+
+        The rows of the users are locked and the rows are deleted with one
+        ``DELETE`` statement.  Return ``list`` of the revoked ``(email,
+        authority)`` rows.
+        """
+        emails, values = sorted(set(emails)), klass._bulk_values(identifiers)
+        if not emails or not values:
+            return []
+        with transaction.atomic(using='cbioportal'):
+            emails = klass._lock_users(emails)
+            pairs = sorted(set(klass._bulk_existing(emails, values)))
+            if pairs:
+                connections['cbioportal'].cursor().execute(r"""
+                    DELETE FROM authorities
+                    WHERE email IN ({})
+                    AND authority IN ({})""".format(
+                        ', '.join(['%s'] * len(emails)),
+                        ', '.join(['%s'] * len(values))),
+                    emails + values)
+                _authorities_changed(klass, revoked=pairs)
+        return pairs
+
+    @staticmethod
+    def _lock_users(emails):
+        """Lock the rows of the users ``emails`` until the end of the
+        transaction, return sorted ``list`` of the emails that exist"""
+        if not emails:
+            return []
+        cursor = connections['cbioportal'].cursor()
+        cursor.execute(_for_update(
+            'SELECT email FROM users WHERE email IN ({})'.format(
+                ', '.join(['%s'] * len(emails)))), list(emails))
+        return sorted(email for email, in cursor.fetchall())
+
+    @staticmethod
+    def _bulk_values(identifiers):
+        return sorted({authority_value(identifier)
+                       for identifier in identifiers})
+
+    @staticmethod
+    def _bulk_existing(emails, values):
+        """Return ``list`` of the ``(email, authority)`` rows of the cross
+        product of ``emails`` and authority ``values``"""
+        if not emails or not values:
+            return []
+        cursor = connections['cbioportal'].cursor()
+        cursor.execute(r"""
+            SELECT email, authority
+            FROM authorities
+            WHERE email IN ({})
+            AND authority IN ({})""".format(
+                ', '.join(['%s'] * len(emails)),
+                ', '.join(['%s'] * len(values))),
+            emails + values)
+        return list(map(tuple, cursor.fetchall()))
+
+    @classmethod
+    def import_authorities(klass, authorities, chunk_size=None):
+        """Replace all authorities by the given ones, return number of rows
+        """
+        cursor = connections['cbioportal'].cursor()
+        cursor.execute('DELETE FROM authorities')
+        count = 0
+        for chunk in chunked(authorities, chunk_size):
+            cursor.executemany(r"""
                 INSERT INTO authorities (email, authority)
-                VALUES (%s, %s)""", [authority['email'],
-                                     authority['authority']])
+                VALUES (%s, %s)""",
+                [[authority['email'], authority['authority']]
+                 for authority in chunk])
+            count += len(chunk)
+        _authorities_changed(klass, reset=True)
+        return count
+
+
+def export_to_yaml(chunk_size=None, version=None):
+    """Yield the users and authorities of the portal as YAML text
+
+    Rows are read through iter_rows() and emitted in blocks of
+    ``chunk_size`` records, so memory use does not depend on the table
+    sizes.  If given, ``version`` is written as the ``version`` key; the
+    import ignores it.
+    """
+    if version is not None:
+        yield 'version: {}\n\n'.format(version)
+    yield 'users:\n'
+    users = iter_rows(
+        'SELECT email, name, enabled FROM users ORDER BY email',
+        chunk_size=chunk_size)
+    for chunk in chunked(users, chunk_size):
+        yield ''.join(
+            '- email: {}\n  name: {}\n  enabled: {}\n'.format(
+                repr(email), repr(name), int(enabled))
+            for email, name, enabled in chunk)
+    yield '\nauthorities:\n'
+    authorities = iter_rows(
+        'SELECT email, authority FROM authorities ORDER BY email',
+        chunk_size=chunk_size)
+    for chunk in chunked(authorities, chunk_size):
+        yield ''.join(
+            '- email: {}\n  authority: {}\n'.format(
+                repr(email), repr(authority))
+            for email, authority in chunk)
+
+
+class ImportStats:
+    """Summary of an import run"""
+
+    def __init__(self, num_users, num_authorities, seconds):
+        #: Number of user rows written
+        self.num_users = num_users
+        #: Number of authority rows written
+        self.num_authorities = num_authorities
+        #: Wall-clock time of the import in seconds
+        self.seconds = seconds
+
+    @property
+    def rows_per_second(self):
+        rows = self.num_users + self.num_authorities
+        return rows / self.seconds if self.seconds else float(rows)
+
+    def __str__(self):
+        return ('Imported {} users and {} authorities in {:.2f} s '
+                '({:.0f} rows/s)').format(
+                    self.num_users, self.num_authorities, self.seconds,
+                    self.rows_per_second)
+
+    def to_dict(self):
+        return {
+            'summary': str(self),
+            'num_users': self.num_users,
+            'num_authorities': self.num_authorities,
+            'seconds': self.seconds,
+        }
 
 
+class ImportPlan:
+    """Changes that bring the portal in line with an import document"""
 
-def import_from_yaml(yaml_text):
-    data = yaml.load(yaml_text)
-    DaoUser.import_users(data['users'])
-    DaoAuthority.import_authorities(data['authorities'])
+    def __init__(self):
+        #: DbUser objects to insert
+        self.users_created = []
+        #: DbUser objects whose name or enabled flag changes
+        self.users_updated = []
+        #: Emails of the users to delete
+        self.users_deleted = []
+        #: ``(email, authority)`` rows to insert
+        self.authorities_granted = []
+        #: ``(email, authority)`` rows to delete
+        self.authorities_revoked = []
+        #: Wall-clock time of planning (and applying) in seconds
+        self.seconds = 0.0
+
+    @property
+    def num_changes(self):
+        return (len(self.users_created) + len(self.users_updated) +
+                len(self.users_deleted) + len(self.authorities_granted) +
+                len(self.authorities_revoked))
+
+    def __str__(self):
+        return ('{} users created, {} updated, {} deleted; '
+                '{} authorities granted, {} revoked ({:.2f} s)').format(
+                    len(self.users_created), len(self.users_updated),
+                    len(self.users_deleted), len(self.authorities_granted),
+                    len(self.authorities_revoked), self.seconds)
+
+    def to_dict(self, examples=10):
+        """Return ``dict`` with the summary and, per kind of change, the
+        count and the first ``examples`` changes"""
+        def change(label, items, format):
+            return {'label': label, 'count': len(items),
+                    'examples': [format(item) for item in items[:examples]]}
+        user = lambda user: user.email
+        pair = '{0[0]} \u2192 {0[1]}'.format
+        return {
+            'summary': str(self),
+            'changes': [
+                change('Users created', self.users_created, user),
+                change('Users updated', self.users_updated, user),
+                change('Users deleted', self.users_deleted, str),
+                change('Authorities granted', self.authorities_granted, pair),
+                change('Authorities revoked', self.authorities_revoked, pair),
+            ],
+        }
+
+
+class InvalidRecords(ValueError):
+    """Raised by the imports if records of the document are invalid;
+    nothing is written then"""
+
+    def __init__(self, errors):
+        #: ``list`` of ``(section, number, message)``, ``number`` counts the
+        #: records of the section from 1
+        self.errors = errors
+        super().__init__('{} invalid record(s), first: {} #{}: {}'.format(
+            len(errors), *errors[0]))
+
+
+#: YAML loader used for imports, LibYAML-based if PyYAML was built with it
+YamlLoader = getattr(yaml, 'CSafeLoader', yaml.SafeLoader)
+
+#: Top-level sections of an import document, in the order they are written
+IMPORT_SECTIONS = ('users', 'authorities')
+
+#: String fields of the records by section
+IMPORT_FIELDS = {
+    'users': ('email', 'name'),
+    'authorities': ('email', 'authority'),
+}
+
+_yaml_resolver = yaml.resolver.Resolver()
+_yaml_constructor = yaml.constructor.SafeConstructor()
+
+
+def _yaml_expect(loader, event_class):
+    if not loader.check_event(event_class):
+        raise ValueError('Expected {} but found {}'.format(
+            event_class.__name__, loader.peek_event()))
+    return loader.get_event()
+
+
+def _yaml_scalar(event):
+    """Construct Python value of a ScalarEvent, as the safe loader does"""
+    tag = event.tag
+    if tag is None or tag == '!':
+        tag = _yaml_resolver.resolve(
+            yaml.ScalarNode, event.value, event.implicit)
+    node = yaml.ScalarNode(tag, event.value, event.start_mark,
+                           event.end_mark, event.style)
+    constructor = _yaml_constructor.yaml_constructors.get(
+        tag, yaml.constructor.SafeConstructor.construct_undefined)
+    return constructor(_yaml_constructor, node)
+
+
+def _yaml_skip(loader):
+    """Skip over the next node, including its children"""
+    depth = 0
+    while True:
+        event = loader.get_event()
+        if isinstance(event, (yaml.MappingStartEvent,
+                              yaml.SequenceStartEvent)):
+            depth += 1
+        elif isinstance(event, (yaml.MappingEndEvent,
+                                yaml.SequenceEndEvent)):
+            depth -= 1
+        if depth == 0:
+            return
+
+
+def _yaml_records(loader):
+    """Yield the flat mappings of the sequence at the current position"""
+    if loader.check_event(yaml.ScalarEvent):
+        if _yaml_scalar(loader.get_event()) is not None:
+            raise ValueError('Expected a list of records')
+        return
+    _yaml_expect(loader, yaml.SequenceStartEvent)
+    while not loader.check_event(yaml.SequenceEndEvent):
+        _yaml_expect(loader, yaml.MappingStartEvent)
+        record = {}
+        while not loader.check_event(yaml.MappingEndEvent):
+            key = _yaml_scalar(_yaml_expect(loader, yaml.ScalarEvent))
+            record[key] = _yaml_scalar(_yaml_expect(loader, yaml.ScalarEvent))
+        loader.get_event()
+        yield record
+    loader.get_event()
+
+
+def iter_yaml_sections(stream):
+    """Yield ``(section, records)`` for the sections of an import document
+
+    ``stream`` is a YAML string or a file-like object.  The document is
+    parsed as a stream of events and ``records`` is an iterator over the
+    section's records, so only a single record is held in memory at any
+    time.  Each ``records`` iterator must be consumed before advancing to
+    the next section; unconsumed records are skipped.  Top-level keys other
+    than IMPORT_SECTIONS are ignored.
+    """
+    loader = YamlLoader(stream)
+    try:
+        _yaml_expect(loader, yaml.StreamStartEvent)
+        if loader.check_event(yaml.StreamEndEvent):
+            return
+        _yaml_expect(loader, yaml.DocumentStartEvent)
+        _yaml_expect(loader, yaml.MappingStartEvent)
+        seen = set()
+        while not loader.check_event(yaml.MappingEndEvent):
+            section = _yaml_scalar(_yaml_expect(loader, yaml.ScalarEvent))
+            if section not in IMPORT_SECTIONS:
+                _yaml_skip(loader)
+                continue
+            if section in seen:
+                raise ValueError('Duplicate section {}'.format(section))
+            seen.add(section)
+            records = _yaml_records(loader)
+            yield section, records
+            for _ in records:
+                pass
+    finally:
+        loader.dispose()
+
+
+def _checked_records(section, records, errors, progress=None):
+    """Yield the valid records, append ``(section, number, message)`` of
+    invalid ones to ``errors``
+
+    ``progress``, if given, is called with the section and the number of
+    records read so far after each record.
+    """
+    for number, record in enumerate(records, 1):
+        if progress is not None:
+            progress(section, number)
+        invalid = [field for field in IMPORT_FIELDS[section]
+                   if not isinstance(record.get(field), str)]
+        if invalid:
+            errors.append((section, number, '{} must be a string'.format(
+                ' and '.join(invalid))))
+        elif not record['email']:
+            errors.append((section, number, 'email must not be empty'))
+        elif section == 'users' and not isinstance(
+                record.get('enabled'), (bool, int)):
+            errors.append((section, number, 'enabled must be 0, 1, true '
+                           'or false'))
+        else:
+            yield record
+
+
+def import_from_yaml(stream, chunk_size=None, progress=None):
+    """Replace users and authorities in the portal by those from the YAML
+
+    ``stream`` is a YAML string or a file-like object.  It is parsed
+    incrementally with iter_yaml_sections() and the records are written in
+    multi-row inserts of ``chunk_size`` rows (default
+    ``settings.CBIOPORTAL_IMPORT_CHUNK_SIZE``) as they are read, so memory
+    use is bounded by the chunk size.  All rows are written in one
+    transaction, which is rolled back with InvalidRecords if any record is
+    invalid.  ``progress`` is passed to _checked_records().  Return
+    ImportStats.
+    """
+    importers = {
+        'users': DaoUser.import_users,
+        'authorities': DaoAuthority.import_authorities,
+    }
+    counts = {}
+    errors = []
+    start = time.monotonic()
+    with transaction.atomic(using='cbioportal'):
+        for section, records in iter_yaml_sections(stream):
+            counts[section] = importers[section](
+                _checked_records(section, records, errors, progress),
+                chunk_size)
+        missing = [s for s in IMPORT_SECTIONS if s not in counts]
+        if missing:
+            raise ValueError('Missing section(s) {}'.format(
+                ', '.join(missing)))
+        if errors:
+            raise InvalidRecords(errors)
+    return ImportStats(counts['users'], counts['authorities'],
+                       time.monotonic() - start)
+
+
+def plan_import_from_yaml(stream, progress=None):
+    """Compare the YAML import document with the portal, return ImportPlan
+
+    The current users and authorities are loaded into memory once; the
+    document is streamed through iter_yaml_sections().  Raises
+    InvalidRecords if any record is invalid.
+    """
+    start = time.monotonic()
+    plan = ImportPlan()
+    users = {
+        email: DbUser(email, name, enabled)
+        for email, name, enabled in iter_rows(
+            'SELECT email, name, enabled FROM users')}
+    authorities = set(iter_rows('SELECT email, authority FROM authorities'))
+    seen = {}
+    errors = []
+    for section, records in iter_yaml_sections(stream):
+        seen[section] = set()
+        for record in _checked_records(section, records, errors, progress):
+            if section == 'users':
+                user = DbUser(record['email'], record['name'],
+                              record['enabled'])
+                key = user.email
+            else:
+                key = (record['email'], record['authority'])
+            if key in seen[section]:
+                raise ValueError('Duplicate {} entry {}'.format(section, key))
+            seen[section].add(key)
+            if section == 'authorities':
+                if key not in authorities:
+                    plan.authorities_granted.append(key)
+            elif key not in users:
+                plan.users_created.append(user)
+            elif (users[key].name, users[key].enabled) != (
+                    user.name, user.enabled):
+                plan.users_updated.append(user)
+    missing = [s for s in IMPORT_SECTIONS if s not in seen]
+    if missing:
+        raise ValueError('Missing section(s) {}'.format(', '.join(missing)))
+    if errors:
+        raise InvalidRecords(errors)
+    plan.users_deleted = sorted(set(users) - seen['users'])
+    plan.authorities_revoked = sorted(authorities - seen['authorities'])
+    plan.seconds = time.monotonic() - start
+    return plan
+
+
+def sync_from_yaml(stream, chunk_size=None, dry_run=False, progress=None):
+    """Apply only the differences between the YAML and the portal
+
+    Unlike import_from_yaml(), unchanged rows are left alone.  All changes
+    are written in one transaction.  With ``dry_run``, nothing is written.
+    Return the ImportPlan.
+    """
+    start = time.monotonic()
+    with transaction.atomic(using='cbioportal'):
+        plan = plan_import_from_yaml(stream, progress)
+        if not dry_run:
+            DaoAuthority.revoke(plan.authorities_revoked, chunk_size)
+            DaoUser.delete_users(plan.users_deleted, chunk_size)
+            DaoUser.upsert_users(
+                plan.users_created, plan.users_updated, chunk_size)
+            DaoAuthority.grant(plan.authorities_granted, chunk_size)
+    plan.seconds = time.monotonic() - start
+    return plan
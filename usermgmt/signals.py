@@ -0,0 +1,21 @@
+"""Signals sent by the DAOs
+
+The signals for writes to the portal database are sent once the surrounding
+transaction on the ``cbioportal`` connection has been committed.
+"""
+
+from django.dispatch import Signal
+
+#: Sent by DaoUser with ``created`` and ``updated`` (lists of DbUser),
+#: ``deleted`` (list of emails) and ``reset`` (all users were replaced)
+users_changed = Signal(providing_args=['created', 'updated', 'deleted',
+                                       'reset'])
+
+#: Sent by DaoAuthority with ``granted`` and ``revoked`` (lists of
+#: ``(email, authority)`` rows) and ``reset`` (all authorities were
+#: replaced)
+authorities_changed = Signal(providing_args=['granted', 'revoked', 'reset'])
+
+#: Sent by DaoStudyCatalog with the ``catalog`` (DbStudyCatalog) each time
+#: the studies were loaded from the portal database
+catalog_loaded = Signal(providing_args=['catalog'])
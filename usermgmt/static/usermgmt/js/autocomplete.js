@@ -0,0 +1,82 @@
+/*
+ * Typeahead for AutocompleteSelectMultiple widgets
+ *
+ * The <select multiple> only contains the selected options.  It is hidden
+ * and replaced by a list of the selected entries and a search box.  The
+ * search box queries the JSON endpoint from data-autocomplete-url, which
+ * returns {"results": [{"id": ..., "text": ...}], "next": {...} or null}.
+ */
+$(function () {
+  $('select[data-autocomplete-url]').each(function () {
+    var select = $(this);
+    var url = select.data('autocomplete-url');
+    var selected = $('<ul class="list-group"></ul>');
+    var wrapper = $('<div class="dropdown"></div>');
+    var input = $('<input type="text" class="form-control" placeholder="Type to search...">');
+    var menu = $('<ul class="dropdown-menu"></ul>');
+    var timer = null;
+
+    function addSelected(value, text) {
+      var item = $('<li class="list-group-item"></li>').text(text);
+      var remove = $('<button type="button" class="close">&times;</button>');
+      remove.on('click', function () {
+        select.find('option').filter(function () {
+          return this.value === value;
+        }).remove();
+        item.remove();
+      });
+      selected.append(item.prepend(remove));
+    }
+
+    function search(params, append) {
+      $.getJSON(url, $.extend({q: input.val()}, params), function (data) {
+        if (!append) {
+          menu.empty();
+        }
+        menu.find('.autocomplete-more').remove();
+        $.each(data.results, function (i, result) {
+          var link = $('<a href="#"></a>').text(result.text);
+          link.on('click', function (event) {
+            event.preventDefault();
+            var exists = select.find('option').filter(function () {
+              return this.value === result.id;
+            }).length;
+            if (!exists) {
+              select.append($('<option selected></option>')
+                .val(result.id).text(result.text));
+              addSelected(result.id, result.text);
+            }
+            wrapper.removeClass('open');
+          });
+          menu.append($('<li></li>').append(link));
+        });
+        if (data.next) {
+          var more = $('<a href="#">More...</a>');
+          more.on('click', function (event) {
+            event.preventDefault();
+            event.stopPropagation();
+            search(data.next, true);
+          });
+          menu.append($('<li class="autocomplete-more"></li>').append(more));
+        }
+        wrapper.toggleClass('open', menu.children().length > 0);
+      });
+    }
+
+    select.find('option').each(function () {
+      $(this).prop('selected', true);
+      addSelected(this.value, $(this).text());
+    });
+    input.on('input', function () {
+      clearTimeout(timer);
+      timer = setTimeout(function () { search({}, false); }, 250);
+    });
+    $(document).on('click', function (event) {
+      if (!$.contains(wrapper[0], event.target)) {
+        wrapper.removeClass('open');
+      }
+    });
+
+    select.hide().after(selected, wrapper.append(input, menu));
+  });
+});
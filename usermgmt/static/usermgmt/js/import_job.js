@@ -0,0 +1,43 @@
+/*
+ * Progress of an import job
+ *
+ * Polls the JSON endpoint from data-status-url of #import-job while the job
+ * is not finished, updates the cells with a data-field attribute and reloads
+ * the page once the job has finished, to show the errors or changes.
+ */
+$(function () {
+  var table = $('#import-job');
+  var url = table.data('status-url');
+  var interval = 1000;
+
+  function format(field, value) {
+    if (value === null) {
+      return '';
+    } else if (field === 'rows_per_second') {
+      return Math.round(value);
+    } else if (field === 'seconds') {
+      return value.toFixed(2);
+    }
+    return value;
+  }
+
+  function poll() {
+    $.getJSON(url).done(function (job) {
+      table.find('[data-field]').each(function () {
+        var field = $(this).data('field');
+        $(this).text(format(field, job[field]));
+      });
+      if (job.finished) {
+        window.location.reload();
+      } else {
+        window.setTimeout(poll, interval);
+      }
+    }).fail(function () {
+      window.setTimeout(poll, interval * 5);
+    });
+  }
+
+  if (table.length && table.data('finished') !== 1) {
+    window.setTimeout(poll, interval);
+  }
+});
@@ -0,0 +1,100 @@
+"""Helpers for the tests against SQLite stand-ins of the portal database"""
+
+from django.contrib.auth.models import User
+from django.db import connections
+from django.test import TestCase, TransactionTestCase
+
+from .. import access
+from .. import benchmark
+from .. import portal_models
+
+
+def reset_caches():
+    """Drop the in-process caches of the portal data"""
+    portal_models.DaoStudyCatalog.invalidate()
+    portal_models.DaoStatistics.invalidate()
+    access.DaoEffectiveAccess.invalidate()
+
+
+class PortalMixin:
+    """Create the portal tables with a few rows before each test"""
+
+    #: ``(identifier, name, groups)`` of the studies
+    studies = (
+        ('study_a', 'Study A', 'GROUP_X;GROUP_Y'),
+        ('study_b', 'Study B', 'GROUP_Y'),
+        ('study_c', 'Study C', ''),
+    )
+    #: ``(email, name, enabled)`` of the users
+    users = (
+        ('alice@example.com', 'Alice', 1),
+        ('bob@example.com', 'Bob', 1),
+        ('carol@example.com', 'Carol', 0),
+    )
+    #: ``(email, authority)`` rows
+    authorities = (
+        ('alice@example.com', 'cbioportal:STUDY_A'),
+        ('bob@example.com', 'cbioportal:GROUP_Y'),
+    )
+
+    def create_portal(self):
+        benchmark.create_schema()
+        cursor = connections['cbioportal'].cursor()
+        cursor.executemany(r"""
+            INSERT INTO cancer_study
+                (cancer_study_id, cancer_study_identifier, name, groups)
+            VALUES (%s, %s, %s, %s)""",
+            [[i + 1] + list(study) for i, study in enumerate(self.studies)])
+        if self.users:
+            cursor.executemany(
+                'INSERT INTO users (email, name, enabled) VALUES (%s, %s, %s)',
+                [list(user) for user in self.users])
+        if self.authorities:
+            cursor.executemany(
+                'INSERT INTO authorities (email, authority) VALUES (%s, %s)',
+                [list(pair) for pair in self.authorities])
+        reset_caches()
+
+    def rows(self, sql, params=None):
+        """Return the rows of ``sql`` on the portal database as tuples"""
+        cursor = connections['cbioportal'].cursor()
+        cursor.execute(sql, params)
+        return [tuple(row) for row in cursor.fetchall()]
+
+    def user_rows(self):
+        return self.rows(
+            'SELECT email, name, enabled FROM users ORDER BY email')
+
+    def authority_rows(self):
+        return self.rows(
+            'SELECT email, authority FROM authorities ORDER BY email, '
+            'authority')
+
+    def login(self):
+        User.objects.create_user('admin', 'admin@example.com', 'secret')
+        self.client.login(username='admin', password='secret')
+
+
+class PortalTestCase(PortalMixin, TestCase):
+    """Each test runs in transactions on both databases that are rolled
+    back; the DAO signals are not sent, as nothing is committed"""
+
+    multi_db = True
+
+    def setUp(self):
+        super().setUp()
+        self.create_portal()
+
+
+class PortalTransactionTestCase(PortalMixin, TransactionTestCase):
+    """Writes are committed, so the DAO signals are sent"""
+
+    multi_db = True
+
+    def setUp(self):
+        super().setUp()
+        self.create_portal()
+
+    def tearDown(self):
+        reset_caches()
+        super().tearDown()
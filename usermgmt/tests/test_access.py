@@ -0,0 +1,177 @@
+from django.core.urlresolvers import reverse
+from django.db import connections
+from django.test import SimpleTestCase
+
+from .base import PortalTransactionTestCase
+from .. import access
+from .. import portal_models
+
+from unittest import mock
+import threading
+
+DaoEffectiveAccess = access.DaoEffectiveAccess
+
+
+class EffectiveAccessIndexTest(SimpleTestCase):
+
+    def setUp(self):
+        self.catalog = portal_models.DbStudyCatalog(1, [
+            portal_models.DbStudy('study', 'Study', ['GROUP']),
+            portal_models.DbStudy('other', 'Other', ['group', 'OTHER']),
+            portal_models.DbStudy('third', 'Third', [])])
+
+    def test_replace_users(self):
+        index = access.EffectiveAccessIndex(self.catalog, [
+            ('a', 'cbioportal:STUDY'), ('a', 'cbioportal:ALL'),
+            ('b', 'cbioportal:study')])
+        self.assertEqual(index.by_authority['STUDY'], {'a', 'b'})
+        index.replace_users(['a', 'b'], [('b', 'cbioportal:GROUP')])
+        self.assertEqual(index.by_user, {'b': {'GROUP'}})
+        self.assertEqual(index.by_authority, {'GROUP': {'b'}})
+        self.assertEqual(index.studies_by_user, {'b': {'STUDY', 'OTHER'}})
+
+    def test_resolves_studies(self):
+        index = access.EffectiveAccessIndex(self.catalog, [
+            ('all', 'cbioportal:ALL'), ('all', 'cbioportal:STUDY'),
+            ('study', 'cbioportal:study'), ('study', 'cbioportal:GONE'),
+            ('group', 'cbioportal:group'),
+            ('both', 'cbioportal:OTHER')])
+        for email, studies in (
+                ('all', {'STUDY', 'OTHER', 'THIRD'}),
+                ('study', {'STUDY'}),
+                ('group', {'STUDY', 'OTHER'}),
+                ('both', {'OTHER'}),
+                ('nobody', set())):
+            with self.subTest(email=email):
+                self.assertEqual(
+                    set(index.studies_by_user.get(email, ())), studies)
+                self.assertEqual(
+                    [study.identifier for study in index.studies_for(email)],
+                    sorted(study.lower() for study in studies))
+                for key in ('STUDY', 'other', 'Third'):
+                    self.assertEqual(index.can_access(email, key),
+                                     key.upper() in studies)
+        self.assertIsNone(index.can_access('all', 'gone'))
+
+    def test_resolve_against_new_catalog(self):
+        index = access.EffectiveAccessIndex(
+            self.catalog, [('a', 'cbioportal:GROUP')])
+        index.resolve(portal_models.DbStudyCatalog(2, [
+            portal_models.DbStudy('third', 'Third', ['GROUP'])]))
+        self.assertEqual(index.studies_by_user, {'a': {'THIRD'}})
+        self.assertIsNone(index.can_access('a', 'study'))
+        self.assertTrue(index.can_access('a', 'third'))
+
+
+class DaoEffectiveAccessTest(PortalTransactionTestCase):
+
+    authorities = PortalTransactionTestCase.authorities + (
+        ('carol@example.com', 'cbioportal:ALL'),
+        ('bob@example.com', 'cbioportal:STUDY_C'),
+        ('bob@example.com', 'cbioportal:study_c'),
+    )
+
+    def can_access(self, email, identifier):
+        return DaoEffectiveAccess.can_access(email, identifier)
+
+    def test_access_through_study_group_and_all(self):
+        self.assertTrue(self.can_access('alice@example.com', 'study_a'))
+        self.assertFalse(self.can_access('alice@example.com', 'study_b'))
+        self.assertTrue(self.can_access('bob@example.com', 'STUDY_A'))
+        self.assertTrue(self.can_access('bob@example.com', 'study_b'))
+        self.assertIsNone(self.can_access('bob@example.com', 'no_study'))
+
+    def test_disabled_users_have_no_access(self):
+        self.assertFalse(self.can_access('carol@example.com', 'study_a'))
+        portal_models.DaoUser.update_user('carol@example.com', 'Carol', True)
+        self.assertTrue(self.can_access('carol@example.com', 'study_a'))
+        portal_models.DaoUser.update_user('bob@example.com', 'Bob', False)
+        self.assertFalse(self.can_access('bob@example.com', 'study_b'))
+
+    def test_revoke_keeps_access_from_remaining_rows(self):
+        self.assertTrue(self.can_access('bob@example.com', 'study_c'))
+        portal_models.DaoAuthority.revoke(
+            [('bob@example.com', 'cbioportal:study_c')])
+        self.assertTrue(self.can_access('bob@example.com', 'study_c'))
+        portal_models.DaoAuthority.revoke(
+            [('bob@example.com', 'cbioportal:STUDY_C')])
+        self.assertFalse(self.can_access('bob@example.com', 'study_c'))
+
+    def test_grant_and_delete(self):
+        self.assertFalse(self.can_access('alice@example.com', 'study_c'))
+        portal_models.DaoAuthority.grant(
+            [('alice@example.com', 'cbioportal:STUDY_C')])
+        self.assertTrue(self.can_access('alice@example.com', 'study_c'))
+        portal_models.DaoUser.delete_user('alice@example.com')
+        self.assertFalse(self.can_access('alice@example.com', 'study_c'))
+
+    def test_stale_index_served_during_rebuild(self):
+        index = DaoEffectiveAccess.get()
+        DaoEffectiveAccess._expires = 0
+        DaoEffectiveAccess._build_lock.acquire()
+        try:
+            result = []
+            thread = threading.Thread(
+                target=lambda: result.append(DaoEffectiveAccess.get()))
+            thread.start()
+            thread.join(5)
+            self.assertEqual(result, [index])
+        finally:
+            DaoEffectiveAccess._build_lock.release()
+        self.assertIsNot(DaoEffectiveAccess.get(), index)
+
+    def test_rebuild_not_swapped_in_over_concurrent_change(self):
+        of_enabled_users = portal_models.DaoAuthority.of_enabled_users
+        calls = []
+
+        def build(*args):
+            calls.append(args)
+            if len(calls) == 1:
+                DaoEffectiveAccess.invalidate()
+            return of_enabled_users(*args)
+
+        with mock.patch.object(portal_models.DaoAuthority,
+                               'of_enabled_users', side_effect=build):
+            DaoEffectiveAccess.get()
+        self.assertEqual(len(calls), 2)
+
+    def test_checks_are_in_memory(self):
+        DaoEffectiveAccess.get()
+        with mock.patch.object(portal_models.DaoStudyCatalog, 'get') as get:
+            with self.assertNumQueries(0, using='cbioportal'):
+                self.assertTrue(self.can_access('bob@example.com', 'study_a'))
+                self.assertEqual(
+                    [study.identifier
+                     for study in DaoEffectiveAccess.studies_for(
+                         'bob@example.com')],
+                    ['study_a', 'study_b', 'study_c'])
+        self.assertFalse(get.called)
+
+    def test_resolved_again_when_catalog_is_loaded(self):
+        index = DaoEffectiveAccess.get()
+        connections['cbioportal'].cursor().execute(
+            "UPDATE cancer_study SET groups = '' "
+            "WHERE cancer_study_identifier = 'study_b'")
+        self.assertTrue(self.can_access('bob@example.com', 'study_b'))
+        with mock.patch.object(portal_models.DaoAuthority,
+                               'of_enabled_users') as of_enabled_users:
+            portal_models.DaoStudyCatalog.refresh()
+        self.assertFalse(of_enabled_users.called)
+        self.assertIs(DaoEffectiveAccess.get(), index)
+        self.assertFalse(self.can_access('bob@example.com', 'study_b'))
+        self.assertEqual(index.studies_by_user['bob@example.com'],
+                         {'STUDY_A', 'STUDY_C'})
+
+    def test_access_check_endpoint(self):
+        self.login()
+        url = reverse('api_access_check')
+        response = self.client.get(
+            url, {'email': 'bob@example.com', 'study': 'study_b'})
+        self.assertEqual(response.json()['access'], True)
+        response = self.client.get(
+            url, {'email': 'carol@example.com', 'study': 'study_b'})
+        self.assertEqual(response.json()['access'], False)
+        response = self.client.get(
+            url, {'email': 'bob@example.com', 'study': 'nope'})
+        self.assertEqual(response.status_code, 404)
+        self.assertEqual(self.client.get(url).status_code, 400)
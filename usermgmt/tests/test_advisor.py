@@ -0,0 +1,65 @@
+from django.core.management import call_command
+
+from .base import PortalTransactionTestCase
+from .. import advisor
+from .. import journal
+from .. import models
+from .. import versioning
+
+import io
+
+
+class AdvisorTest(PortalTransactionTestCase):
+
+    def test_capture_dao_queries_writes_nothing(self):
+        before = (self.user_rows(), self.authority_rows())
+        versions = versioning.get_data_version()[0]
+        captured = dict(advisor.capture_dao_queries())
+        self.assertEqual((self.user_rows(), self.authority_rows()), before)
+        self.assertEqual(versioning.get_data_version()[0], versions)
+        self.assertEqual(journal.current_version(), 0)
+        self.assertFalse(models.ChangeJournalEntry.objects.exists())
+        for name in ('DaoUser.get_user', 'DaoAuthority.of_enabled_users',
+                     'DaoAuthority.grant_bulk', 'DaoAuthority.revoke_bulk',
+                     'DaoAuthority.preview_bulk', 'DaoUser.update_users'):
+            with self.subTest(name=name):
+                self.assertTrue(captured[name])
+        # Inserts of values are captured but have nothing to explain
+        self.assertEqual(captured['DaoUser.create_user'], [])
+
+    def test_explain_reports_full_scans(self):
+        rows = advisor.explain(
+            'SELECT email FROM authorities WHERE authority = %s',
+            ['cbioportal:STUDY_A'])
+        self.assertEqual([(row.table, row.full_scan) for row in rows],
+                         [('authorities', True)])
+        rows = advisor.explain(
+            'SELECT name FROM users WHERE email = %s', ['alice@example.com'])
+        self.assertEqual([(row.table, row.full_scan) for row in rows],
+                         [('users', False)])
+
+    def test_missing_and_created_indexes(self):
+        self.assertEqual(advisor.missing_indexes(),
+                         list(advisor.RECOMMENDED_INDEXES))
+        for table, columns in advisor.RECOMMENDED_INDEXES:
+            advisor.create_index(table, columns)
+        self.assertEqual(advisor.missing_indexes(), [])
+        rows = advisor.explain(
+            'SELECT email FROM authorities WHERE authority = %s',
+            ['cbioportal:STUDY_A'])
+        self.assertFalse(any(row.full_scan for row in rows))
+
+    def test_advise_indexes_command(self):
+        before = (self.user_rows(), self.authority_rows())
+        out = io.StringIO()
+        call_command('advise_indexes', stdout=out)
+        output = out.getvalue()
+        self.assertIn('FULL SCAN', output)
+        self.assertIn('CREATE INDEX "authorities_email_idx" ON "authorities" '
+                      '("email")', output)
+        self.assertIn('Run with --create', output)
+        self.assertEqual((self.user_rows(), self.authority_rows()), before)
+        out = io.StringIO()
+        call_command('advise_indexes', create=True, stdout=out)
+        self.assertIn('created: CREATE INDEX', out.getvalue())
+        self.assertEqual(advisor.missing_indexes(), [])
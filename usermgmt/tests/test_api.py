@@ -0,0 +1,228 @@
+from django.core.urlresolvers import reverse
+from django.db import connections
+from django.test import Client, override_settings
+
+from .base import PortalTestCase
+from .. import api
+
+from unittest import mock
+
+import json
+
+
+@override_settings(CBIOPORTAL_API_TOKENS=['s3cret'])
+class BatchApiTest(PortalTestCase):
+
+    def post(self, name, data, client=None, **extra):
+        body = data if isinstance(data, str) else json.dumps(data)
+        return (client or self.client).post(
+            reverse(name), body, content_type='application/json', **extra)
+
+    def post_with_token(self, name, data):
+        return self.post(name, data, HTTP_AUTHORIZATION='Token s3cret')
+
+    def errors(self, response):
+        return [result.get('error') for result in response.json()['results']]
+
+    def test_requires_login_or_token(self):
+        self.assertEqual(self.post('api_users', []).status_code, 403)
+        response = self.post('api_users', [],
+                             HTTP_AUTHORIZATION='Token wrong')
+        self.assertEqual(response.status_code, 401)
+        self.assertEqual(self.post_with_token('api_users', []).status_code,
+                         200)
+
+    def test_token_requests_skip_csrf_check(self):
+        client = Client(enforce_csrf_checks=True)
+        response = self.post('api_users', [], client=client,
+                             HTTP_AUTHORIZATION='Token s3cret')
+        self.assertEqual(response.status_code, 200)
+
+    def test_session_requests_need_csrf_token(self):
+        self.login()
+        client = Client(enforce_csrf_checks=True)
+        client.cookies = self.client.cookies
+        self.assertEqual(self.post('api_users', [], client=client).status_code,
+                         403)
+        client.get(reverse('import'))
+        token = client.cookies['csrftoken'].value
+        response = self.post('api_users', [], client=client,
+                             HTTP_X_CSRFTOKEN=token)
+        self.assertEqual(response.status_code, 200)
+
+    def test_rejects_invalid_json(self):
+        for body in ('[', '{"action": "create"}', '[1]'):
+            with self.subTest(body=body):
+                response = self.post_with_token('api_users', body)
+                self.assertEqual(response.status_code, 400)
+                self.assertIn('error', response.json())
+
+    def test_user_item_errors(self):
+        response = self.post_with_token('api_users', [
+            {'action': 'rename', 'email': 'a@example.com'},
+            {'action': 'create'},
+            {'action': 'create', 'email': 'alice@example.com', 'name': 'A',
+             'enabled': True},
+            {'action': 'update', 'email': 'nobody@example.com', 'name': 'N',
+             'enabled': True},
+            {'action': 'update', 'email': 'bob@example.com', 'enabled': True},
+            {'action': 'update', 'email': 'carol@example.com', 'name': 'C',
+             'enabled': 1},
+            {'action': 'create', 'email': 'not an email', 'name': 'X',
+             'enabled': True},
+            {'action': 'delete', 'email': 'carol@example.com'},
+            {'action': 'create', 'email': 'dave@example.com', 'name': 'D',
+             'enabled': True},
+        ])
+        self.assertEqual(response.status_code, 400)
+        self.assertFalse(response.json()['ok'])
+        self.assertEqual(self.errors(response), [
+            'action must be one of create, update, delete',
+            'email is required',
+            'user already exists',
+            'no such user',
+            'name is required',
+            'enabled must be true or false',
+            'invalid email address',
+            'email occurs more than once in batch',
+            None,
+        ])
+        self.assertEqual(response.json()['results'][-1]['status'],
+                         'not applied')
+        self.assertEqual(len(self.user_rows()), len(self.users))
+
+    def test_user_batch(self):
+        response = self.post_with_token('api_users', [
+            {'action': 'create', 'email': 'dave@example.com', 'name': 'Dave',
+             'enabled': True},
+            {'action': 'update', 'email': 'alice@example.com',
+             'name': 'Alice B', 'enabled': False},
+            {'action': 'update', 'email': 'carol@example.com',
+             'name': 'Carol', 'enabled': True},
+            {'action': 'delete', 'email': 'bob@example.com'},
+        ])
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(
+            [result['status'] for result in response.json()['results']],
+            ['created', 'updated', 'updated', 'deleted'])
+        self.assertEqual(self.user_rows(), [
+            ('alice@example.com', 'Alice B', 0),
+            ('carol@example.com', 'Carol', 1),
+            ('dave@example.com', 'Dave', 1)])
+
+    def test_authority_item_errors(self):
+        response = self.post_with_token('api_authorities', [
+            {'action': 'grant', 'email': 'alice@example.com'},
+            {'action': 'grant', 'email': 'nobody@example.com',
+             'authority': 'study_b'},
+            {'action': 'grant', 'email': 'alice@example.com',
+             'authority': 'no_such_study'},
+            {'action': 'grant', 'email': 'bob@example.com',
+             'authority': 'study_b'},
+            {'action': 'revoke', 'email': 'bob@example.com',
+             'authority': 'STUDY_B'},
+        ])
+        self.assertEqual(response.status_code, 400)
+        self.assertEqual(self.errors(response), [
+            'authority is required',
+            'no such user',
+            'no such study or group',
+            None,
+            'authority occurs more than once in batch',
+        ])
+        self.assertEqual(self.authority_rows(), list(self.authorities))
+
+    def test_authority_batch(self):
+        response = self.post_with_token('api_authorities', [
+            {'action': 'grant', 'email': 'carol@example.com',
+             'authority': 'group_x'},
+            {'action': 'grant', 'email': 'alice@example.com',
+             'authority': 'study_a'},
+            {'action': 'revoke', 'email': 'bob@example.com',
+             'authority': 'GROUP_Y'},
+            {'action': 'revoke', 'email': 'bob@example.com',
+             'authority': 'ALL'},
+        ])
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(
+            [result['status'] for result in response.json()['results']],
+            ['granted', 'unchanged', 'revoked', 'unchanged'])
+        self.assertEqual(self.authority_rows(), [
+            ('alice@example.com', 'cbioportal:STUDY_A'),
+            ('carol@example.com', 'cbioportal:GROUP_X')])
+
+    def test_authority_batch_finds_unnormalized_rows(self):
+        connections['cbioportal'].cursor().executemany(r"""
+            INSERT INTO authorities (email, authority)
+            VALUES (%s, %s)""", [['carol@example.com', 'cbioportal:study_b'],
+                                 ['bob@example.com', 'cbioportal:study_a']])
+        response = self.post_with_token('api_authorities', [
+            {'action': 'grant', 'email': 'carol@example.com',
+             'authority': 'STUDY_B'},
+            {'action': 'revoke', 'email': 'bob@example.com',
+             'authority': 'STUDY_A'},
+        ])
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(
+            [result['status'] for result in response.json()['results']],
+            ['unchanged', 'revoked'])
+        self.assertEqual(self.authority_rows(), [
+            ('alice@example.com', 'cbioportal:STUDY_A'),
+            ('bob@example.com', 'cbioportal:GROUP_Y'),
+            ('carol@example.com', 'cbioportal:study_b')])
+
+
+class SearchApiTest(PortalTestCase):
+
+    def setUp(self):
+        super().setUp()
+        self.login()
+
+    def search(self, name, **params):
+        response = self.client.get(reverse(name), params)
+        self.assertEqual(response.status_code, 200)
+        data = response.json()
+        return [result['id'] for result in data['results']], data['next']
+
+    def test_requires_login(self):
+        self.client.logout()
+        for name in ('api_search_users', 'api_search_authorities'):
+            with self.subTest(name=name):
+                self.assertEqual(
+                    self.client.get(reverse(name)).status_code, 403)
+
+    def test_user_search_pages_after_last_email(self):
+        with mock.patch.object(api.UserSearch, 'paginate_by', 2):
+            self.assertEqual(self.search('api_search_users'), (
+                ['alice@example.com', 'bob@example.com'],
+                {'after': 'bob@example.com'}))
+            self.assertEqual(
+                self.search('api_search_users', after='bob@example.com'),
+                (['carol@example.com'], None))
+
+    def test_user_search_by_prefix(self):
+        self.assertEqual(self.search('api_search_users', q=' car '),
+                         (['carol@example.com'], None))
+        self.assertEqual(self.search('api_search_users', q='nobody'),
+                         ([], None))
+
+    def test_authority_search_pages_by_offset(self):
+        with mock.patch.object(api.AuthoritySearch, 'paginate_by', 2):
+            self.assertEqual(self.search('api_search_authorities', q='s'),
+                             (['STUDY_A', 'STUDY_B'], {'page': 1}))
+            self.assertEqual(
+                self.search('api_search_authorities', q='s', page=1),
+                (['STUDY_C'], None))
+            self.assertEqual(
+                self.search('api_search_authorities', q='s', page=2),
+                ([], None))
+            self.assertEqual(
+                self.search('api_search_authorities', q='s', page='x'),
+                (['STUDY_A', 'STUDY_B'], {'page': 1}))
+
+    def test_authority_search_with_empty_query(self):
+        self.assertEqual(self.search('api_search_authorities'), (
+            ['ALL', 'GROUP_X', 'GROUP_Y', 'STUDY_A', 'STUDY_B', 'STUDY_C'],
+            None))
+        self.assertEqual(self.search('api_search_authorities', q='group_'),
+                         (['GROUP_X', 'GROUP_Y'], None))
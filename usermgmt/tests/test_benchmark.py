@@ -0,0 +1,80 @@
+from django.core.management import call_command
+from django.core.management.base import CommandError
+from django.db import connections
+from django.test import TestCase
+
+from .base import PortalTestCase, reset_caches
+from .. import benchmark
+
+import io
+import json
+import os
+import tempfile
+
+
+class BenchmarkDaoCommandTest(TestCase):
+
+    multi_db = True
+
+    def tearDown(self):
+        reset_caches()
+        super().tearDown()
+
+    def test_runs_all_cases_with_tiny_volumes(self):
+        fd, path = tempfile.mkstemp(suffix='.json')
+        os.close(fd)
+        self.addCleanup(os.remove, path)
+        call_command('benchmark_dao', users=20, studies=5, groups=2,
+                     authorities=40, repeat=1, output=path,
+                     stderr=io.StringIO())
+        with open(path) as f:
+            report = json.load(f)
+        self.assertEqual(report['meta']['vendor'], 'sqlite')
+        self.assertEqual(report['meta']['volumes']['users'], 20)
+        self.assertEqual(
+            [result['name'] for result in report['results']],
+            [case.name for case in benchmark.build_cases()])
+        for result in report['results']:
+            self.assertEqual(result['repeat'], 1)
+            self.assertGreaterEqual(result['min'], 0)
+
+    def test_rejects_volumes_that_cannot_be_generated(self):
+        for volumes in ({'users': 2, 'studies': 1, 'groups': 1,
+                         'authorities': 7},
+                        {'users': 0, 'studies': 1, 'groups': 0,
+                         'authorities': 0}):
+            with self.subTest(**volumes):
+                with self.assertRaises(CommandError):
+                    call_command('benchmark_dao', repeat=1, output=os.devnull,
+                                 stderr=io.StringIO(), **volumes)
+
+
+class PopulateTest(TestCase):
+
+    multi_db = True
+
+    def tearDown(self):
+        reset_caches()
+        super().tearDown()
+
+    def test_caps_authorities_at_distinct_pairs(self):
+        volumes = benchmark.Volumes(users=2, studies=1, groups=1,
+                                    authorities=10)
+        self.assertEqual(volumes.max_authorities, 6)
+        benchmark.create_schema()
+        benchmark.populate(volumes)
+        cursor = connections['cbioportal'].cursor()
+        cursor.execute('SELECT COUNT(*) FROM authorities')
+        self.assertEqual(cursor.fetchone()[0], 6)
+
+
+class BuildCasesTest(PortalTestCase):
+
+    studies = (('study_a', 'Study A', ''),)
+
+    def test_skips_group_cases_without_groups(self):
+        names = [case.name for case in benchmark.build_cases()]
+        self.assertIn('DaoStudy.get', names)
+        for name in ('DaoStudyGroup.exists', 'DaoStudyGroup.get',
+                     'DaoAuthority.update_authorities_for_group'):
+            self.assertNotIn(name, names)
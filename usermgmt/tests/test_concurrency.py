@@ -0,0 +1,88 @@
+from django.core.urlresolvers import reverse
+from django.db import connections, transaction
+from django.test import override_settings
+
+from .base import PortalTransactionTestCase
+from .. import concurrency
+from .. import instrumentation
+from .. import portal_models
+
+import threading
+import time
+
+
+@override_settings(CBIOPORTAL_FAN_OUT_WORKERS=2)
+class FanOutTest(PortalTransactionTestCase):
+    """The worker threads use their own connections to the portal database,
+    which is a file with the test settings"""
+
+    def query(self, sql):
+        """Return the thread, its cbioportal DatabaseWrapper and the result
+        of ``sql``"""
+        cursor = connections['cbioportal'].cursor()
+        cursor.execute(sql)
+        return (threading.get_ident(), connections['cbioportal'],
+                cursor.fetchone()[0])
+
+    def test_runs_on_workers_with_own_connections(self):
+        results = concurrency.fan_out(
+            lambda: self.query('SELECT COUNT(*) FROM users'),
+            lambda: self.query('SELECT COUNT(*) FROM authorities'),
+            lambda: self.query('SELECT COUNT(*) FROM cancer_study'))
+        self.assertEqual([result[2] for result in results], [3, 2, 3])
+        self.assertEqual(results[0][0], threading.get_ident())
+        for thread, wrapper, _ in results[1:]:
+            self.assertNotEqual(thread, threading.get_ident())
+            self.assertIsNot(wrapper, connections['cbioportal'])
+            # Returned to the pool after the task
+            self.assertIsNone(wrapper.connection)
+
+    def test_reports_queries_to_caller(self):
+        log = instrumentation.QueryLog()
+        instrumentation.start_recording(log)
+        try:
+            concurrency.fan_out(
+                lambda: portal_models.DaoUser.get_user('alice@example.com'),
+                lambda: portal_models.DaoAuthority.for_user(
+                    'alice@example.com'))
+        finally:
+            instrumentation.stop_recording()
+        statements = ' '.join(sql for sql, _ in log.statements)
+        self.assertIn('FROM users', statements)
+        self.assertIn('FROM authorities', statements)
+
+    def test_reraises_first_exception_after_all_finished(self):
+        finished = []
+
+        def fail(message, delay):
+            time.sleep(delay)
+            finished.append(message)
+            raise ValueError(message)
+
+        with self.assertRaisesRegex(ValueError, '^first$'):
+            concurrency.fan_out(lambda: None, lambda: fail('first', 0.1),
+                                lambda: fail('second', 0))
+        self.assertEqual(sorted(finished), ['first', 'second'])
+
+    def test_runs_in_current_thread_inside_transaction(self):
+        with transaction.atomic(using='cbioportal'):
+            portal_models.DaoUser.create_user('dave@example.com', 'Dave',
+                                              True)
+            results = concurrency.fan_out(
+                lambda: self.query('SELECT COUNT(*) FROM users'),
+                lambda: self.query('SELECT COUNT(*) FROM users'))
+            transaction.set_rollback(True, using='cbioportal')
+        self.assertEqual([(thread, count) for thread, _, count in results],
+                         [(threading.get_ident(), 4)] * 2)
+
+    def test_user_view(self):
+        self.login()
+        response = self.client.get(
+            reverse('user_view', kwargs={'email': 'alice@example.com'}))
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.context['user'].name, 'Alice')
+        self.assertEqual([a.authority for a in response.context['authorities']],
+                         ['STUDY_A'])
+        response = self.client.get(
+            reverse('user_view', kwargs={'email': 'nobody@example.com'}))
+        self.assertEqual(response.status_code, 404)
@@ -0,0 +1,35 @@
+from django.core.urlresolvers import reverse
+
+from .base import PortalTestCase
+from .. import instrumentation
+
+
+class SqlInstrumentationMiddlewareTest(PortalTestCase):
+
+    def metrics(self, view_name):
+        with instrumentation._metrics_lock:
+            return dict(instrumentation._metrics[view_name])
+
+    def test_records_queries_of_view(self):
+        self.login()
+        before = self.metrics('user_list')
+        response = self.client.get(reverse('user_list'))
+        self.assertRegex(response['Server-Timing'],
+                         r'^cbioportal;dur=[0-9.]+;desc="[1-9][0-9]* queries"$')
+        after = self.metrics('user_list')
+        self.assertEqual(after['requests'] - before.get('requests', 0), 1)
+        self.assertGreater(after['queries'] - before.get('queries', 0), 0)
+
+    def test_records_queries_of_streamed_content(self):
+        self.login()
+        before = self.metrics('export')
+        response = self.client.get(reverse('export'))
+        self.assertEqual(self.metrics('export'), before)
+        # The test client closes the response once the content is consumed
+        content = b''.join(response.streaming_content)
+        self.assertIn(b'alice@example.com', content)
+        after = self.metrics('export')
+        self.assertEqual(after['requests'] - before.get('requests', 0), 1)
+        # SELECTs of the users and the authorities
+        self.assertEqual(after['queries'] - before.get('queries', 0), 2)
+        self.assertIsNone(instrumentation.current_recorder())
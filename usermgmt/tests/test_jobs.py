@@ -0,0 +1,122 @@
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.db import DatabaseError
+from django.test import override_settings
+
+from .base import PortalTransactionTestCase
+from .test_portal_models import SYNC_YAML, SYNCED_AUTHORITIES
+from .. import jobs
+from .. import models
+from .. import portal_models
+
+from unittest import mock
+import json
+import os
+import shutil
+import tempfile
+
+ImportJob = models.ImportJob
+
+
+class ImportJobTest(PortalTransactionTestCase):
+
+    def setUp(self):
+        super().setUp()
+        self.import_dir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.import_dir)
+
+    def create_job(self, text, mode='sync', dry_run=False):
+        path = os.path.join(self.import_dir, 'job.yaml')
+        with open(path, 'w') as f:
+            f.write(text)
+        return ImportJob.objects.create(
+            file_name='users.yaml', path=path, mode=mode, dry_run=dry_run)
+
+    def run_job(self, job):
+        jobs.run_import_job(job.pk)
+        self.assertFalse(os.path.exists(job.path))
+        return ImportJob.objects.get(pk=job.pk)
+
+    def test_succeeded(self):
+        job = self.create_job(SYNC_YAML)
+        self.assertEqual(job.status, ImportJob.STATUS_PENDING)
+        statuses = []
+
+        def sync_from_yaml(*args, **kwargs):
+            statuses.append(ImportJob.objects.get(pk=job.pk).status)
+            return sync(*args, **kwargs)
+
+        sync = portal_models.sync_from_yaml
+        with mock.patch.object(portal_models, 'sync_from_yaml',
+                               sync_from_yaml):
+            job = self.run_job(job)
+        self.assertEqual(statuses, [ImportJob.STATUS_RUNNING])
+        self.assertEqual(job.status, ImportJob.STATUS_SUCCEEDED)
+        self.assertTrue(job.is_finished)
+        self.assertLessEqual(job.started, job.finished)
+        self.assertEqual(job.rows_processed, 6)
+        self.assertEqual(job.section, 'authorities')
+        self.assertEqual(json.loads(job.result)['changes'][0]['count'], 1)
+        self.assertEqual(self.authority_rows(), SYNCED_AUTHORITIES)
+
+    def test_dry_run(self):
+        before = self.authority_rows()
+        job = self.run_job(self.create_job(SYNC_YAML, dry_run=True))
+        self.assertEqual(job.status, ImportJob.STATUS_SUCCEEDED)
+        self.assertEqual(self.authority_rows(), before)
+
+    @override_settings(CBIOPORTAL_IMPORT_MAX_ERRORS=1)
+    def test_invalid_records(self):
+        job = self.run_job(self.create_job(
+            'users:\n- {email: a, name: 1, enabled: 1}\n'
+            '- {email: b, name: 2, enabled: 1}\n'
+            'authorities: []\n', mode='import'))
+        self.assertEqual(job.status, ImportJob.STATUS_FAILED)
+        self.assertEqual(job.num_errors, 2)
+        self.assertEqual(json.loads(job.errors), [
+            {'section': 'users', 'number': 1,
+             'message': 'name must be a string'}])
+        self.assertEqual(len(self.user_rows()), 3)
+
+    def test_invalid_document(self):
+        for text, message in (
+                ('users:\n- {email: a\n', 'in "users.yaml", line 3'),
+                ('users:\n- \xff\n', 'in "users.yaml", position'),
+                ('users: []\n', 'Missing section(s) authorities')):
+            with self.subTest(text=text):
+                with open(os.path.join(self.import_dir, 'job.yaml'),
+                          'wb') as f:
+                    f.write(text.encode('latin-1'))
+                job = ImportJob.objects.create(
+                    file_name='users.yaml', mode='import',
+                    path=os.path.join(self.import_dir, 'job.yaml'))
+                job = self.run_job(job)
+                self.assertEqual(job.status, ImportJob.STATUS_FAILED)
+                self.assertIn(message, job.message)
+                self.assertNotIn(self.import_dir, job.message)
+
+    def test_other_errors_are_only_logged(self):
+        job = self.create_job(SYNC_YAML)
+        error = DatabaseError('cannot connect to {}'.format(job.path))
+        with mock.patch.object(portal_models, 'sync_from_yaml',
+                               side_effect=error):
+            with self.assertLogs(jobs.logger, 'ERROR') as cm:
+                job = self.run_job(job)
+        self.assertEqual(job.status, ImportJob.STATUS_FAILED)
+        self.assertNotIn(job.path, job.message)
+        self.assertIn(job.path, '\n'.join(cm.output))
+
+    def test_submit_import(self):
+        executor = mock.Mock()
+        with override_settings(CBIOPORTAL_IMPORT_DIR=self.import_dir), \
+                mock.patch.object(jobs, 'get_executor',
+                                  return_value=executor):
+            job = jobs.submit_import(
+                SimpleUploadedFile('users.yaml', SYNC_YAML.encode('utf-8')),
+                'import', dry_run=True)
+        executor.submit.assert_called_once_with(jobs.run_import_job, job.pk)
+        self.assertEqual(job.status, ImportJob.STATUS_PENDING)
+        # Only sync imports can be dry runs
+        self.assertFalse(job.dry_run)
+        self.assertEqual(os.path.dirname(job.path), self.import_dir)
+        with open(job.path) as f:
+            self.assertEqual(f.read(), SYNC_YAML)
@@ -0,0 +1,147 @@
+from django.core.urlresolvers import reverse
+
+from django.db import DatabaseError
+
+from .base import PortalTransactionTestCase
+from .. import journal
+from .. import models
+from .. import portal_models
+
+from unittest import mock
+import io
+
+import yaml
+
+DaoAuthority = portal_models.DaoAuthority
+DaoUser = portal_models.DaoUser
+
+
+class JournalTest(PortalTransactionTestCase):
+
+    def changes(self, since):
+        return yaml.safe_load(''.join(journal.export_changes_to_yaml(since)))
+
+    def test_export_changes(self):
+        self.assertEqual(journal.current_version(), 0)
+        DaoUser.create_users([portal_models.DbUser('dave@example.com',
+                                                   'Dave', True)])
+        since = journal.current_version()
+        DaoUser.update_user('dave@example.com', 'David', False)
+        DaoAuthority.grant([('dave@example.com', 'cbioportal:STUDY_B')])
+        DaoAuthority.revoke([('alice@example.com', 'cbioportal:STUDY_A')])
+        DaoUser.delete_user('dave@example.com')
+        result = self.changes(since)
+        self.assertEqual(result['since'], since)
+        self.assertEqual(result['version'], journal.current_version())
+        self.assertEqual(
+            [(change['action'], change['email'])
+             for change in result['changes']],
+            [('update', 'dave@example.com'),
+             ('grant', 'dave@example.com'),
+             ('revoke', 'alice@example.com'),
+             ('delete', 'dave@example.com')])
+        self.assertEqual(result['changes'][0]['name'], 'David')
+        self.assertEqual(result['changes'][0]['enabled'], 0)
+        self.assertEqual(result['changes'][1]['authority'],
+                         'cbioportal:STUDY_B')
+        versions = [change['version'] for change in result['changes']]
+        self.assertEqual(versions, sorted(versions))
+        self.assertGreater(versions[0], since)
+
+    def test_consecutive_versions(self):
+        DaoAuthority.grant([('bob@example.com', 'cbioportal:STUDY_C'),
+                            ('carol@example.com', 'cbioportal:ALL')])
+        DaoUser.delete_user('carol@example.com')
+        self.assertEqual(
+            list(models.ChangeJournalEntry.objects.order_by(
+                'version').values_list('version', flat=True)),
+            [1, 2, 3])
+        self.assertEqual(journal.current_version(), 3)
+
+    def test_exports_only_up_to_current_version(self):
+        # An entry whose transaction has not advanced the counter yet
+        models.ChangeJournalEntry.objects.create(
+            version=1, action='delete', email='bob@example.com')
+        self.assertEqual(journal.current_version(), 0)
+        self.assertEqual(self.changes(0)['changes'], None)
+
+    def test_failed_write_is_journaled_as_reset(self):
+        since = journal.current_version()
+        bulk_create = models.ChangeJournalEntry.objects.bulk_create
+        calls = []
+
+        def fail_once(entries, *args, **kwargs):
+            calls.append(entries)
+            if len(calls) == 1:
+                raise DatabaseError('disk full')
+            return bulk_create(entries, *args, **kwargs)
+
+        with mock.patch.object(models.ChangeJournalEntry.objects,
+                               'bulk_create', fail_once):
+            with self.assertLogs(journal.logger, 'ERROR'):
+                DaoAuthority.grant([('bob@example.com',
+                                     'cbioportal:STUDY_C')])
+        self.assertEqual(
+            list(models.ChangeJournalEntry.objects.values_list(
+                'version', 'action')), [(1, 'reset_authorities')])
+        with self.assertRaises(journal.ChangesUnavailable):
+            journal.export_changes_to_yaml(since)
+
+    def test_no_changes(self):
+        self.assertEqual(self.changes(0)['changes'], None)
+
+    def test_unknown_version(self):
+        for since in (-1, 1):
+            with self.subTest(since=since):
+                with self.assertRaises(journal.ChangesUnavailable):
+                    journal.export_changes_to_yaml(since)
+
+    def test_changes_before_reset_unavailable(self):
+        DaoAuthority.grant([('bob@example.com', 'cbioportal:STUDY_C')])
+        since = journal.current_version()
+        portal_models.import_from_yaml(io.StringIO(
+            'users:\n'
+            '- email: erin@example.com\n  name: Erin\n  enabled: 1\n'
+            'authorities:\n'
+            '- email: erin@example.com\n  authority: cbioportal:ALL\n'))
+        with self.assertRaises(journal.ChangesUnavailable):
+            journal.export_changes_to_yaml(since)
+        self.assertEqual(self.changes(journal.current_version())['changes'],
+                         None)
+
+
+class ExportViewTest(PortalTransactionTestCase):
+
+    def setUp(self):
+        super().setUp()
+        self.login()
+        self.url = reverse('export')
+
+    def content(self, response):
+        return b''.join(response.streaming_content).decode('utf-8')
+
+    def test_full_export_has_version(self):
+        DaoAuthority.grant([('bob@example.com', 'cbioportal:STUDY_C')])
+        result = yaml.safe_load(self.content(self.client.get(self.url)))
+        self.assertEqual(result['version'], journal.current_version())
+        self.assertEqual(len(result['users']), 3)
+
+    def test_delta_export(self):
+        since = journal.current_version()
+        DaoAuthority.grant([('bob@example.com', 'cbioportal:STUDY_C')])
+        response = self.client.get(self.url, {'since': since})
+        self.assertEqual(response.status_code, 200)
+        self.assertIn('_since_{}.yaml'.format(since),
+                      response['Content-Disposition'])
+        result = yaml.safe_load(self.content(response))
+        self.assertEqual([change['action'] for change in result['changes']],
+                         ['grant'])
+
+    def test_invalid_version(self):
+        response = self.client.get(self.url, {'since': 'x'})
+        self.assertEqual(response.status_code, 400)
+
+    def test_unavailable_version(self):
+        response = self.client.get(self.url, {'since': 5})
+        self.assertEqual(response.status_code, 410)
+        self.assertIn(b'full export', response.content)
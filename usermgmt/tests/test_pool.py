@@ -0,0 +1,149 @@
+from django.test import SimpleTestCase
+
+from .. import pool
+
+from unittest import mock
+import os
+import sqlite3
+import tempfile
+import threading
+import time
+
+
+class ConnectionPoolTest(SimpleTestCase):
+    """Tests of ConnectionPool with connections to a SQLite file"""
+
+    def setUp(self):
+        fd, self.path = tempfile.mkstemp(suffix='.sqlite3')
+        os.close(fd)
+        self.addCleanup(os.remove, self.path)
+        #: Connections that ping() rejects
+        self.broken = set()
+
+    def connect(self):
+        return sqlite3.connect(self.path, check_same_thread=False)
+
+    def ping(self, conn):
+        if id(conn) in self.broken:
+            raise sqlite3.OperationalError('gone away')
+        conn.execute('SELECT 1')
+
+    def make_pool(self, **kwargs):
+        return pool.ConnectionPool(self.connect, self.ping, **kwargs)
+
+    def assertClosed(self, conn):
+        with self.assertRaises(sqlite3.ProgrammingError):
+            conn.execute('SELECT 1')
+
+    def test_checkin_reuses_connection(self):
+        p = self.make_pool(size=2)
+        conn = p.checkout()
+        self.assertEqual(p.stats()['in_use'], 1)
+        p.checkin(conn)
+        self.assertEqual(p.stats()['idle'], 1)
+        self.assertIs(p.checkout(), conn)
+        stats = p.stats()
+        self.assertEqual(stats['connects'], 1)
+        self.assertEqual(stats['checkouts'], 2)
+        self.assertEqual(stats['open'], 1)
+
+    def test_checkin_rolls_back(self):
+        p = self.make_pool()
+        conn = p.checkout()
+        conn.execute('CREATE TABLE t (x INTEGER)')
+        conn.commit()
+        conn.execute('INSERT INTO t VALUES (1)')
+        p.checkin(conn)
+        conn = p.checkout()
+        self.assertEqual(conn.execute('SELECT COUNT(*) FROM t').fetchone(),
+                         (0,))
+
+    def test_overflow_connections_closed_on_checkin(self):
+        p = self.make_pool(size=1, max_overflow=1)
+        first, second = p.checkout(), p.checkout()
+        self.assertEqual(p.stats()['open'], 2)
+        p.checkin(first)
+        p.checkin(second)
+        stats = p.stats()
+        self.assertEqual((stats['open'], stats['idle']), (1, 1))
+        self.assertClosed(second)
+
+    def test_checkout_times_out_beyond_overflow(self):
+        p = self.make_pool(size=1, max_overflow=1, timeout=0.05)
+        in_use = [p.checkout(), p.checkout()]
+        with self.assertRaises(pool.PoolTimeout):
+            p.checkout()
+        stats = p.stats()
+        self.assertEqual((stats['waits'], stats['timeouts']), (1, 1))
+        self.assertEqual(stats['open'], len(in_use))
+
+    def test_waiting_checkout_gets_returned_connection(self):
+        p = self.make_pool(size=1, max_overflow=0, timeout=5)
+        conn = p.checkout()
+        result = []
+        waiter = threading.Thread(target=lambda: result.append(p.checkout()))
+        waiter.start()
+        time.sleep(0.05)
+        self.assertEqual(result, [])
+        p.checkin(conn)
+        waiter.join(5)
+        self.assertEqual(result, [conn])
+        self.assertEqual(p.stats()['waits'], 1)
+
+    def test_recycles_old_connections(self):
+        p = self.make_pool(recycle=60)
+        conn = p.checkout()
+        p.checkin(conn)
+        p._created[id(conn)] -= 61
+        new = p.checkout()
+        self.assertIsNot(new, conn)
+        self.assertClosed(conn)
+        stats = p.stats()
+        self.assertEqual((stats['recycled'], stats['open']), (1, 1))
+
+    def test_replaces_connection_that_fails_ping(self):
+        p = self.make_pool()
+        conn = p.checkout()
+        p.checkin(conn)
+        self.broken.add(id(conn))
+        new = p.checkout()
+        self.assertIsNot(new, conn)
+        self.assertClosed(conn)
+        stats = p.stats()
+        self.assertEqual((stats['ping_failures'], stats['open']), (1, 1))
+
+    def test_no_ping_without_pre_ping(self):
+        p = self.make_pool(pre_ping=False)
+        conn = p.checkout()
+        p.checkin(conn)
+        self.broken.add(id(conn))
+        self.assertIs(p.checkout(), conn)
+
+    def test_forgets_connections_after_fork(self):
+        p = self.make_pool(size=1, max_overflow=0)
+        inherited = p.checkout()
+        with mock.patch.object(pool.os, 'getpid',
+                               return_value=os.getpid() + 1):
+            conn = p.checkout()
+            self.assertIsNot(conn, inherited)
+            self.assertEqual(p.stats()['open'], 1)
+            p.checkin(inherited)
+            stats = p.stats()
+            self.assertEqual((stats['open'], stats['idle']), (1, 0))
+            p.checkin(conn)
+            self.assertIs(p.checkout(), conn)
+
+
+class GetPoolTest(SimpleTestCase):
+
+    def test_one_pool_per_alias_configured_from_settings(self):
+        settings_dict = {'POOL': {'SIZE': 2, 'MAX_OVERFLOW': 3,
+                                  'TIMEOUT': 4, 'RECYCLE': 5,
+                                  'PRE_PING': False}}
+        with mock.patch.dict(pool._pools, clear=True):
+            p = pool.get_pool('test', settings_dict, None, None)
+            self.assertIs(pool.get_pool('test', {}, None, None), p)
+            self.assertEqual(
+                (p.size, p.max_overflow, p.timeout, p.recycle, p.pre_ping),
+                (2, 3, 4, 5, False))
+            self.assertEqual(set(pool.all_stats()), {'test'})
@@ -0,0 +1,661 @@
+from django.core.urlresolvers import reverse
+from django.db import connections
+from django.test import SimpleTestCase, override_settings
+
+from .base import PortalTestCase, PortalTransactionTestCase
+from .. import instrumentation
+from .. import portal_models
+from .. import signals
+
+from unittest import mock
+import io
+
+import yaml
+
+DaoAuthority = portal_models.DaoAuthority
+DaoStatistics = portal_models.DaoStatistics
+DaoStudyCatalog = portal_models.DaoStudyCatalog
+DaoUser = portal_models.DaoUser
+DbAuthority = portal_models.DbAuthority
+
+
+class DaoUserDirectAccessTest(PortalTestCase):
+
+    def test_with_direct_access_to_many(self):
+        result = DaoUser.with_direct_access_to_many(
+            ['study_a', 'GROUP_Y', 'study_c'])
+        self.assertEqual(
+            [u.email for u in result['study_a']], ['alice@example.com'])
+        self.assertEqual(
+            [u.email for u in result['GROUP_Y']], ['bob@example.com'])
+        self.assertEqual(result['study_c'], [])
+
+    def test_with_direct_access_to_many_orders_by_email(self):
+        DaoUser.create_users([portal_models.DbUser('aaron@example.com',
+                                                   'Aaron', True)])
+        portal_models.DaoAuthority.grant([
+            ('aaron@example.com', 'cbioportal:STUDY_A')])
+        self.assertEqual(
+            [u.email for u in DaoUser.with_direct_access_to('study_a')],
+            ['aaron@example.com', 'alice@example.com'])
+
+    def test_with_direct_access_to_matches_case_insensitively(self):
+        self.assertEqual(
+            [u.email for u in DaoUser.with_direct_access_to('Study_A')],
+            ['alice@example.com'])
+
+
+
+@override_settings(CBIOPORTAL_CATALOG_TTL=60)
+class DaoStudyCatalogTest(PortalTestCase):
+
+    def setUp(self):
+        super().setUp()
+        self.now = 1000.0
+        patcher = mock.patch.object(portal_models.time, 'monotonic',
+                                    side_effect=lambda: self.now)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        self.loaded = []
+        signals.catalog_loaded.connect(self.on_loaded)
+        self.addCleanup(signals.catalog_loaded.disconnect, self.on_loaded)
+
+    def on_loaded(self, sender, catalog, **kwargs):
+        self.loaded.append(catalog)
+
+    def counters(self):
+        stats = DaoStudyCatalog.stats()
+        return stats['hits'], stats['misses']
+
+    def rename_study_c(self):
+        connections['cbioportal'].cursor().execute(
+            "UPDATE cancer_study SET name = 'Study C2' "
+            "WHERE cancer_study_identifier = 'study_c'")
+
+    def test_cached_until_ttl_expires(self):
+        hits, misses = self.counters()
+        with self.assertNumQueries(1, using='cbioportal'):
+            catalog = DaoStudyCatalog.get()
+            self.assertIs(DaoStudyCatalog.get(), catalog)
+        self.assertEqual(self.counters(), (hits + 1, misses + 1))
+        self.rename_study_c()
+        self.now += 59
+        self.assertIs(DaoStudyCatalog.get(), catalog)
+        self.now += 1
+        with self.assertNumQueries(1, using='cbioportal'):
+            reloaded = DaoStudyCatalog.get()
+        self.assertEqual(reloaded.version, catalog.version + 1)
+        self.assertEqual(reloaded.studies_by_key['STUDY_C'].name, 'Study C2')
+        self.assertEqual(self.counters(), (hits + 2, misses + 2))
+        self.assertEqual(self.loaded, [catalog, reloaded])
+
+    def test_refresh_reloads_before_ttl(self):
+        catalog = DaoStudyCatalog.get()
+        hits, misses = self.counters()
+        self.rename_study_c()
+        refreshed = DaoStudyCatalog.refresh()
+        self.assertEqual(refreshed.version, catalog.version + 1)
+        self.assertEqual(refreshed.studies_by_key['STUDY_C'].name, 'Study C2')
+        self.assertIs(DaoStudyCatalog.get(), refreshed)
+        self.assertEqual(self.counters(), (hits + 1, misses + 1))
+        self.assertEqual(self.loaded, [catalog, refreshed])
+
+    def test_invalidate(self):
+        DaoStudyCatalog.get()
+        self.assertTrue(DaoStudyCatalog.stats()['loaded'])
+        DaoStudyCatalog.invalidate()
+        stats = DaoStudyCatalog.stats()
+        self.assertFalse(stats['loaded'])
+        self.assertEqual(DaoStudyCatalog.get().version, stats['version'] + 1)
+
+
+
+class DaoStatisticsTest(PortalTransactionTestCase):
+
+    authorities = PortalTransactionTestCase.authorities + (
+        ('bob@example.com', 'cbioportal:study_a'),
+        ('carol@example.com', 'cbioportal:ALL'),
+        ('carol@example.com', 'cbioportal:GONE'),
+    )
+
+    def test_counters_from_one_query(self):
+        DaoStudyCatalog.get()
+        with self.assertNumQueries(1, using='cbioportal'):
+            statistics = DaoStatistics.get()
+        self.assertEqual(statistics.num_users, 3)
+        self.assertEqual(statistics.num_disabled_users, 1)
+        self.assertEqual(statistics.num_studies, 3)
+        self.assertEqual(statistics.num_study_groups, 2)
+        self.assertEqual(statistics.num_authorities, 5)
+        self.assertEqual(statistics.num_all_access, 1)
+        self.assertEqual(statistics.num_orphaned_authorities, 1)
+        self.assertEqual(
+            [(study.identifier, count)
+             for study, count in statistics.authorities_per_study],
+            [('study_a', 2), ('study_b', 0), ('study_c', 0)])
+        with self.assertNumQueries(0, using='cbioportal'):
+            self.assertIs(DaoStatistics.get(), statistics)
+
+    def test_invalidated_by_writes(self):
+        statistics = DaoStatistics.get()
+        DaoUser.create_user('dave@example.com', 'Dave', False)
+        reloaded = DaoStatistics.get()
+        self.assertIsNot(reloaded, statistics)
+        self.assertEqual(reloaded.num_users, 4)
+        self.assertEqual(reloaded.num_disabled_users, 2)
+        DaoAuthority.revoke([('carol@example.com', 'cbioportal:GONE')])
+        self.assertEqual(DaoStatistics.get().num_orphaned_authorities, 0)
+
+
+
+class ClassifyAuthoritiesTest(PortalTestCase):
+
+    #: ``(authority, kind)``
+    cases = (
+        ('cbioportal:ALL', DbAuthority.ALL),
+        ('all', DbAuthority.ALL),
+        ('cbioportal:STUDY_A', DbAuthority.STUDY),
+        ('cbioportal:study_b', DbAuthority.STUDY),
+        ('Study_C', DbAuthority.STUDY),
+        ('cbioportal:GROUP_X', DbAuthority.GROUP),
+        ('cbioportal:group_y', DbAuthority.GROUP),
+        ('cbioportal:NO_STUDY', DbAuthority.ORPHANED),
+        ('cbioportal:', DbAuthority.ORPHANED),
+        ('STUDY_A;GROUP_X', DbAuthority.ORPHANED),
+    )
+
+    def test_classify(self):
+        authorities = [DbAuthority(authority, 'alice@example.com')
+                       for authority, _ in self.cases]
+        DaoStudyCatalog.get()
+        with self.assertNumQueries(0, using='cbioportal'):
+            self.assertIs(DaoAuthority.classify(authorities), authorities)
+        for (authority, kind), result in zip(self.cases, authorities):
+            with self.subTest(authority=authority):
+                self.assertEqual(result.kind, kind)
+
+    def test_kind_is_set_on_demand(self):
+        for authority, kind in self.cases:
+            with self.subTest(authority=authority):
+                result = DbAuthority(authority, 'alice@example.com')
+                self.assertIsNone(result.kind)
+                self.assertEqual(result.is_for_study,
+                                 kind == DbAuthority.STUDY)
+                self.assertEqual(result.kind, kind)
+
+    def test_all_authorities(self):
+        DaoAuthority.grant([('carol@example.com', 'cbioportal:GONE')])
+        self.assertEqual(
+            [(authority.email, authority.authority, authority.kind)
+             for authority in DaoAuthority.all_authorities()],
+            [('alice@example.com', 'STUDY_A', DbAuthority.STUDY),
+             ('bob@example.com', 'GROUP_Y', DbAuthority.GROUP),
+             ('carol@example.com', 'GONE', DbAuthority.ORPHANED)])
+
+
+
+class StudyGroupsTest(SimpleTestCase):
+
+    def test_parse_groups(self):
+        for value, groups in (
+                (None, []),
+                ('', []),
+                (' ', []),
+                (';', []),
+                ('; ;;', []),
+                ('GROUP_X', ['GROUP_X']),
+                (' group_y ; GROUP_X; ', ['GROUP_X', 'group_y']),
+                ('group_x;GROUP_X;Group_X', ['group_x']),
+                ('GROUP_X;;group_x; group_y', ['GROUP_X', 'group_y'])):
+            with self.subTest(value=value):
+                self.assertEqual(portal_models.parse_groups(value), groups)
+
+    def test_groups_by_key(self):
+        studies = [
+            portal_models.DbStudy(identifier, identifier.title(),
+                                  portal_models.parse_groups(groups))
+            for identifier, groups in (
+                ('study_a', 'GROUP_X;group_y'),
+                ('study_b', 'Group_Y'),
+                ('study_c', ''),
+                ('study_d', ' ;group_x'))]
+        catalog = portal_models.DbStudyCatalog(1, studies)
+        for key, name, identifiers in (
+                ('GROUP_X', 'GROUP_X', ['study_a', 'study_d']),
+                ('GROUP_Y', 'group_y', ['study_a', 'study_b'])):
+            with self.subTest(key=key):
+                group = catalog.groups_by_key[key]
+                self.assertEqual(group.name, name)
+                self.assertEqual(
+                    [study.identifier for study in group.studies],
+                    identifiers)
+        self.assertEqual(sorted(catalog.groups_by_key),
+                         ['GROUP_X', 'GROUP_Y'])
+        self.assertEqual(sorted(catalog.groups), ['GROUP_X', 'group_y'])
+        self.assertEqual(
+            catalog.authority_keys,
+            ['ALL', 'GROUP_X', 'GROUP_Y', 'STUDY_A', 'STUDY_B', 'STUDY_C',
+             'STUDY_D'])
+
+
+class DaoUserWriteTest(PortalTestCase):
+
+    def test_create_existing_user(self):
+        with self.assertRaises(portal_models.AlreadyExists):
+            DaoUser.create_user('alice@example.com', 'Other', False)
+        self.assertIn(('alice@example.com', 'Alice', 1), self.user_rows())
+
+    def test_update_and_delete_missing_user(self):
+        before = self.user_rows()
+        with self.assertRaises(portal_models.NotFound):
+            DaoUser.update_user('nobody@example.com', 'Nobody', True)
+        with self.assertRaises(portal_models.NotFound):
+            DaoUser.delete_user('nobody@example.com')
+        self.assertEqual(self.user_rows(), before)
+
+    def test_update_users_with_one_statement_per_chunk(self):
+        log = instrumentation.QueryLog()
+        instrumentation.start_recording(log)
+        try:
+            DaoUser.update_users([
+                portal_models.DbUser('alice@example.com', 'Alice B', False),
+                portal_models.DbUser('carol@example.com', 'Carol B', True),
+                portal_models.DbUser('nobody@example.com', 'Nobody', True),
+            ], chunk_size=2)
+        finally:
+            instrumentation.stop_recording()
+        self.assertEqual(log.count, 2)
+        self.assertEqual(self.user_rows(), [
+            ('alice@example.com', 'Alice B', 0),
+            ('bob@example.com', 'Bob', 1),
+            ('carol@example.com', 'Carol B', 1)])
+
+
+class IterYamlSectionsTest(SimpleTestCase):
+
+    def sections(self, text):
+        return [(section, list(records)) for section, records
+                in portal_models.iter_yaml_sections(text)]
+
+    def test_parses_records(self):
+        self.assertEqual(self.sections(
+            "users:\n"
+            "- email: 'a@example.com'\n  name: A\n  enabled: 1\n"
+            "- {email: b@example.com, name: '1', enabled: false}\n"
+            "authorities:\n"
+            "- email: a@example.com\n  authority: cbioportal:STUDY\n"), [
+                ('users', [
+                    {'email': 'a@example.com', 'name': 'A', 'enabled': 1},
+                    {'email': 'b@example.com', 'name': '1',
+                     'enabled': False}]),
+                ('authorities', [{'email': 'a@example.com',
+                                  'authority': 'cbioportal:STUDY'}]),
+            ])
+
+    def test_reads_file_like_objects(self):
+        self.assertEqual(
+            self.sections(io.BytesIO(b'users:\n- {email: a}\n')),
+            [('users', [{'email': 'a'}])])
+
+    def test_skips_other_keys(self):
+        self.assertEqual(self.sections(
+            'version: 3\n'
+            'other:\n  nested: [1, {a: [2, 3]}]\n'
+            'users: []\n'), [('users', [])])
+
+    def test_empty_section_and_document(self):
+        self.assertEqual(self.sections('users:\nauthorities: []\n'),
+                         [('users', []), ('authorities', [])])
+        self.assertEqual(self.sections(''), [])
+
+    def test_skips_unconsumed_records(self):
+        sections = portal_models.iter_yaml_sections(
+            'users:\n- {email: a}\n- {email: b}\nauthorities:\n'
+            '- {email: a, authority: X}\n')
+        section, records = next(sections)
+        self.assertEqual((section, next(records)), ('users', {'email': 'a'}))
+        section, records = next(sections)
+        self.assertEqual((section, list(records)),
+                         ('authorities', [{'email': 'a', 'authority': 'X'}]))
+
+    def test_rejects_invalid_structure(self):
+        for text in (
+                '- users\n',
+                'users: everybody\n',
+                'users:\n- just a string\n',
+                'users:\n- email: [a, b]\n',
+                'users:\n- {email: {a: b}}\n',
+                'users: []\nusers: []\n'):
+            with self.subTest(text=text):
+                with self.assertRaises(ValueError):
+                    self.sections(text)
+
+    def test_rejects_invalid_yaml(self):
+        with self.assertRaises(yaml.YAMLError):
+            self.sections('users:\n- {email: a\n')
+
+
+#: Import document that keeps alice, updates bob, adds dave and drops carol;
+#: alice keeps STUDY_A and gets STUDY_B, bob loses GROUP_Y
+SYNC_YAML = """
+users:
+- {email: alice@example.com, name: Alice, enabled: 1}
+- {email: bob@example.com, name: Robert, enabled: 0}
+- {email: dave@example.com, name: Dave, enabled: 1}
+authorities:
+- {email: alice@example.com, authority: 'cbioportal:STUDY_A'}
+- {email: alice@example.com, authority: 'cbioportal:STUDY_B'}
+- {email: dave@example.com, authority: 'cbioportal:ALL'}
+"""
+
+SYNCED_AUTHORITIES = [
+    ('alice@example.com', 'cbioportal:STUDY_A'),
+    ('alice@example.com', 'cbioportal:STUDY_B'),
+    ('dave@example.com', 'cbioportal:ALL'),
+]
+
+
+class ImportTest(PortalTestCase):
+
+    def test_plan_import_from_yaml(self):
+        plan = portal_models.plan_import_from_yaml(SYNC_YAML)
+        self.assertEqual([u.email for u in plan.users_created],
+                         ['dave@example.com'])
+        self.assertEqual([(u.email, u.name) for u in plan.users_updated],
+                         [('bob@example.com', 'Robert')])
+        self.assertEqual(plan.users_deleted, ['carol@example.com'])
+        self.assertEqual(plan.authorities_granted, [
+            ('alice@example.com', 'cbioportal:STUDY_B'),
+            ('dave@example.com', 'cbioportal:ALL')])
+        self.assertEqual(plan.authorities_revoked,
+                         [('bob@example.com', 'cbioportal:GROUP_Y')])
+        changes = {change['label']: change['count']
+                   for change in plan.to_dict()['changes']}
+        self.assertEqual(changes, {
+            'Users created': 1, 'Users updated': 1, 'Users deleted': 1,
+            'Authorities granted': 2, 'Authorities revoked': 1})
+
+    def test_sync_from_yaml(self):
+        plan = portal_models.sync_from_yaml(SYNC_YAML, chunk_size=1)
+        self.assertEqual(len(plan.users_created), 1)
+        self.assertEqual(self.user_rows(), [
+            ('alice@example.com', 'Alice', 1),
+            ('bob@example.com', 'Robert', 0),
+            ('dave@example.com', 'Dave', 1)])
+        self.assertEqual(self.authority_rows(), SYNCED_AUTHORITIES)
+        plan = portal_models.sync_from_yaml(SYNC_YAML)
+        self.assertEqual(str(plan).split(' (')[0],
+                         '0 users created, 0 updated, 0 deleted; '
+                         '0 authorities granted, 0 revoked')
+
+    def test_sync_from_yaml_dry_run(self):
+        before = (self.user_rows(), self.authority_rows())
+        plan = portal_models.sync_from_yaml(SYNC_YAML, dry_run=True)
+        self.assertEqual(len(plan.users_deleted), 1)
+        self.assertEqual((self.user_rows(), self.authority_rows()), before)
+
+    def test_import_from_yaml(self):
+        stats = portal_models.import_from_yaml(SYNC_YAML, chunk_size=2)
+        self.assertEqual((stats.num_users, stats.num_authorities), (3, 3))
+        self.assertEqual(self.authority_rows(), SYNCED_AUTHORITIES)
+
+    def test_reports_progress(self):
+        progress = []
+        portal_models.sync_from_yaml(
+            SYNC_YAML, dry_run=True,
+            progress=lambda section, count: progress.append((section, count)))
+        self.assertEqual(progress, [('users', 1), ('users', 2), ('users', 3),
+                                    ('authorities', 1), ('authorities', 2),
+                                    ('authorities', 3)])
+
+    def test_invalid_records_write_nothing(self):
+        before = (self.user_rows(), self.authority_rows())
+        text = SYNC_YAML + '- {email: dave@example.com}\n'
+        for func in (portal_models.import_from_yaml,
+                     portal_models.sync_from_yaml):
+            with self.subTest(func=func.__name__):
+                with self.assertRaises(portal_models.InvalidRecords) as cm:
+                    func(text)
+                self.assertEqual(cm.exception.errors, [
+                    ('authorities', 4, 'authority must be a string')])
+                self.assertEqual((self.user_rows(), self.authority_rows()),
+                                 before)
+
+    def test_missing_section(self):
+        with self.assertRaises(ValueError):
+            portal_models.plan_import_from_yaml('users: []\n')
+        with self.assertRaises(ValueError):
+            portal_models.import_from_yaml('authorities: []\n')
+
+
+class ApplyDeltaTest(PortalTestCase):
+
+    authorities = PortalTestCase.authorities + (
+        ('alice@example.com', 'cbioportal:GROUP_X'),
+    )
+
+    def writes(self, func, *args):
+        """Call ``func``, return the verbs of the INSERT and DELETE
+        statements run, including those run with executemany()"""
+        verbs = []
+
+        class Recorder(instrumentation.QueryRecorder):
+            def record(self, sql, seconds, params=None, many=False):
+                verbs.append(sql.split()[0].upper())
+
+        instrumentation.start_recording(Recorder())
+        try:
+            func(*args)
+        finally:
+            instrumentation.stop_recording()
+        return [verb for verb in verbs if verb in ('INSERT', 'DELETE')]
+
+    def test_grants_and_revokes_only_differences(self):
+        self.assertEqual(self.writes(
+            DaoAuthority.update_authorities_for_user, 'alice@example.com',
+            ['study_a', 'study_b']), ['DELETE', 'INSERT'])
+        self.assertEqual(self.authority_rows(), [
+            ('alice@example.com', 'cbioportal:STUDY_A'),
+            ('alice@example.com', 'cbioportal:STUDY_B'),
+            ('bob@example.com', 'cbioportal:GROUP_Y')])
+
+    def test_unchanged_authorities_write_nothing(self):
+        self.assertEqual(self.writes(
+            DaoAuthority.update_authorities_for_user, 'alice@example.com',
+            ['STUDY_A', 'group_x']), [])
+        self.assertEqual(self.writes(
+            DaoAuthority.update_authorities_for_study, 'study_a',
+            ['alice@example.com']), [])
+
+    def test_compares_authorities_case_insensitively(self):
+        DaoAuthority.grant([('alice@example.com', 'cbioportal:study_a')])
+        self.assertEqual(self.writes(
+            DaoAuthority.update_authorities_for_user, 'alice@example.com',
+            ['STUDY_A', 'GROUP_X']), [])
+        self.assertEqual(self.writes(
+            DaoAuthority._apply_delta,
+            [('alice@example.com', 'cbioportal:study_a')],
+            [('alice@example.com', 'cbioportal:STUDY_A')]), [])
+        self.writes(DaoAuthority.update_authorities_for_user,
+                    'alice@example.com', ['GROUP_X'])
+        self.assertEqual(self.authority_rows(), [
+            ('alice@example.com', 'cbioportal:GROUP_X'),
+            ('bob@example.com', 'cbioportal:GROUP_Y')])
+
+    def test_existing_compares_authorities_case_insensitively(self):
+        DaoAuthority.grant([('alice@example.com', 'cbioportal:study_a')])
+        self.assertEqual(DaoAuthority.existing([
+            ('alice@example.com', 'cbioportal:STUDY_A'),
+            ('alice@example.com', 'cbioportal:STUDY_B'),
+            ('bob@example.com', 'cbioportal:group_y')]), {
+            ('alice@example.com', 'STUDY_A'): [
+                ('alice@example.com', 'cbioportal:STUDY_A'),
+                ('alice@example.com', 'cbioportal:study_a')],
+            ('bob@example.com', 'GROUP_Y'): [
+                ('bob@example.com', 'cbioportal:GROUP_Y')]})
+        self.assertEqual(DaoAuthority.existing([]), {})
+
+    def test_update_authorities_for_study(self):
+        DaoAuthority.update_authorities_for_study(
+            'STUDY_A', ['bob@example.com', 'nobody@example.com'])
+        self.assertEqual(self.authority_rows(), [
+            ('alice@example.com', 'cbioportal:GROUP_X'),
+            ('bob@example.com', 'cbioportal:GROUP_Y'),
+            ('bob@example.com', 'cbioportal:STUDY_A')])
+
+    def test_update_authorities_for_group(self):
+        DaoAuthority.update_authorities_for_group('group_y', [])
+        self.assertEqual(self.authority_rows(), [
+            ('alice@example.com', 'cbioportal:GROUP_X'),
+            ('alice@example.com', 'cbioportal:STUDY_A')])
+
+    def test_not_found(self):
+        for func, name in (
+                (DaoAuthority.update_authorities_for_user, 'no@example.com'),
+                (DaoAuthority.update_authorities_for_study, 'no_study'),
+                (DaoAuthority.update_authorities_for_group, 'NO_GROUP')):
+            with self.subTest(func=func.__name__):
+                with self.assertRaises(portal_models.NotFound):
+                    func(name, [])
+
+
+class PageUsersTest(PortalTestCase):
+
+    users = tuple(('user{}@example.com'.format(i), 'User {}'.format(i), 1)
+                  for i in range(7)) + (('zoe@example.com', 'Alpha', 1),)
+
+    def emails(self, page):
+        return [user.email[:5] for user in page]
+
+    def test_forward(self):
+        page = DaoUser.page_users(3)
+        self.assertEqual(self.emails(page), ['user0', 'user1', 'user2'])
+        self.assertEqual((page.has_previous, page.has_next), (False, True))
+        page = DaoUser.page_users(3, after=page.last_email)
+        self.assertEqual(self.emails(page), ['user3', 'user4', 'user5'])
+        self.assertEqual((page.has_previous, page.has_next), (True, True))
+        page = DaoUser.page_users(3, after=page.last_email)
+        self.assertEqual(self.emails(page), ['user6', 'zoe@e'])
+        self.assertEqual((page.has_previous, page.has_next), (True, False))
+
+    def test_backward(self):
+        page = DaoUser.page_users(3, before='user6@example.com')
+        self.assertEqual(self.emails(page), ['user3', 'user4', 'user5'])
+        self.assertEqual((page.has_previous, page.has_next), (True, True))
+        page = DaoUser.page_users(3, before=page.first_email)
+        self.assertEqual(self.emails(page), ['user0', 'user1', 'user2'])
+        self.assertEqual((page.has_previous, page.has_next), (False, True))
+
+    def test_search_by_email_or_name(self):
+        self.assertEqual(self.emails(DaoUser.page_users(10, query='USER1')),
+                         ['user1'])
+        self.assertEqual(self.emails(DaoUser.page_users(10, query='alp')),
+                         ['zoe@e'])
+        page = DaoUser.page_users(2, after='user3@example.com', query='user')
+        self.assertEqual(self.emails(page), ['user4', 'user5'])
+        self.assertTrue(page.has_next)
+
+    def test_search_escapes_wildcards(self):
+        self.assertEqual(len(DaoUser.page_users(10, query='user_')), 0)
+        self.assertEqual(len(DaoUser.page_users(10, query='%')), 0)
+
+    def test_user_list_view(self):
+        self.login()
+        response = self.client.get(reverse('user_list'),
+                                   {'after': 'user5@example.com'})
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(self.emails(response.context['users']),
+                         ['user6', 'zoe@e'])
+
+
+class BulkAccessTest(PortalTestCase):
+
+    authorities = PortalTestCase.authorities + (
+        ('bob@example.com', 'cbioportal:GROUP_Y'),)
+
+    def test_preview_bulk(self):
+        preview = DaoAuthority.preview_bulk(
+            ['alice@example.com', 'bob@example.com', 'alice@example.com'],
+            ['study_a', 'group_y'])
+        self.assertEqual((preview.num_users, preview.num_authorities),
+                         (2, 2))
+        self.assertEqual(preview.num_pairs, 4)
+        self.assertEqual(preview.num_existing, 2)
+        self.assertEqual(preview.num_existing_rows, 3)
+        self.assertEqual(preview.num_to_grant, 2)
+
+    def test_grant_bulk_skips_existing_rows_and_unknown_users(self):
+        granted = DaoAuthority.grant_bulk(
+            ['alice@example.com', 'bob@example.com', 'nobody@example.com'],
+            ['Study_A', 'GROUP_Y'])
+        self.assertEqual(sorted(granted), [
+            ('alice@example.com', 'cbioportal:GROUP_Y'),
+            ('bob@example.com', 'cbioportal:STUDY_A'),
+        ])
+        self.assertEqual(self.authority_rows(), [
+            ('alice@example.com', 'cbioportal:GROUP_Y'),
+            ('alice@example.com', 'cbioportal:STUDY_A'),
+            ('bob@example.com', 'cbioportal:GROUP_Y'),
+            ('bob@example.com', 'cbioportal:GROUP_Y'),
+            ('bob@example.com', 'cbioportal:STUDY_A'),
+        ])
+
+    def test_grant_bulk_inserts_the_returned_rows(self):
+        log = instrumentation.QueryLog()
+        instrumentation.start_recording(log)
+        try:
+            granted = DaoAuthority.grant_bulk(
+                ['alice@example.com', 'carol@example.com'],
+                ['STUDY_A', 'STUDY_C'])
+        finally:
+            instrumentation.stop_recording()
+        # Lock the users and select the existing rows; the insert is run
+        # with executemany(), which QueryLog does not keep
+        statements = [sql.split() for sql, _ in log.statements
+                      if not sql.startswith(('SAVEPOINT', 'RELEASE'))]
+        self.assertEqual(
+            [(words[0], words[words.index('FROM') + 1])
+             for words in statements],
+            [('SELECT', 'users'), ('SELECT', 'authorities')])
+        self.assertEqual(granted, [
+            ('alice@example.com', 'cbioportal:STUDY_C'),
+            ('carol@example.com', 'cbioportal:STUDY_A'),
+            ('carol@example.com', 'cbioportal:STUDY_C'),
+        ])
+        self.assertEqual(self.authority_rows()[:2], [
+            ('alice@example.com', 'cbioportal:STUDY_A'),
+            ('alice@example.com', 'cbioportal:STUDY_C'),
+        ])
+        self.assertEqual(self.authority_rows()[-2:], granted[1:])
+
+    def test_revoke_bulk_deletes_duplicate_rows(self):
+        revoked = DaoAuthority.revoke_bulk(
+            ['bob@example.com', 'carol@example.com'], ['group_y', 'ALL'])
+        self.assertEqual(revoked, [('bob@example.com', 'cbioportal:GROUP_Y')])
+        self.assertEqual(self.authority_rows(),
+                         [('alice@example.com', 'cbioportal:STUDY_A')])
+
+    def test_empty_arguments_write_nothing(self):
+        with self.assertNumQueries(0, using='cbioportal'):
+            self.assertEqual(DaoAuthority.grant_bulk([], ['study_a']), [])
+            self.assertEqual(
+                DaoAuthority.revoke_bulk(['alice@example.com'], []), [])
+
+    def test_bulk_access_view(self):
+        self.login()
+        data = {'users': ['carol@example.com'],
+                'authorities': ['STUDY_B', 'STUDY_C'], 'action': 'grant'}
+        response = self.client.post(reverse('bulk_access'), data)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.context['preview'].num_to_grant, 2)
+        self.assertNotIn(('carol@example.com', 'cbioportal:STUDY_B'),
+                         self.authority_rows())
+        data['apply'] = '1'
+        response = self.client.post(reverse('bulk_access'), data)
+        self.assertRedirects(response, reverse('bulk_access'))
+        self.assertIn(('carol@example.com', 'cbioportal:STUDY_B'),
+                      self.authority_rows())
+        data['action'] = 'revoke'
+        self.client.post(reverse('bulk_access'), data)
+        self.assertNotIn(('carol@example.com', 'cbioportal:STUDY_B'),
+                         self.authority_rows())
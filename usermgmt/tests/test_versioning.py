@@ -0,0 +1,75 @@
+from django.contrib.auth.models import User
+from django.core.urlresolvers import reverse
+from django.db import connections
+
+from .base import PortalTestCase, PortalTransactionTestCase
+from .. import portal_models
+from .. import versioning
+
+
+class ConditionalGetTest(PortalTestCase):
+
+    def setUp(self):
+        super().setUp()
+        self.login()
+        self.url = reverse('user_list')
+
+    def test_not_modified(self):
+        response = self.client.get(self.url)
+        self.assertEqual(response.status_code, 200)
+        self.assertIn('Last-Modified', response)
+        response = self.client.get(self.url,
+                                   HTTP_IF_NONE_MATCH=response['ETag'])
+        self.assertEqual(response.status_code, 304)
+        self.assertEqual(response.content, b'')
+
+    def test_not_modified_skips_queries(self):
+        etag = self.client.get(self.url)['ETag']
+        with self.assertNumQueries(0, using='cbioportal'):
+            self.client.get(self.url, HTTP_IF_NONE_MATCH=etag)
+
+    def test_changed_data_kind(self):
+        etag = self.client.get(self.url)['ETag']
+        versioning.bump('studies')
+        response = self.client.get(self.url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 304)
+        versioning.bump('users')
+        response = self.client.get(self.url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 200)
+        self.assertNotEqual(response['ETag'], etag)
+
+    def test_etag_depends_on_query_and_user(self):
+        etag = self.client.get(self.url)['ETag']
+        self.assertNotEqual(self.client.get(self.url, {'q': 'a'})['ETag'],
+                            etag)
+        User.objects.create_user('other', 'other@example.com', 'secret')
+        self.client.login(username='other', password='secret')
+        response = self.client.get(self.url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 200)
+
+    def test_changed_studies_detected_from_catalog(self):
+        token, _ = versioning.get_data_version(('studies',))
+        connections['cbioportal'].cursor().execute(r"""
+            INSERT INTO cancer_study
+                (cancer_study_id, cancer_study_identifier, name, groups)
+            VALUES (99, 'study_z', 'Study Z', '')""")
+        self.assertEqual(versioning.get_data_version(('studies',))[0], token)
+        portal_models.DaoStudyCatalog.invalidate()
+        self.assertNotEqual(versioning.get_data_version(('studies',))[0],
+                            token)
+
+
+class DataVersionReceiversTest(PortalTransactionTestCase):
+
+    def test_writes_bump_versions(self):
+        users, _ = versioning.get_data_version(('users',))
+        authorities, _ = versioning.get_data_version(('authorities',))
+        portal_models.DaoUser.update_user('alice@example.com', 'A', True)
+        self.assertNotEqual(versioning.get_data_version(('users',))[0],
+                            users)
+        self.assertEqual(versioning.get_data_version(('authorities',))[0],
+                         authorities)
+        portal_models.DaoAuthority.grant(
+            [('alice@example.com', 'cbioportal:STUDY_B')])
+        self.assertNotEqual(
+            versioning.get_data_version(('authorities',))[0], authorities)
@@ -0,0 +1,162 @@
+from django import forms as django_forms
+from django.core.urlresolvers import reverse
+
+from .base import PortalTestCase
+from .. import forms
+
+
+class UserViewsTest(PortalTestCase):
+
+    url_names = ('user_view', 'user_update', 'user_authorities',
+                 'user_delete')
+
+    def setUp(self):
+        super().setUp()
+        self.login()
+
+    def test_existing_user(self):
+        for url_name in self.url_names:
+            with self.subTest(url_name=url_name):
+                response = self.client.get(
+                    reverse(url_name, kwargs={'email': 'alice@example.com'}))
+                self.assertEqual(response.status_code, 200)
+                self.assertEqual(response.context['user'].email,
+                                 'alice@example.com')
+
+    def test_update_form_initial(self):
+        response = self.client.get(
+            reverse('user_update', kwargs={'email': 'carol@example.com'}))
+        self.assertEqual(response.context['form'].initial['name'], 'Carol')
+        self.assertFalse(response.context['form'].initial['enabled'])
+
+    def test_missing_user(self):
+        for url_name in self.url_names:
+            url = reverse(url_name, kwargs={'email': 'nobody@example.com'})
+            for method in ('get', 'post'):
+                if url_name == 'user_view' and method == 'post':
+                    continue
+                with self.subTest(url_name=url_name, method=method):
+                    response = getattr(self.client, method)(url)
+                    self.assertEqual(response.status_code, 404)
+        self.assertEqual(len(self.user_rows()), 3)
+
+    def test_writes_do_not_look_up_the_user_first(self):
+        with self.assertNumQueries(1, using='cbioportal'):
+            response = self.client.post(
+                reverse('user_update', kwargs={'email': 'bob@example.com'}),
+                {'name': 'Robert', 'enabled': 'on'})
+        self.assertEqual(response.status_code, 302)
+        with self.assertNumQueries(1, using='cbioportal'):
+            response = self.client.post(
+                reverse('user_delete', kwargs={'email': 'bob@example.com'}))
+        self.assertEqual(response.status_code, 302)
+        self.assertEqual([row[0] for row in self.user_rows()],
+                         ['alice@example.com', 'carol@example.com'])
+
+    def test_invalid_form(self):
+        response = self.client.post(
+            reverse('user_update', kwargs={'email': 'bob@example.com'}),
+            {'name': ''})
+        self.assertEqual(response.status_code, 200)
+        self.assertIn('name', response.context['form'].errors)
+        self.assertEqual(response.context['user'].name, 'Bob')
+
+    def test_create_existing_user(self):
+        response = self.client.post(reverse('user_create'), {
+            'email': 'alice@example.com', 'name': 'Other', 'enabled': 'on'})
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.context['form'].errors['email'],
+                         ['User already exists!'])
+        self.assertIn(('alice@example.com', 'Alice', 1), self.user_rows())
+
+    def test_missing_user_requires_login(self):
+        self.client.logout()
+        response = self.client.get(
+            reverse('user_update', kwargs={'email': 'nobody@example.com'}))
+        self.assertEqual(response.status_code, 302)
+
+
+class StudyAndGroupViewsTest(PortalTestCase):
+
+    def setUp(self):
+        super().setUp()
+        self.login()
+
+    def test_existing(self):
+        for url_name, kwargs in (
+                ('study_view', {'identifier': 'study_a'}),
+                ('study_users', {'identifier': 'STUDY_A'}),
+                ('group_view', {'name': 'group_y'}),
+                ('group_users', {'name': 'GROUP_Y'})):
+            with self.subTest(url_name=url_name):
+                response = self.client.get(reverse(url_name, kwargs=kwargs))
+                self.assertEqual(response.status_code, 200)
+
+    def test_invalid_form(self):
+        for url_name, kwargs in (
+                ('study_users', {'identifier': 'study_a'}),
+                ('group_users', {'name': 'GROUP_Y'})):
+            with self.subTest(url_name=url_name):
+                response = self.client.post(
+                    reverse(url_name, kwargs=kwargs),
+                    {'users': ['nobody@example.com']})
+                self.assertEqual(response.status_code, 200)
+                self.assertIn('users', response.context['form'].errors)
+
+    def test_missing(self):
+        for url_name, kwargs in (
+                ('study_view', {'identifier': 'study_z'}),
+                ('study_users', {'identifier': 'study_z'}),
+                ('group_view', {'name': 'GROUP_Z'}),
+                ('group_users', {'name': 'GROUP_Z'})):
+            for method in ('get', 'post'):
+                if url_name.endswith('_view') and method == 'post':
+                    continue
+                with self.subTest(url_name=url_name, method=method):
+                    response = getattr(self.client, method)(
+                        reverse(url_name, kwargs=kwargs))
+                    self.assertEqual(response.status_code, 404)
+
+
+class AutocompleteChoiceFieldTest(PortalTestCase):
+
+    def test_authorities_choices(self):
+        self.assertEqual(
+            forms.AuthoritiesChoiceField.get_choices(
+                ['study_b', 'cbioportal:group_x', 'all', 'no_such_study']),
+            [('STUDY_B', 'study_b [study] (Study B)'),
+             ('GROUP_X', 'GROUP_X [group] (1 studies)'),
+             ('ALL', 'ALL [special] -- Access to all studies!')])
+
+    def test_users_choices(self):
+        self.assertEqual(
+            forms.UsersChoiceField.get_choices(
+                ['bob@example.com', 'nobody@example.com']),
+            [('bob@example.com', 'bob@example.com - Bob')])
+
+    def test_validates_with_one_query(self):
+        for field, value in (
+                (forms.UsersChoiceField(),
+                 ['alice@example.com', 'bob@example.com']),
+                (forms.AuthoritiesChoiceField(), ['STUDY_A', 'GROUP_Y'])):
+            with self.subTest(field=type(field).__name__):
+                with self.assertNumQueries(1, using='cbioportal'):
+                    self.assertEqual(field.clean(value), value)
+
+    def test_rejects_unknown_values(self):
+        for field, value in (
+                (forms.UsersChoiceField(),
+                 ['alice@example.com', 'nobody@example.com']),
+                (forms.AuthoritiesChoiceField(), ['STUDY_A', 'NO_STUDY'])):
+            with self.subTest(field=type(field).__name__):
+                with self.assertRaises(django_forms.ValidationError) as cm:
+                    field.clean(value)
+                self.assertEqual(cm.exception.code, 'invalid_choice')
+                self.assertIn(value[1], cm.exception.messages[0])
+
+    def test_required(self):
+        with self.assertRaises(django_forms.ValidationError) as cm:
+            forms.UsersChoiceField().clean([])
+        self.assertEqual(cm.exception.code, 'required')
+        self.assertEqual(forms.UsersChoiceField(required=False).clean([]),
+                         [])
@@ -1,5 +1,6 @@
 from django.conf.urls import url
 
+from . import api
 from . import views
 
 urlpatterns = [
@@ -19,7 +20,19 @@ urlpatterns = [
     url(r'^group/view/(?P<name>.*)/?$', views.GroupView.as_view(), name='group_view'),
     url(r'^group/users/(?P<name>.*)/?$', views.GroupUsers.as_view(), name='group_users'),
 
+    url(r'^access/bulk/?$', views.BulkAccess.as_view(), name='bulk_access'),
+
     url(r'^export/?$', views.Export.as_view(), name='export'),
     url(r'^import/?$', views.Import.as_view(), name='import'),
+    url(r'^import/job/(?P<pk>\d+)/?$', views.ImportJobView.as_view(), name='import_job'),
+
+    url(r'^api/users/?$', api.UserBatch.as_view(), name='api_users'),
+    url(r'^api/authorities/?$', api.AuthorityBatch.as_view(), name='api_authorities'),
+    url(r'^api/access/check/?$', api.AccessCheck.as_view(), name='api_access_check'),
+    url(r'^api/search/users/?$', api.UserSearch.as_view(), name='api_search_users'),
+    url(r'^api/search/authorities/?$', api.AuthoritySearch.as_view(), name='api_search_authorities'),
+    url(r'^api/import/job/(?P<pk>\d+)/?$', api.ImportJobStatus.as_view(), name='api_import_job'),
+    url(r'^api/pool/stats/?$', api.PoolStats.as_view(), name='api_pool_stats'),
+    url(r'^metrics/?$', api.Metrics.as_view(), name='metrics'),
 ]
 
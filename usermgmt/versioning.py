@@ -0,0 +1,117 @@
+"""Data versions for conditional GET and fragment caching
+
+Each kind of portal data in ``DATA_KINDS`` has a DataVersion counter in the
+``default`` database.  The counters of users and authorities are
+incremented by the receivers below after each write through DaoUser and
+DaoAuthority.  Studies are not written by this app; the counter of studies
+is incremented when a load of the study catalog yields a different
+fingerprint than the previous one, so external changes are picked up
+within ``settings.CBIOPORTAL_CATALOG_TTL`` seconds.
+
+ConditionalGetMixin uses the counters to answer ``If-None-Match`` and
+``If-Modified-Since`` with 304 before the page queries run, and puts them
+into the context as ``data_version`` for ``{% cache %}`` fragments, along
+with their lifetime ``fragment_cache_ttl``.
+"""
+
+from django.conf import settings
+from django.db.models import F
+from django.dispatch import receiver
+from django.utils import timezone
+from django.views.decorators.http import condition
+
+from . import models
+from . import portal_models
+from . import signals
+
+import hashlib
+
+#: Kinds of data with a version
+DATA_KINDS = ('users', 'authorities', 'studies')
+
+
+def bump(name):
+    """Increment the version of the data kind ``name``"""
+    updated = models.DataVersion.objects.filter(name=name).update(
+        version=F('version') + 1, modified=timezone.now())
+    if not updated:
+        models.DataVersion.objects.get_or_create(
+            name=name, defaults={'version': 1})
+
+
+def get_data_version(names=DATA_KINDS):
+    """Return version token and last modification time of the data kinds
+    ``names``
+
+    The token changes whenever one of the versions changes.  The study
+    catalog is loaded (if stale) first, so changes to the studies are
+    detected.
+    """
+    if 'studies' in names:
+        portal_models.DaoStudyCatalog.get()
+    versions = {v.name: v for v in
+                models.DataVersion.objects.filter(name__in=names)}
+    token = '-'.join(
+        '{}.{}'.format(name, versions[name].version if name in versions else 0)
+        for name in names)
+    modified = max((v.modified for v in versions.values()), default=None)
+    return token, modified
+
+
+@receiver(signals.users_changed)
+def bump_users(sender, **kwargs):
+    bump('users')
+
+
+@receiver(signals.authorities_changed)
+def bump_authorities(sender, **kwargs):
+    bump('authorities')
+
+
+@receiver(signals.catalog_loaded)
+def bump_studies(sender, catalog, **kwargs):
+    updated = models.DataVersion.objects.filter(name='studies').exclude(
+        fingerprint=catalog.fingerprint).update(
+            version=F('version') + 1, fingerprint=catalog.fingerprint,
+            modified=timezone.now())
+    if not updated:
+        models.DataVersion.objects.get_or_create(
+            name='studies', defaults={'version': 1,
+                                      'fingerprint': catalog.fingerprint})
+
+
+class ConditionalGetMixin:
+    """Answer GET requests with 304 if the data shown did not change
+
+    Put it after LoginRequiredMixin.  The ETag covers the versions of
+    ``data_kinds``, the URL with query string, the user and the CSRF token
+    embedded in forms.
+    """
+
+    #: Kinds of data that the page shows, see DATA_KINDS
+    data_kinds = DATA_KINDS
+
+    def dispatch(self, request, *args, **kwargs):
+        if request.method not in ('GET', 'HEAD'):
+            return super().dispatch(request, *args, **kwargs)
+        self.data_version, self.data_modified = get_data_version(
+            self.data_kinds)
+        return condition(
+            etag_func=lambda request, *args, **kwargs: self.get_etag(),
+            last_modified_func=(
+                lambda request, *args, **kwargs: self.data_modified))(
+                    super().dispatch)(request, *args, **kwargs)
+
+    def get_etag(self):
+        return hashlib.sha1('\n'.join((
+            self.data_version,
+            self.request.get_full_path(),
+            str(self.request.user.pk),
+            self.request.META.get('CSRF_COOKIE', ''),
+        )).encode('utf-8')).hexdigest()
+
+    def get_context_data(self, **kwargs):
+        context = super().get_context_data(**kwargs)
+        context['data_version'] = getattr(self, 'data_version', None)
+        context['fragment_cache_ttl'] = settings.CBIOPORTAL_FRAGMENT_CACHE_TTL
+        return context
@@ -1,11 +1,19 @@
+from django.contrib import messages
 from django.contrib.auth.mixins import LoginRequiredMixin
-from django.http import HttpResponse
-from django.shortcuts import render, redirect
+from django.http import (
+    Http404, HttpResponse, HttpResponseBadRequest, StreamingHttpResponse)
+from django.shortcuts import get_object_or_404, render, redirect
+from django.utils.functional import SimpleLazyObject
 from django.views.generic import TemplateView, View
 from django.views.generic.edit import FormView
 
+from . import concurrency
+from . import jobs
+from . import journal
+from . import models
 from . import portal_models
 from . import forms
+from .versioning import ConditionalGetMixin
 
 import datetime
 
@@ -16,12 +24,28 @@ class Index(LoginRequiredMixin, TemplateView):
 
     def get_context_data(self, *args, **kwargs):
         context = super().get_context_data(**kwargs)
-        context['num_users'] = portal_models.DaoUser.num_users()
-        context['num_studies'] = portal_models.DaoStudy.num_studies()
-        context['num_study_groups'] = portal_models.DaoStudyGroup.num_groups()
+        context['statistics'] = portal_models.DaoStatistics.get()
         return context
 
 
+class PortalUserMixin:
+    """Look up the portal user of the ``email`` URL argument for rendering,
+    answer 404 if there is no such user
+
+    Writes raise NotFound themselves, so POST requests do not look the user
+    up first.
+    """
+
+    def get_portal_user(self):
+        if not hasattr(self, '_portal_user'):
+            try:
+                self._portal_user = portal_models.DaoUser.get_user(
+                    self.kwargs['email'])
+            except portal_models.NotFound as e:
+                raise Http404(str(e))
+        return self._portal_user
+
+
 class UserCreate(LoginRequiredMixin, FormView, TemplateView):
     """Handle creation of users"""
     template_name = 'usermgmt/user_create.html'
@@ -32,122 +56,159 @@ class UserCreate(LoginRequiredMixin, FormView, TemplateView):
 
     def form_valid(self, form):
         email = form.cleaned_data['email']
-        # TODO(holtgrewe): add this into a transaction, otherwise we can get duplicate users!
-        if portal_models.DaoUser.user_exists(email):
-            raise Exception('User already exists!')
-        portal_models.DaoUser.create_user(
-            form.cleaned_data['email'],
-            form.cleaned_data['name'],
-            form.cleaned_data['enabled'])
+        try:
+            portal_models.DaoUser.create_user(
+                form.cleaned_data['email'],
+                form.cleaned_data['name'],
+                form.cleaned_data['enabled'])
+        except portal_models.AlreadyExists as e:
+            form.add_error('email', str(e))
+            return self.form_invalid(form)
         return redirect('user_view', email=email)
 
 
-class UserStudyAccess(LoginRequiredMixin, FormView, TemplateView):
+class UserStudyAccess(LoginRequiredMixin, PortalUserMixin, FormView,
+                      TemplateView):
     """Handle study access assignment"""
     template_name = 'usermgmt/user_access.html'
     form_class = forms.UserAccessForm
 
     def get_initial(self):
+        # Bound forms do not show the initial values, skip the lookup
+        if self.request.method not in ('GET', 'HEAD'):
+            return {}
         return {'authorities': [
             a.authority for a in portal_models.DaoAuthority.for_user(
                 self.kwargs['email'])]}
 
-    def get_context_data(self, email, *args, **kwargs):
+    def get_context_data(self, *args, **kwargs):
         context = super().get_context_data(**kwargs)
-        context['user'] = portal_models.DaoUser.get_user(email)
+        context['user'] = self.get_portal_user()
         return context
 
     def form_valid(self, form):
         email = self.kwargs['email']
-        # TODO(holtgrewe): add this into a transaction
-        if not portal_models.DaoUser.user_exists(email):
-            raise Exception('No such user found!')
-        portal_models.DaoAuthority.update_authorities_for_user(
-            email,
-            form.cleaned_data['authorities'])
+        try:
+            portal_models.DaoAuthority.update_authorities_for_user(
+                email,
+                form.cleaned_data['authorities'])
+        except portal_models.NotFound as e:
+            raise Http404(str(e))
         return redirect('user_view', email=email)
 
 
-class UserUpdate(LoginRequiredMixin, FormView, TemplateView):
+class UserUpdate(LoginRequiredMixin, PortalUserMixin, FormView,
+                 TemplateView):
     """Handle update of users"""
     template_name = 'usermgmt/user_update.html'
     form_class = forms.UpdateUserForm
 
     def get_initial(self):
-        return portal_models.DaoUser.get_user(self.kwargs.get('email')).to_dict()
+        # Bound forms do not show the initial values, skip the lookup
+        if self.request.method not in ('GET', 'HEAD'):
+            return {}
+        return self.get_portal_user().to_dict()
 
-    def get_context_data(self, email, *args, **kwargs):
+    def get_context_data(self, *args, **kwargs):
         context = super().get_context_data(**kwargs)
-        context['user'] = portal_models.DaoUser.get_user(email)
+        context['user'] = self.get_portal_user()
         return context
 
     def form_valid(self, form):
         email = self.kwargs['email']
-        # TODO(holtgrewe): add this into a transaction
-        if not portal_models.DaoUser.user_exists(email):
-            raise Exception('No such user found!')
-        portal_models.DaoUser.update_user(
-            email,
-            form.cleaned_data['name'],
-            form.cleaned_data['enabled'])
+        try:
+            portal_models.DaoUser.update_user(
+                email,
+                form.cleaned_data['name'],
+                form.cleaned_data['enabled'])
+        except portal_models.NotFound as e:
+            raise Http404(str(e))
         return redirect('user_view', email=email)
 
 
-class UserList(TemplateView):
+class UserList(LoginRequiredMixin, ConditionalGetMixin, TemplateView):
     template_name = 'usermgmt/user_list.html'
+    data_kinds = ('users',)
+    paginate_by = 50
 
     def get_context_data(self, *args, **kwargs):
         context = super().get_context_data(**kwargs)
-        context['users'] = portal_models.DaoUser.all_users()
+        context['query'] = self.request.GET.get('q', '').strip()
+        context['after'] = self.request.GET.get('after', '')
+        context['before'] = self.request.GET.get('before', '')
+        # Only queried if the table is not in the fragment cache
+        context['users'] = SimpleLazyObject(
+            lambda: portal_models.DaoUser.page_users(
+                self.paginate_by,
+                after=context['after'] or None,
+                before=context['before'] or None,
+                query=context['query']))
         return context
 
 
-class UserView(LoginRequiredMixin, TemplateView):
+class UserView(LoginRequiredMixin, ConditionalGetMixin, TemplateView):
     template_name = 'usermgmt/user_view.html'
 
     def get_context_data(self, email, *args, **kwargs):
         context = super().get_context_data(**kwargs)
-        context['user'] = portal_models.DaoUser.get_user(email)
-        context['authorities'] = portal_models.DaoAuthority.for_user(email)
+        try:
+            context['user'], context['authorities'] = concurrency.fan_out(
+                lambda: portal_models.DaoUser.get_user(email),
+                lambda: portal_models.DaoAuthority.for_user(email))
+        except portal_models.NotFound as e:
+            raise Http404(str(e))
         return context
 
 
-class UserDelete(LoginRequiredMixin, TemplateView):
+class UserDelete(LoginRequiredMixin, PortalUserMixin, TemplateView):
     template_name = 'usermgmt/user_delete.html'
 
-    def get_context_data(self, email, *args, **kwargs):
+    def get_context_data(self, *args, **kwargs):
         context = super().get_context_data(**kwargs)
-        context['user'] = portal_models.DaoUser.get_user(email)
+        context['user'] = self.get_portal_user()
         return context
 
     def post(self, request, *args, **kwargs):
-        portal_models.DaoUser.delete_user(self.kwargs['email'])
+        try:
+            portal_models.DaoUser.delete_user(self.kwargs['email'])
+        except portal_models.NotFound as e:
+            raise Http404(str(e))
         return redirect('user_list')
 
 
-class StudyList(LoginRequiredMixin, TemplateView):
+class StudyList(LoginRequiredMixin, ConditionalGetMixin, TemplateView):
     template_name = 'usermgmt/study_list.html'
+    data_kinds = ('studies',)
 
     def get_context_data(self, *args, **kwargs):
         context = super().get_context_data(**kwargs)
-        context['studies'] = portal_models.DaoStudy.all_studies()
+        context['studies'] = SimpleLazyObject(
+            portal_models.DaoStudy.all_studies)
         return context
 
+    def post(self, request, *args, **kwargs):
+        portal_models.DaoStudyCatalog.refresh()
+        return redirect('study_list')
+
 
-class StudyView(LoginRequiredMixin, TemplateView):
+class StudyView(LoginRequiredMixin, ConditionalGetMixin, TemplateView):
     template_name = 'usermgmt/study_view.html'
 
     def get_context_data(self, identifier, *args, **kwargs):
         context = super().get_context_data(**kwargs)
-        study = portal_models.DaoStudy.get(identifier)
+        try:
+            study = portal_models.DaoStudy.get(identifier)
+        except portal_models.NotFound as e:
+            raise Http404(str(e))
         context['study'] = study
-        context['direct_users'] = portal_models.DaoUser.with_direct_access_to(identifier)
-        context['all_users'] = portal_models.DaoUser.with_direct_access_to('ALL')
+        users = portal_models.DaoUser.with_direct_access_to_many(
+            [identifier, 'ALL'] + study.groups)
+        context['direct_users'] = users[identifier]
+        context['all_users'] = users['ALL']
         context['num_group_users'] = 0
         context['group_users'] = []
         for group in study.groups:
-            context['group_users'].append(
-                (group, portal_models.DaoUser.with_direct_access_to(group)))
+            context['group_users'].append((group, users[group]))
             context['num_group_users'] += len(context['group_users'][-1][-1])
         return context
 
@@ -162,39 +223,48 @@ class StudyUsers(LoginRequiredMixin, FormView, TemplateView):
             u.email for u in portal_models.DaoUser.with_direct_access_to(
                 self.kwargs['identifier'])]}
 
-    def get_context_data(self, identifier, *args, **kwargs):
+    def get_context_data(self, *args, **kwargs):
         context = super().get_context_data(**kwargs)
-        context['study'] = portal_models.DaoStudy.get(identifier)
+        try:
+            context['study'] = portal_models.DaoStudy.get(
+                self.kwargs['identifier'])
+        except portal_models.NotFound as e:
+            raise Http404(str(e))
         return context
 
     def form_valid(self, form):
         identifier = self.kwargs['identifier']
-        # TODO(holtgrewe): add this into a transaction
-        if not portal_models.DaoStudy.exists(identifier):
-            raise Exception('No such study found!')
-        portal_models.DaoAuthority.update_authorities_for_study(
-            identifier,
-            form.cleaned_data['users'])
+        try:
+            portal_models.DaoAuthority.update_authorities_for_study(
+                identifier,
+                form.cleaned_data['users'])
+        except portal_models.NotFound as e:
+            raise Http404(str(e))
         return redirect('study_view', identifier=identifier)
 
 
-class GroupList(LoginRequiredMixin, TemplateView):
+class GroupList(LoginRequiredMixin, ConditionalGetMixin, TemplateView):
     template_name = 'usermgmt/group_list.html'
+    data_kinds = ('studies',)
 
     def get_context_data(self, *args, **kwargs):
         context = super().get_context_data(**kwargs)
-        context['groups'] = portal_models.DaoStudyGroup.all_groups()
+        context['groups'] = SimpleLazyObject(
+            lambda: sorted(portal_models.DaoStudyGroup.all_groups()))
         return context
 
 
-class GroupView(LoginRequiredMixin, TemplateView):
+class GroupView(LoginRequiredMixin, ConditionalGetMixin, TemplateView):
     template_name = 'usermgmt/group_view.html'
 
     def get_context_data(self, name, *args, **kwargs):
         context = super().get_context_data(**kwargs)
-        group = portal_models.DaoStudyGroup.get(name)
-        context['group'] = group
-        context['direct_users'] = portal_models.DaoUser.with_direct_access_to(name)
+        try:
+            context['group'] = portal_models.DaoStudyGroup.get(name)
+        except portal_models.NotFound as e:
+            raise Http404(str(e))
+        context['direct_users'] = (
+            portal_models.DaoUser.with_direct_access_to_many([name])[name])
         return context
 
 
@@ -209,85 +279,114 @@ class GroupUsers(LoginRequiredMixin, FormView, TemplateView):
             u.email for u in portal_models.DaoUser.with_direct_access_to(
                 self.kwargs['name'])]}
 
-    def get_context_data(self, name, *args, **kwargs):
+    def get_context_data(self, *args, **kwargs):
         context = super().get_context_data(**kwargs)
-        context['group'] = portal_models.DaoStudyGroup.get(name)
+        try:
+            context['group'] = portal_models.DaoStudyGroup.get(
+                self.kwargs['name'])
+        except portal_models.NotFound as e:
+            raise Http404(str(e))
         return context
 
     def form_valid(self, form):
         name = self.kwargs['name']
-        # TODO(holtgrewe): add this into a transaction
-        if not portal_models.DaoStudyGroup.exists(name):
-            raise Exception('No such group found!')
-        portal_models.DaoAuthority.update_authorities_for_group(
-            name,
-            form.cleaned_data['users'])
+        try:
+            portal_models.DaoAuthority.update_authorities_for_group(
+                name,
+                form.cleaned_data['users'])
+        except portal_models.NotFound as e:
+            raise Http404(str(e))
         return redirect('group_view', name=name)
 
 
-class Export(LoginRequiredMixin, View):
+class BulkAccess(LoginRequiredMixin, FormView, TemplateView):
+    """Grant or revoke access for many users to many studies and groups
 
-    def get(self, *args, **kwargs):
-        result = ['users:']
-        for user in portal_models.DaoUser.all_users():
-            result += [
-                '- email: {}'.format(repr(user.email)),
-                '  name: {}'.format(repr(user.name)),
-                '  enabled: {}'.format(int(user.enabled)),
-            ]
-        result += ['', 'authorities:']
-        for authority in portal_models.DaoAuthority.all_authorities():
-            result += [
-                '- email: {}'.format(repr(authority.email)),
-                '  authority: {}'.format(repr(authority.authority)),
-            ]
-        response = HttpResponse('\n'.join(result), content_type='text/plain')
-        fname = datetime.datetime.now().strftime('%Y-%m-%d_%H-%m-%s_cbioportal_users.yaml')
-        res['Content-Disposition'] = 'inline; filename={}'.format(fname)
-        return response
+    Submitting the form shows the number of affected rows; submitting it
+    with the ``apply`` button writes the changes.
+    """
+    template_name = 'usermgmt/bulk_access.html'
+    form_class = forms.BulkAccessForm
 
+    def form_valid(self, form):
+        emails = form.cleaned_data['users']
+        identifiers = form.cleaned_data['authorities']
+        if 'apply' not in self.request.POST:
+            return self.render_to_response(self.get_context_data(
+                form=form, preview=portal_models.DaoAuthority.preview_bulk(
+                    emails, identifiers)))
+        if form.cleaned_data['action'] == 'grant':
+            pairs = portal_models.DaoAuthority.grant_bulk(emails, identifiers)
+            messages.success(
+                self.request, 'Granted {} authorities'.format(len(pairs)))
+        else:
+            pairs = portal_models.DaoAuthority.revoke_bulk(emails, identifiers)
+            messages.success(
+                self.request, 'Revoked {} authorities'.format(len(pairs)))
+        return redirect('bulk_access')
 
-class Export(LoginRequiredMixin, TemplateView):
-    template_name = 'usermgmt/import.html'
 
-    def get(self, *args, **kwargs):
-        result = ['users:']
-        for user in portal_models.DaoUser.all_users():
-            result += [
-                '- email: {}'.format(repr(user.email)),
-                '  name: {}'.format(repr(user.name)),
-                '  enabled: {}'.format(int(user.enabled)),
-            ]
-        result += ['', 'authorities:']
-        for authority in portal_models.DaoAuthority.all_authorities():
-            result += [
-                '- email: {}'.format(repr(authority.email)),
-                '  authority: {}'.format(repr(authority.authority)),
-            ]
-        response = HttpResponse('\n'.join(result), content_type='text/plain')
+class Export(LoginRequiredMixin, View):
+    """Export all users and authorities, or with ``?since=<version>`` only
+    the changes after the given version"""
+
+    def get(self, request, *args, **kwargs):
+        since = request.GET.get('since')
+        if since is None:
+            content = portal_models.export_to_yaml(
+                version=journal.current_version())
+        else:
+            try:
+                content = journal.export_changes_to_yaml(int(since))
+            except ValueError:
+                return HttpResponseBadRequest(
+                    'since must be a version number', content_type='text/plain')
+            except journal.ChangesUnavailable as e:
+                return HttpResponse(
+                    '{}, download a full export'.format(e), status=410,
+                    content_type='text/plain')
+        response = StreamingHttpResponse(content, content_type='text/plain')
         fname = datetime.datetime.now().strftime('%Y-%m-%d_%H-%m-%s_cbioportal_users.yaml')
+        if since is not None:
+            fname = fname.replace('.yaml', '_since_{}.yaml'.format(int(since)))
         response['Content-Disposition'] = 'attachment; filename={}'.format(fname)
         return response
 
 
 class Import(LoginRequiredMixin, TemplateView):
+    """Upload a YAML document and submit it as background import job, list
+    the recent jobs"""
+
     template_name = 'usermgmt/import.html'
 
+    #: Number of recent jobs shown
+    num_recent_jobs = 10
+
     def get_context_data(self, *args, **kwargs):
         context = super().get_context_data(**kwargs)
-        context['form'] = forms.ImportForm()
+        context.setdefault('form', forms.ImportForm())
+        context['jobs'] = models.ImportJob.objects.order_by(
+            '-created')[:self.num_recent_jobs]
         return context
 
     def post(self, request, *args, **kwargs):
         form = forms.ImportForm(request.POST, request.FILES)
         if not form.is_valid():
             return self.render_to_response(
-                self.get_context_data(*args, **kwargs))
-        try:
-            portal_models.import_from_yaml(request.FILES['file'].read())
-        except Exception as e:
-            print(e) # XXX
-            context = self.get_context_data(*args, **kwargs)
-            context['form'].add_error('file', 'Invalid YAML!')
-            return self.render_to_response(context)
-        return redirect('index')
+                self.get_context_data(form=form, **kwargs))
+        job = jobs.submit_import(
+            request.FILES['file'], form.cleaned_data['mode'],
+            dry_run=form.cleaned_data['dry_run'], user=request.user)
+        return redirect('import_job', pk=job.pk)
+
+
+class ImportJobView(LoginRequiredMixin, TemplateView):
+    """Show the progress and result of an import job; the page polls the
+    ``api_import_job`` endpoint until the job has finished"""
+
+    template_name = 'usermgmt/import_job.html'
+
+    def get_context_data(self, *args, **kwargs):
+        context = super().get_context_data(**kwargs)
+        context['job'] = get_object_or_404(models.ImportJob, pk=kwargs['pk'])
+        return context